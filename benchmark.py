@@ -0,0 +1,35 @@
+import argparse
+import json
+import shutil
+import tempfile
+from utils.benchmark import graph_families, build_benchmark_cases, run_benchmarks, compare_benchmarks
+
+def main():
+
+	# Parse arguments
+	parser = argparse.ArgumentParser(description = "Time graph load, adjacency build, simulation steps and measurements over graph sizes and families.")
+	parser.add_argument("--output", "-o", type=str, help="path/to/benchmark.json", default = "benchmark.json")
+	parser.add_argument("--work-dir", type=str, help="directory of the generated graphs and outputs, kept after the run. Default: a temporary directory, removed at the end", default = None)
+	parser.add_argument("--sizes", type=float, nargs="+", help="numbers of nodes, e.g. 1e3 1e5 1e7", default = [1e3, 1e4, 1e5, 1e6])
+	parser.add_argument("--families", type=str, nargs="+", choices = list(graph_families), help="graph families", default = list(graph_families))
+	parser.add_argument("--engines", type=str, nargs="+", help="simulation engines", default = ['discrete', 'frontier'])
+	parser.add_argument("--threads", type=int, nargs="+", help="numbers of threads of the discrete engine", default = [1])
+	parser.add_argument("--steps", type=int, help="time steps of the simulation and measurement benchmarks", default = 10)
+	parser.add_argument("--compare", type=str, nargs=2, metavar=("BASE", "NEW"), help="compare two benchmark reports instead of running", default = None)
+	args = parser.parse_args()
+
+	if args.compare is not None:
+		with open(args.compare[0]) as base_file, open(args.compare[1]) as new_file:
+			comparison_df = compare_benchmarks(json.load(base_file), json.load(new_file))
+		print(comparison_df.to_string(index = False))
+		return
+
+	cases = build_benchmark_cases([int(V) for V in args.sizes], args.families, args.engines, steps = args.steps, threads = args.threads)
+	work_dir = tempfile.mkdtemp(prefix = 'benchmark_') if args.work_dir is None else args.work_dir
+	try:
+		run_benchmarks(cases, work_dir, args.output)
+	finally:
+		if args.work_dir is None: shutil.rmtree(work_dir, ignore_errors = True)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from utils.infection import adjacency_from_edges, initialize_simulation_from_adjacency
+
+sir_attributes = {'compartment': ['susceptible', 'infected', 'removed']}
+sir_dynamics = {'infection': {'name': 'infection', 'attribute': 'compartment', 'initial_state': 'susceptible', 'triggering_state': 'infected',
+                              'final_state': 'infected', 'prob': 0.05, 'mode': 'neighbor'},
+                'recovery': {'name': 'recovery', 'attribute': 'compartment', 'initial_state': 'infected', 'triggering_state': None,
+                             'final_state': 'removed', 'prob': 0.2, 'mode': 'rate'}}
+sir_initial_conditions = {'compartment': {'susceptible': 0.99, 'infected': 0.01, 'removed': 0.0}}
+
+def er_adjacency(V = 2000, mean_degree = 6, seed = 0):
+    rng = np.random.default_rng(seed)
+    E = V * mean_degree // 2
+    return adjacency_from_edges(rng.integers(0, V, E), rng.integers(0, V, E), V, False)
+
+@pytest.fixture
+def sir():
+    """
+    SIR model on an Erdos-Renyi graph of 2000 nodes: compartments, adjacency and initial state.
+    """
+    return initialize_simulation_from_adjacency(er_adjacency(), sir_attributes, sir_dynamics, sir_initial_conditions, 1)
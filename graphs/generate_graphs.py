@@ -2,34 +2,274 @@ import numpy as np
 import igraph as ig
 import argparse
 import re
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# Make the utils package importable when the script is run from any directory
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.infection import adjacency_from_edges
+from utils.graph_cache import save_adjacency, adjacency_store_extension
+
+# Expected number of edges sampled by each chunk of the pair space
+edges_per_chunk = 1_000_000
 
 def parse_function_string(func_str):
     # Use regular expression to extract function name and arguments
     match = re.match(r'([a-zA-Z_]\w*)\((.*)\)', func_str)
-    
+
     if match:
         function_name = match.group(1)
         arguments_str = match.group(2)
-        
-        # Split the arguments string into a list
-        arguments = [float(arg.strip()) for arg in arguments_str.split(',') if arg.strip()]
-        
+
+        # Split the arguments string into a list. Quoted arguments are strings, e.g. paths
+        arguments = [arg.strip().strip('\'"') if arg.strip()[0] in '\'"' else float(arg.strip())
+                     for arg in arguments_str.split(',') if arg.strip()]
+
         return function_name, arguments
     else:
         raise ValueError(f"Invalid function string: {func_str}")
 
+def sample_bernoulli_positions(first, last, p, rng):
+    """
+    Positions of the successes among independent Bernoulli(p) trials at positions first, ..., last - 1.
+    Gaps between successes are geometric, so the cost is O(number of successes) instead of O(last - first).
+    """
+    if p <= 0 or last <= first:
+        return np.empty(0, dtype = np.int64)
+    if p >= 1:
+        return np.arange(first, last, dtype = np.int64)
+    positions = []
+    current = first - 1
+    while True:
+        # Draw a block of gaps slightly larger than the expected number of remaining successes
+        block_size = int((last - current) * p + 5 * np.sqrt((last - current) * p) + 16)
+        block = current + np.cumsum(rng.geometric(p, size = block_size))
+        inside = block[block < last]
+        positions.append(inside)
+        if len(inside) < block_size:
+            break
+        current = block[-1]
+    return np.concatenate(positions)
+
+def triangle_pairs(k: np.ndarray):
+    """
+    Pairs (i, j) with j < i of the linear indices k = i (i - 1) / 2 + j.
+    """
+    i = np.floor((1 + np.sqrt(1 + 8 * k.astype(np.float64))) / 2).astype(np.int64)
+    # Fix the rounding errors of the square root
+    i -= (i * (i - 1) // 2 > k)
+    i += ((i + 1) * i // 2 <= k)
+    return i, k - i * (i - 1) // 2
+
+def _sample_block_pairs(task):
+    """
+    Sample the edges of one chunk of the pair space between two blocks of nodes.
+    Pairs inside a block (triangle) are indexed by k = i (i - 1) / 2 + j with j < i,
+    pairs between two blocks (rectangle) by k = i * size_b + j.
+    """
+    kind, offset_a, offset_b, size_b, first, last, p, seed_sequence = task
+    rng = np.random.default_rng(seed_sequence)
+    k = sample_bernoulli_positions(first, last, p, rng)
+    if kind == 'triangle':
+        i, j = triangle_pairs(k)
+    else:
+        i, j = np.divmod(k, size_b)
+    return i + offset_a, j + offset_b
+
+def _sample_blocks(blocks, seed = None, workers = 1):
+    """
+    Sample the edges of a graph made of independent Bernoulli pairs.
+
+    Parameters:
+        - blocks: list of (kind, offset_a, offset_b, size_a, size_b, p), see _sample_block_pairs
+        - seed: seed of the random number generator
+        - workers: number of processes sampling the chunks
+    Returns:
+        sources, targets
+    """
+    tasks = []
+    for kind, offset_a, offset_b, size_a, size_b, p in blocks:
+        total = size_a * (size_a - 1) // 2 if kind == 'triangle' else size_a * size_b
+        n_chunks = max(1, int(np.ceil(total * p / edges_per_chunk)))
+        bounds = np.linspace(0, total, n_chunks + 1).astype(np.int64)
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            tasks.append([kind, offset_a, offset_b, size_b, int(first), int(last), p])
+    # Independent random streams for every chunk. Chunks do not depend on the number of workers, and neither does the graph
+    for task, seed_sequence in zip(tasks, np.random.SeedSequence(seed).spawn(len(tasks))):
+        task.append(seed_sequence)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            edges = list(executor.map(_sample_block_pairs, tasks))
+    else:
+        edges = [_sample_block_pairs(task) for task in tasks]
+    return np.concatenate([s for s, _ in edges]), np.concatenate([t for _, t in edges])
 
-def ER(*args):
+def ER(*args, seed = None, workers = 1):
+    """
+    Erdos-Renyi G(N, p), sampled as GNP with its own generator: the global random state is left untouched.
+    """
+    return GNP(*args, seed = seed, workers = workers)
+
+def GNP(*args, seed = None, workers = 1):
+    """
+    Erdos-Renyi G(N, p) by geometric skipping: O(N + E).
+    """
     N = int(args[0])
     p = args[1]
-    return ig.Graph.Erdos_Renyi(n = N, p = p)
+    sources, targets = _sample_blocks([('triangle', 0, 0, N, N, p)], seed, workers)
+    return sources, targets, N, {}
 
+def GNM(*args, seed = None, workers = 1):
+    """
+    Erdos-Renyi G(N, M): M distinct pairs drawn uniformly.
+    """
+    N = int(args[0])
+    M = int(args[1])
+    total = N * (N - 1) // 2
+    if M > total:
+        raise ValueError(f"G(N, M) with N = {N} has at most {total} edges. Got M = {M}")
+    rng = np.random.default_rng(seed)
+    k = np.empty(0, dtype = np.int64)
+    while len(k) < M:
+        k = np.unique(np.concatenate([k, rng.integers(0, total, size = M - len(k))]))
+    i, j = triangle_pairs(k)
+    return i, j, N, {}
 
+def BA(*args, seed = None, workers = 1):
+    """
+    Barabasi-Albert graph with N nodes, each new node attached to m existing nodes.
+    Batagelj-Brandes sampling: the target of edge e is the endpoint at a uniform position among the 2e
+    endpoints of the previous edges, which is resolved for all the edges at once by pointer jumping.
+    Self-loops are dropped, multi-edges are kept.
+    """
+    N = int(args[0])
+    m = int(args[1])
+    rng = np.random.default_rng(seed)
+    E = (N - 1) * m
+    e = np.arange(E, dtype = np.int64)
+    sources = e // m + 1
+    # Even positions 2e are sources, odd positions 2e + 1 targets. Edges of node 1 can only point to node 0
+    positions = np.zeros(E, dtype = np.int64)
+    positions[m:] = (rng.random(E - m) * 2 * e[m:]).astype(np.int64)
+    resolved = positions.copy()
+    # Follow the targets of the targets until reaching a source or one of the first m edges
+    is_pending = lambda r: (r % 2 == 1) & (r // 2 >= m)
+    pending = np.flatnonzero(is_pending(resolved))
+    while len(pending) > 0:
+        resolved[pending] = positions[resolved[pending] // 2]
+        pending = pending[is_pending(resolved[pending])]
+    targets = np.where(resolved % 2 == 0, sources[resolved // 2], 0)
+    targets[:m] = 0
+    loops = sources == targets
+    return sources[~loops], targets[~loops], N, {}
+
+def configuration_model(degrees: np.ndarray, rng):
+    """
+    Pair the stubs of the degree sequence uniformly at random. Self-loops are dropped, multi-edges are kept.
+    """
+    degrees = np.asarray(degrees, dtype = np.int64)
+    stubs = rng.permutation(np.repeat(np.arange(degrees.shape[0]), degrees))
+    if len(stubs) % 2 == 1:
+        stubs = stubs[:-1]
+    sources, targets = stubs[0::2], stubs[1::2]
+    loops = sources == targets
+    return sources[~loops], targets[~loops]
+
+def CM(*args, seed = None, workers = 1):
+    """
+    Configuration model from the degree sequence in a text file, one degree per line.
+    """
+    degrees = np.loadtxt(args[0], dtype = np.int64, ndmin = 1)
+    sources, targets = configuration_model(degrees, np.random.default_rng(seed))
+    return sources, targets, degrees.shape[0], {}
+
+def PL(*args, seed = None, workers = 1):
+    """
+    Configuration model with N nodes and power-law degrees P(k) ~ k^-gamma, k >= kmin.
+    """
+    N = int(args[0])
+    gamma = args[1]
+    kmin = int(args[2])
+    rng = np.random.default_rng(seed)
+    # Discrete power law by inverse transform sampling of the continuous one
+    degrees = np.floor(kmin * (1 - rng.random(N)) ** (-1 / (gamma - 1))).astype(np.int64)
+    degrees = np.minimum(degrees, N - 1)
+    sources, targets = configuration_model(degrees, rng)
+    return sources, targets, N, {}
+
+def WS(*args, seed = None, workers = 1):
+    """
+    Watts-Strogatz graph: ring of N nodes each linked to its k nearest neighbors per side,
+    with the target of every edge rewired to a uniform node with probability p.
+    """
+    N = int(args[0])
+    k = int(args[1])
+    p = args[2]
+    rng = np.random.default_rng(seed)
+    sources = np.tile(np.arange(N, dtype = np.int64), k)
+    targets = (sources + np.repeat(np.arange(1, k + 1), N)) % N
+    rewired = np.flatnonzero(rng.random(len(sources)) < p)
+    targets[rewired] = rng.integers(0, N, size = len(rewired))
+    loops = sources == targets
+    return sources[~loops], targets[~loops], N, {}
+
+def SBM(*args, seed = None, workers = 1):
+    """
+    Stochastic block model with N nodes in B blocks of equal size, probability p_in inside the blocks
+    and p_out between them. Sampled by geometric skipping on each pair of blocks: O(N + E).
+    """
+    N = int(args[0])
+    B = int(args[1])
+    p_in = args[2]
+    p_out = args[3]
+    sizes = np.full(B, N // B, dtype = np.int64)
+    sizes[:N % B] += 1
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    blocks = []
+    for a in range(B):
+        blocks.append(('triangle', int(offsets[a]), int(offsets[a]), int(sizes[a]), int(sizes[a]), p_in))
+        for b in range(a + 1, B):
+            blocks.append(('rectangle', int(offsets[a]), int(offsets[b]), int(sizes[a]), int(sizes[b]), p_out))
+    sources, targets = _sample_blocks(blocks, seed, workers)
+    return sources, targets, N, {'block': np.repeat(np.arange(B), sizes)}
+
+graph_models = {'ER': ER, 'GNP': GNP, 'GNM': GNM, 'BA': BA, 'CM': CM, 'PL': PL, 'WS': WS, 'SBM': SBM}
+
+def save_graph(graph, output_path):
+    """
+    Save an igraph Graph or a (sources, targets, N, node_attributes) edge arrays tuple:
+        - .graphml: GraphML file
+        - .npy: (E, 2) binary edge list
+        - .csr: binary adjacency store, memory-mapped by the simulator
+    """
+    if isinstance(graph, ig.Graph):
+        if output_path.endswith('.graphml'):
+            ig.Graph.write_graphml(graph, output_path)
+            return
+        edges = np.array(graph.get_edgelist(), dtype = np.int64).reshape(-1, 2)
+        graph = edges[:, 0], edges[:, 1], graph.vcount(), {}
+    sources, targets, N, node_attributes = graph
+    if output_path.endswith('.graphml'):
+        G = ig.Graph(n = N, edges = np.column_stack([sources, targets]))
+        for name, values in node_attributes.items():
+            G.vs[name] = values.tolist()
+        ig.Graph.write_graphml(G, output_path)
+    elif output_path.endswith('.npy'):
+        np.save(output_path, np.column_stack([sources, targets]))
+    elif output_path.endswith(adjacency_store_extension):
+        A = adjacency_from_edges(sources, targets, N, directed = False)
+        meta = {'name': os.path.basename(output_path), 'directed': False, 'vcount': N, 'ecount': int(len(sources))}
+        save_adjacency(A, output_path, meta, node_attributes)
+    else:
+        raise TypeError(f"The graph extension is not supported. Choose between .graphml, .npy and {adjacency_store_extension}")
 
 def main():
     parser = argparse.ArgumentParser(description="Generate and save a graph based on a specified function.")
-    parser.add_argument("--function", "-f", type=str, help="Specify the function and its arguments (e.g., ER(20, 0.1))", required=True)
-    parser.add_argument("--output", "-o", type=str, help="Specify the output path for the GraphML file", required=True)
+    parser.add_argument("--function", "-f", type=str, help="Specify the function and its arguments (e.g., ER(20, 0.1), GNP(1e7, 1e-6), BA(1e6, 3), CM('degrees.txt'), PL(1e6, 2.5, 2), WS(1e6, 5, 0.1), SBM(1e6, 10, 1e-4, 1e-6))", required=True)
+    parser.add_argument("--output", "-o", type=str, help=f"Specify the output path: .graphml, .npy edge list or {adjacency_store_extension} binary adjacency", required=True)
+    parser.add_argument("--seed", "-s", type=int, help="Seed of the random number generator", default=None)
+    parser.add_argument("--workers", "-w", type=int, help="Number of processes sampling the graph in parallel chunks", default=1)
 
     args = parser.parse_args()
 
@@ -38,16 +278,13 @@ def main():
     output_path = args.output
     function_name, arguments = parse_function_string(function_str)
 
-    try:
-        selected_function = globals()[function_name]
-    except:
-        print(f"Error: Function {function_name} not found in the script.")
-
-    G = selected_function(*arguments)
-    ig.Graph.write_graphml(G, output_path)
+    if function_name not in graph_models:
+        raise ValueError(f"Graph model {function_name} not implemented yet. Choose between {', '.join(graph_models)}")
+    G = graph_models[function_name](*arguments, seed = args.seed, workers = args.workers)
+    save_graph(G, output_path)
     print(f"Graph saved in {output_path}")
-    
+
     return None
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
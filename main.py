@@ -1,37 +1,139 @@
 import argparse
-import igraph as ig
-from utils.input_handler import read_input_config, read_epidemics_config, read_input_graph
-from utils.output_handler import write_initial_conditions_report, save_simulation_df
-from utils.infection import initialize_simulation, simulate_epidemic
-import numpy as np
-import pandas as pd
+import sys
+from utils.input_handler import read_input_config, read_graph_options, read_epidemics_config, read_experiment_options, read_input_adjacency
+from utils.output_handler import write_initial_conditions_report, save_simulation_df, get_summary_path, get_graph_summary
+from utils.infection import initialize_simulation_from_adjacency
+from utils.engines import get_simulation_engine
+from utils.ensemble import simulate_ensemble
+from utils.measurements_graph import streaming_extensions, checkpoint_streaming_extensions
+from utils.rng import RandomStreams
+from utils.checkpoint import Checkpoint, get_checkpoint_path
+from utils.termination import get_termination
+from utils.telemetry import Telemetry
+from utils.partitioned import PartitionedAdjacency
+from utils.temporal import TemporalAdjacency
+from utils.mean_field import analytic_engines, simulate_mean_field
+from utils.server import serve, submit, stop_server, GraphStore
+from utils.seeding import get_seeding
+from utils.interventions import get_interventions
 
-def main():
-    
-    # Parse arguments
-	parser = argparse.ArgumentParser(description = "Simulate a compartmental model on a graph with a preset set of rules.")
-	parser.add_argument("--config", "-c", type=str, help="path/to/config.ini", required = True)
-	args = parser.parse_args() 
-	config_path = args.config 
- 
+def load_graph(graph_path, graph_options: dict, graphs = None):
+	"""
+	Adjacency of the graph and its metadata. With graphs, the GraphStore kept by the server between jobs,
+	a graph already loaded with the same options is reused as long as its file is not modified.
+	"""
+	load = lambda: read_input_adjacency(graph_path, graph_options['use_cache'], graph_options['cache_dir'], graph_options['directed'],
+										graph_options['partitions'], graph_options['weighted'], graph_options['window'],
+										graph_options['steps_per_window'])
+	return load() if graphs is None else graphs.get(graph_path, graph_options, load)
+
+def run_job(config_path, resume = False, graphs = None):
+	"""
+	Run the experiment of the configuration file config_path.
+	"""
 	# Read config data
 	epidemics_path, graph_path, report_path, experiment_output_path = read_input_config(config_path)
 
 	# Read and initialize the epidemics configuration
 	attributes, dynamics, initial_conditions, time_steps, measure_mode = read_epidemics_config(epidemics_path)
-	# Read the Graph
-	G = read_input_graph(graph_path)
-	print(G.summary())
-	print("Mean: ", np.mean(G.degree()))
+	options = read_experiment_options(epidemics_path)
+	if options['engine'] not in analytic_engines:
+		simulate_epidemic = get_simulation_engine(options['engine'])
+	# Detailed measurements saved as .parquet or .npy are written to disk at each step
+	if measure_mode.meas_mode == 'detailed' and experiment_output_path.endswith(streaming_extensions):
+		if options['checkpoint_every'] > 0 and not experiment_output_path.endswith(checkpoint_streaming_extensions):
+			raise ValueError(f"Checkpoints are not available when streaming to {experiment_output_path}. Stream to a .npy file instead")
+		measure_mode.stream_to(experiment_output_path)
+	# Read the Graph adjacency, memory-mapped from the binary cache when enabled
+	graph_options = read_graph_options(config_path)
+	A, graph_meta = load_graph(graph_path, graph_options, graphs)
+	# Partitions are memory-mapped one at a time and snapshots are advanced with the time steps by the discrete engine only
+	if isinstance(A, (PartitionedAdjacency, TemporalAdjacency)) and options['engine'] != 'discrete':
+		raise ValueError("Partitioned and temporal graphs are only available with the discrete engine")
+	if isinstance(A, PartitionedAdjacency) and options['threads'] > 1:
+		raise ValueError("Partitioned graphs are only available on a single thread")
+	print(get_graph_summary(A, graph_meta))
+	print("Mean: ", A.sum() / A.shape[0])
+	# Periodic snapshots of the run, enabled by checkpoint_every
+	checkpoint = None
+	if options['checkpoint_every'] > 0:
+		checkpoint = Checkpoint(get_checkpoint_path(experiment_output_path), options['checkpoint_every'], resume)
+		if checkpoint.saved is not None:
+			# Same seed and realization of the interrupted run, to write the same initial conditions
+			options['seed'], options['replay_realization'] = checkpoint.saved['rng'].entropy, checkpoint.saved['rng'].realization
+			print(f"Resuming from the checkpoint at time {checkpoint.saved['time']}")
+	elif resume:
+		raise ValueError("--resume requires checkpoint_every in the [experiment] section of the epidemics configuration")
+	# Every random number of the experiment derives from its seed
+	rng = RandomStreams(options['seed'])
+	print("Seed: ", rng.seed)
+	realization_rng = rng.realization(options['replay_realization'])
 	# Initialize simulation
-	c, A, G_t = initialize_simulation(G, attributes, dynamics, initial_conditions)
+	# Graph-wide precomputation of the seeding strategy, shared by every realization
+	seeding = get_seeding(options['seeding'], A)
+	c, A, X_t = initialize_simulation_from_adjacency(A, attributes, dynamics, initial_conditions, realization_rng, seeding)
  
 	# Write initial conditions
-	write_initial_conditions_report(G_t, c, report_path)
-	# Simulate the epidemic
-	experiment_df = simulate_epidemic(c, A, G_t, time_steps, measure_mode)
-	# Save the simulation
-	save_simulation_df(experiment_df, experiment_output_path)
+	write_initial_conditions_report(A, graph_meta, X_t, c, report_path)
+	if options['engine'] in analytic_engines:
+		# Expected curves from the mean-field equations of the rules on the degree distribution of the graph
+		method, time = analytic_engines[options['engine']]
+		experiment_df = simulate_mean_field(c, A, time_steps, X = X_t, method = method, time = time)
+		save_simulation_df(experiment_df, experiment_output_path)
+	elif options['n_realizations'] > 1:
+		# Simulate all the realizations together. Only the aggregate curves are measured
+		realizations_df, summary_df = simulate_ensemble(c, A, initial_conditions, time_steps, options['n_realizations'],
+												 options['realizations_per_batch'], options['quantiles'], rng = rng,
+												 stop_when_absorbed = options['stop_when_absorbed'], seeding = seeding)
+		save_simulation_df(realizations_df, experiment_output_path)
+		save_simulation_df(summary_df, get_summary_path(experiment_output_path))
+	else:
+		# Simulate the epidemic. With telemetry, progress is recorded in its file instead of being printed at each step
+		telemetry = None
+		if options['telemetry_path'] is not None:
+			telemetry = Telemetry(options['telemetry_path'], every = options['telemetry_every'])
+		# Only the discrete engine runs on several threads
+		engine_options = {'threads': options['threads']} if options['threads'] > 1 else {}
+		# Interventions keep the isolation of the nodes and their budgets: built anew for each run
+		interventions = get_interventions(options['interventions'], A.shape[0])
+		if interventions is not None:
+			engine_options['interventions'] = interventions
+		experiment_df = simulate_epidemic(c, A, X_t, time_steps, measure_mode, verbosity = telemetry is None, rng = realization_rng,
+										  checkpoint = checkpoint, termination = get_termination(options), telemetry = telemetry,
+										  **engine_options)
+		if telemetry is not None: telemetry.close()
+		if measure_mode.stop_time is not None:
+			print(f"Run stopped at time {measure_mode.stop_time}: {measure_mode.stop_reason}")
+		# Save the simulation
+		save_simulation_df(experiment_df, experiment_output_path)
+		if checkpoint is not None: checkpoint.clear()
+
+def main():
+
+	# Parse arguments
+	parser = argparse.ArgumentParser(description = "Simulate a compartmental model on a graph with a preset set of rules.")
+	parser.add_argument("--config", "-c", type=str, help="path/to/config.ini", default = None)
+	parser.add_argument("--resume", action = "store_true", help="continue the run from its latest checkpoint")
+	parser.add_argument("--serve", type=str, metavar = "SOCKET", help="keep running and simulate the configurations submitted to the Unix socket SOCKET, reusing the graphs already loaded", default = None)
+	parser.add_argument("--submit", type=str, metavar = "SOCKET", help="send the configuration to the server listening on SOCKET and wait for its end", default = None)
+	parser.add_argument("--stop", type=str, metavar = "SOCKET", help="stop the server listening on SOCKET", default = None)
+	parser.add_argument("--max-graphs", type=int, help="number of graphs kept in memory by the server. Default: 4", default = 4)
+	args = parser.parse_args()
+
+	if args.serve is not None:
+		# Graphs loaded by the jobs, kept for the next ones
+		graphs = GraphStore(args.max_graphs)
+		serve(args.serve, lambda config_path, resume: run_job(config_path, resume, graphs))
+	elif args.stop is not None:
+		print(f"Server {args.stop} {stop_server(args.stop)['status']}")
+	elif args.config is None:
+		parser.error("the following arguments are required: --config/-c")
+	elif args.submit is not None:
+		reply = submit(args.submit, args.config, args.resume)
+		print(f"Job {args.config} {reply['status']} in {reply['seconds']:.2f} s" + (f": {reply['error']}" if 'error' in reply else ''))
+		if reply['status'] != 'done': sys.exit(1)
+	else:
+		run_job(args.config, args.resume)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,222 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+sir_states = ('susceptible', 'infected', 'removed')
+
+def sir_rhs(y, beta, gamma, N):
+    """
+    Right-hand side of the SIR equations for many parameter sets at once.
+
+    Parameters:
+        - y: array of shape (3, K) with S, I, R of each of the K systems
+        - beta, gamma, N: arrays of shape (K,)
+    """
+    S, I, _ = y
+    infections = beta * S * I / N
+    recoveries = gamma * I
+    return np.stack([-infections, infections - recoveries, recoveries])
+
+def sir_sensitivity_rhs(y, beta, gamma, N):
+    """
+    SIR equations augmented with the sensitivities of S, I, R to beta and gamma:
+    ds/dt = J s + df/dtheta, with J the analytic Jacobian of the right-hand side.
+
+    Parameters:
+        - y: array of shape (9, K) with S, I, R, dS/dbeta, dI/dbeta, dR/dbeta, dS/dgamma, dI/dgamma, dR/dgamma
+    """
+    S, I = y[0], y[1]
+    infections = beta * S * I / N
+    recoveries = gamma * I
+    # Non-zero entries of the Jacobian: the R column is null
+    dinf_dS, dinf_dI = beta * I / N, beta * S / N
+    derivatives = [-infections, infections - recoveries, recoveries]
+    for first, (df_dtheta_S, df_dtheta_I, df_dtheta_R) in ((3, (-S * I / N, S * I / N, 0.)), (6, (0., -I, I))):
+        sS, sI = y[first], y[first + 1]
+        infections_sensitivity = dinf_dS * sS + dinf_dI * sI
+        derivatives += [-infections_sensitivity + df_dtheta_S,
+                        infections_sensitivity - gamma * sI + df_dtheta_I,
+                        gamma * sI + df_dtheta_R]
+    return np.stack(np.broadcast_arrays(*derivatives))
+
+def integrate_sir(y0, beta, gamma, times, substeps = 4, sensitivities = False):
+    """
+    Integrate the SIR equations of K parameter sets together with the classic Runge-Kutta method,
+    using substeps steps between consecutive times.
+
+    Parameters:
+        - y0: array of shape (3, K) with the initial S, I, R
+        - beta, gamma: arrays of shape (K,)
+        - times: increasing array of shape (T,) of the output times, starting at the initial time
+        - sensitivities: also integrate the derivatives of S, I, R with respect to beta and gamma
+    Returns:
+        y: array of shape (T, 3, K), or (T, 9, K) with the sensitivities
+    """
+    N = y0.sum(axis = 0)
+    rhs = sir_sensitivity_rhs if sensitivities else sir_rhs
+    y = np.concatenate([y0, np.zeros((6, y0.shape[1]))]) if sensitivities else y0.astype(np.float64)
+    trajectory = np.empty((len(times),) + y.shape)
+    trajectory[0] = y
+    for k in range(1, len(times)):
+        dt = (times[k] - times[k - 1]) / substeps
+        for _ in range(substeps):
+            k1 = rhs(y, beta, gamma, N)
+            k2 = rhs(y + dt / 2 * k1, beta, gamma, N)
+            k3 = rhs(y + dt / 2 * k2, beta, gamma, N)
+            k4 = rhs(y + dt * k3, beta, gamma, N)
+            y = y + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        trajectory[k] = y
+    return trajectory
+
+def curves_from_aggregate(experiment_df, group_columns = None, attribute = 'compartment', states = sir_states):
+    """
+    Curves of the runs in an aggregate measurement DataFrame (attribute, value, time and key columns,
+    e.g. the output of a sweep). States missing at a time have no nodes.
+
+    Parameters:
+        - group_columns: columns identifying a run. Default: every column except attribute, value and time
+    Returns:
+        curves: array of shape (number of runs, 3, T)
+        times: array of shape (T,)
+        keys_df: DataFrame with the group columns of each run
+    """
+    if group_columns is None:
+        group_columns = [column for column in experiment_df.columns if column not in (attribute, 'value', 'time')]
+    times = np.sort(experiment_df['time'].unique())
+    time_index = np.searchsorted(times, experiment_df['time'].to_numpy())
+    state_index = pd.Categorical(experiment_df[attribute], categories = list(states)).codes
+    if len(group_columns) > 0:
+        groups = experiment_df.groupby(group_columns, sort = True)
+        run_index = groups.ngroup().to_numpy()
+        keys_df = groups.size().index.to_frame(index = False)
+    else:
+        run_index = np.zeros(len(experiment_df), dtype = np.int64)
+        keys_df = pd.DataFrame(index = [0])
+    # Scatter the counts, rows of other states are dropped
+    known = state_index >= 0
+    curves = np.zeros((len(keys_df), len(states), len(times)))
+    np.add.at(curves, (run_index[known], state_index[known], time_index[known]), experiment_df['value'].to_numpy()[known])
+    return curves, times, keys_df
+
+def grid_search_sir(curves, times, beta_grid, gamma_grid, substeps = 4):
+    """
+    Best (beta, gamma) of each run over the grid, integrating all the beta candidates of all the runs together,
+    one gamma value at a time to bound the memory.
+
+    Returns:
+        beta, gamma: arrays of shape (number of runs,)
+    """
+    K = curves.shape[0]
+    G = len(beta_grid)
+    # Column k * G + g holds candidate g of run k
+    y0 = np.repeat(curves[:, :, 0].T, G, axis = 1)
+    data = curves.transpose(2, 1, 0)[..., np.newaxis]
+    losses = np.empty((len(gamma_grid), K, G))
+    for row, gamma in enumerate(gamma_grid):
+        trajectory = integrate_sir(y0, np.tile(beta_grid, K), np.full(K * G, gamma), times, substeps)
+        residuals = trajectory.reshape(len(times), 3, K, G) - data
+        losses[row] = np.sum(residuals * residuals, axis = (0, 1))
+    best_gamma, best_beta = np.unravel_index(np.argmin(losses.transpose(1, 0, 2).reshape(K, -1), axis = 1), (len(gamma_grid), G))
+    return np.asarray(beta_grid)[best_beta], np.asarray(gamma_grid)[best_gamma]
+
+def fit_sir_batch(curves, times, initial_params = None, bounds = ((0, 1), (0, 1)), grid_size = 8, max_iterations = 50,
+                  tolerance = 1e-8, substeps = 4):
+    """
+    Least squares fit of the SIR equations to many runs at once, with a Levenberg-Marquardt method
+    advancing every run together. The Jacobian of the residuals comes from the sensitivity equations,
+    without finite differences. The initial S, I, R and N of each run are the ones observed at the first time.
+
+    Parameters:
+        - curves: array of shape (number of runs, 3, T) with S, I, R of each run at times
+        - initial_params: (beta, gamma) starting point of every run. Default: the best point of a grid_size x grid_size grid
+        - bounds: bounds of beta and gamma
+    Returns:
+        estimates_df: DataFrame with one row per run and columns beta, gamma, beta_std, gamma_std, loss, iterations, converged.
+            The standard errors come from the Gauss-Newton covariance s^2 (J^T J)^-1, treating the residuals as independent.
+            The loss is the sum over S, I, R of the mean squared error, as in ode_sir_fit.
+    """
+    K, _, T = curves.shape
+    lower, upper = np.array(bounds, dtype = np.float64).T
+    if initial_params is None:
+        beta_grid = np.linspace(lower[0], upper[0], grid_size + 1)[1:]
+        gamma_grid = np.linspace(lower[1], upper[1], grid_size + 1)[1:]
+        params = np.stack(grid_search_sir(curves, times, beta_grid, gamma_grid, substeps), axis = 1)
+    else:
+        params = np.tile(np.asarray(initial_params, dtype = np.float64), (K, 1))
+    y0 = curves[:, :, 0].T
+    data = curves.transpose(2, 1, 0)
+
+    def sum_of_squares(params, runs):
+        trajectory = integrate_sir(y0[:, runs], params[runs, 0], params[runs, 1], times, substeps)
+        residuals = trajectory - data[:, :, runs]
+        return np.sum(residuals * residuals, axis = (0, 1))
+
+    damping = np.full(K, 1e-3)
+    iterations = np.zeros(K, dtype = np.int64)
+    converged = np.zeros(K, dtype = bool)
+    loss = sum_of_squares(params, np.arange(K))
+    for _ in range(max_iterations):
+        runs = np.flatnonzero(~converged)
+        if len(runs) == 0: break
+        trajectory = integrate_sir(y0[:, runs], params[runs, 0], params[runs, 1], times, substeps, sensitivities = True)
+        # Residuals (T * 3, runs) and their Jacobian (T * 3, runs, 2)
+        residuals = (trajectory[:, :3] - data[:, :, runs]).reshape(T * 3, len(runs))
+        jacobian = np.stack([trajectory[:, 3:6], trajectory[:, 6:9]], axis = -1).reshape(T * 3, len(runs), 2)
+        gradient = np.einsum('nkp,nk->kp', jacobian, residuals)
+        hessian = np.einsum('nkp,nkq->kpq', jacobian, jacobian)
+        diagonal = np.diagonal(hessian, axis1 = 1, axis2 = 2)
+        damped = hessian + (damping[runs, np.newaxis] * np.maximum(diagonal, 1e-12))[:, :, np.newaxis] * np.eye(2)
+        step = np.linalg.solve(damped, -gradient[:, :, np.newaxis])[:, :, 0]
+        candidates = params.copy()
+        candidates[runs] = np.clip(params[runs] + step, lower, upper)
+        candidate_loss = sum_of_squares(candidates, runs)
+        improved = candidate_loss < loss[runs]
+        # Accepted steps shrink the damping towards Gauss-Newton, rejected ones move towards gradient descent
+        damping[runs] = np.where(improved, damping[runs] / 10, damping[runs] * 10)
+        relative_change = np.abs(loss[runs] - candidate_loss) / np.maximum(loss[runs], 1e-300)
+        small_step = np.all(np.abs(candidates[runs] - params[runs]) <= tolerance * np.maximum(np.abs(params[runs]), 1), axis = 1)
+        accepted = runs[improved]
+        params[accepted] = candidates[accepted]
+        loss[accepted] = candidate_loss[improved]
+        iterations[runs] += 1
+        converged[runs] = (improved & (relative_change < tolerance)) | small_step | (damping[runs] > 1e10)
+
+    # Gauss-Newton covariance at the estimates
+    trajectory = integrate_sir(y0, params[:, 0], params[:, 1], times, substeps, sensitivities = True)
+    jacobian = np.stack([trajectory[:, 3:6], trajectory[:, 6:9]], axis = -1).reshape(T * 3, K, 2)
+    hessian = np.einsum('nkp,nkq->kpq', jacobian, jacobian)
+    residual_variance = loss / max(T * 3 - 2, 1)
+    covariance = np.linalg.pinv(hessian) * residual_variance[:, np.newaxis, np.newaxis]
+    standard_errors = np.sqrt(np.maximum(np.diagonal(covariance, axis1 = 1, axis2 = 2), 0))
+    return pd.DataFrame({'beta': params[:, 0], 'gamma': params[:, 1],
+                         'beta_std': standard_errors[:, 0], 'gamma_std': standard_errors[:, 1],
+                         'loss': loss / T, 'iterations': iterations, 'converged': converged})
+
+def fit_sir_table(experiment_df, group_columns = None, batch_size = 1000, **fit_options):
+    """
+    Fit every run of an aggregate measurement DataFrame, batch_size runs at a time.
+
+    Returns:
+        DataFrame with the group columns of each run followed by the estimates of fit_sir_batch
+    """
+    curves, times, keys_df = curves_from_aggregate(experiment_df, group_columns)
+    estimates = [fit_sir_batch(curves[first:first + batch_size], times, **fit_options) for first in range(0, curves.shape[0], batch_size)]
+    return pd.concat([keys_df.reset_index(drop = True), pd.concat(estimates, ignore_index = True)], axis = 1)
+
+def main():
+    parser = argparse.ArgumentParser(description = "Fit the SIR equations to every run of an aggregate measurement or sweep output.")
+    parser.add_argument("experiment_path", type=str, help="path/to/experiment.pickle with the aggregate curves")
+    parser.add_argument("--output", "-o", type=str, help="path/to/estimates.pickle or .csv. Default: print the table", default = None)
+    parser.add_argument("--group-by", "-g", type=str, nargs = '*', help="columns identifying a run. Default: all the key columns", default = None)
+    args = parser.parse_args()
+
+    estimates_df = fit_sir_table(pd.read_pickle(args.experiment_path), args.group_by)
+    if args.output is None:
+        print(estimates_df.to_string())
+    elif args.output.endswith('.csv'):
+        estimates_df.to_csv(args.output, index = False)
+    else:
+        estimates_df.to_pickle(args.output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import argparse
+from utils.input_handler import read_sweep_config, read_epidemics_config, read_experiment_options, read_input_adjacency
+from utils.output_handler import save_simulation_df
+from utils.sweep import build_sweep_grid, run_sweep
+from utils.mean_field import analytic_engines, screen_mean_field
+import os
+import pandas as pd
+
+def load_adjacency(graph_path):
+	A, _ = read_input_adjacency(graph_path)
+	return A
+
+def main():
+
+	# Parse arguments
+	parser = argparse.ArgumentParser(description = "Simulate a compartmental model over a grid of transition probabilities, graphs and seeds.")
+	parser.add_argument("--config", "-c", type=str, help="path/to/sweep.ini", required = True)
+	parser.add_argument("--max-workers", "-w", type=int, help="number of processes. Default: all the cores", default = None)
+	parser.add_argument("--screen", type=str, choices = list(analytic_engines), help="only compute the mean-field curves of the grid with this analytic engine", default = None)
+	args = parser.parse_args()
+
+	# Read sweep and epidemics configuration
+	epidemics_path, graph_paths, prob_ranges, seeds, initial_conditions, runs_dir, output_path = read_sweep_config(args.config)
+	attributes, dynamics, default_initial_conditions, time_steps, _ = read_epidemics_config(epidemics_path)
+	options = read_experiment_options(epidemics_path)
+	if initial_conditions is None:
+		initial_conditions = [default_initial_conditions]
+
+	if args.screen is not None:
+		# Expected curves of every point of the grid on every graph, in milliseconds per point
+		screen_df = pd.concat([screen_mean_field(load_adjacency(graph_path), attributes, dynamics, initial_conditions[0], prob_ranges, time_steps, args.screen)
+							   .assign(graph = os.path.basename(graph_path)) for graph_path in graph_paths], ignore_index = True)
+		save_simulation_df(screen_df, os.path.splitext(output_path)[0] + '_screen' + os.path.splitext(output_path)[1])
+		return
+
+	# Run the grid. Runs already saved in runs_dir are skipped
+	runs = build_sweep_grid(prob_ranges, graph_paths, seeds, len(initial_conditions))
+	sweep_df = run_sweep(runs, load_adjacency, attributes, dynamics, initial_conditions, time_steps, runs_dir, args.max_workers, options['engine'],
+					   experiment_options = options)
+	# Save the table of all the runs
+	save_simulation_df(sweep_df, output_path)
+
+if __name__ == '__main__':
+	main()
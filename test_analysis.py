@@ -0,0 +1,46 @@
+import os
+import sys
+import numpy as np
+import pytest
+from utils.infection import simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.analysis import analyze_states, summarize_runs
+from utils.preprocess_epidemic_data import aggregate_epidemic_data
+
+def test_curves_of_every_output_agree(sir):
+    c, A, X = sir
+    aggregate = simulate_epidemic(c, A, X, 30, Measure('aggregate'), verbosity = False, rng = 5)
+    detailed = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    log = simulate_epidemic(c, A, X, 30, Measure('transitions'), verbosity = False, rng = 5)
+    key = ['time', 'compartment']
+    expected = aggregate.sort_values(key)['value'].to_numpy()
+    for source in (detailed, log):
+        curves, infection_times = analyze_states(source, state_names = c.state_names('compartment'))
+        assert np.array_equal(curves.sort_values(key)['value'].to_numpy(), expected)
+        assert np.count_nonzero(~np.isnan(infection_times)) == A.shape[0] - aggregate[(aggregate.time == 30) & (aggregate.compartment == 'susceptible')]['value'].sum()
+
+def test_summary_of_runs(sir):
+    c, A, X = sir
+    aggregate = simulate_epidemic(c, A, X, 30, Measure('aggregate'), verbosity = False, rng = 5)
+    summary = summarize_runs(aggregate)
+    final = aggregate[aggregate.time == 30]
+    assert summary['final_size'].item() == A.shape[0] - final[final.compartment == 'susceptible']['value'].sum()
+
+def test_summary_rejects_unknown_states(sir):
+    c, A, X = sir
+    aggregate = simulate_epidemic(c, A, X, 10, Measure('aggregate'), verbosity = False, rng = 5)
+    with pytest.raises(ValueError, match = 'State S not found'):
+        summarize_runs(aggregate, susceptible = 'S', infected = 'I')
+
+def test_aggregated_detailed_output_keeps_every_time(sir):
+    c, A, X = sir
+    aggregate = simulate_epidemic(c, A, X, 30, Measure('aggregate'), verbosity = False, rng = 5)
+    detailed = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    result_df = aggregate_epidemic_data(detailed)
+    assert list(result_df['time']) == list(range(31))
+    expected = aggregate.pivot(index = 'time', columns = 'compartment', values = 'value').fillna(0)
+    assert np.array_equal(result_df[expected.columns].to_numpy(), expected.to_numpy())
+    # The fitting scripts use the same implementation
+    sys.path.append(os.path.join(os.path.dirname(__file__), 'simple_fit'))
+    from preprocess_epidemic_data import aggregate_epidemic_data as simple_fit_aggregate
+    assert simple_fit_aggregate is aggregate_epidemic_data
@@ -0,0 +1,54 @@
+import numpy as np
+from conftest import sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.infection import adjacency_from_edges, initialize_simulation_from_adjacency, advance_state, get_transition_mask
+
+def test_adjacency_counts_the_in_neighbors():
+    sources, targets = np.array([0, 0, 1, 2]), np.array([1, 2, 2, 1])
+    A = adjacency_from_edges(sources, targets, 4, directed = True)
+    assert np.array_equal(A.dot(np.array([1., 0., 0., 0.])), [0, 1, 1, 0])
+    assert np.array_equal(A.dot(np.ones(4)), [0, 2, 2, 0])
+    # Undirected edges are stored in both directions, repeated edges are merged
+    A = adjacency_from_edges(np.array([0, 0, 3]), np.array([1, 1, 0]), 4, directed = False)
+    assert (A != A.T).nnz == 0
+    assert A.nnz == 4 and A[1, 0] == 2
+
+def stars(n_stars, leaves):
+    """
+    n_stars disjoint stars: a susceptible center and infected leaves.
+    """
+    V = n_stars * (leaves + 1)
+    centers = np.arange(n_stars) * (leaves + 1)
+    sources = np.repeat(centers, leaves)
+    targets = sources + np.tile(np.arange(1, leaves + 1), n_stars)
+    c, A, X = initialize_simulation_from_adjacency(adjacency_from_edges(sources, targets, V, False), sir_attributes, sir_dynamics,
+                                                   sir_initial_conditions, 1)
+    X['compartment'][:] = c.encode('compartment', 'infected')
+    X['compartment'][centers] = c.encode('compartment', 'susceptible')
+    return c, A, X, centers
+
+def test_step_probabilities():
+    c, A, X, centers = stars(20000, 3)
+    X_next = {attribute: np.empty_like(states) for attribute, states in X.items()}
+    updates = advance_state(c, A, X, X_next, rng = 2)
+    infected, removed = c.encode('compartment', 'infected'), c.encode('compartment', 'removed')
+    # A susceptible node with n infected neighbors is infected with probability 1 - (1 - p)^n
+    assert abs(np.mean(X_next['compartment'][centers] == infected) - (1 - 0.95 ** 3)) < 0.01
+    leaves = np.setdiff1d(np.arange(A.shape[0]), centers)
+    assert abs(np.mean(X_next['compartment'][leaves] == removed) - 0.2) < 0.01
+    # Every rule reads the state at time t: nodes infected in the step do not recover in it
+    assert not (X_next['compartment'][centers] == removed).any()
+    assert [transition.name for transition, _ in updates] == ['infection', 'recovery']
+    assert np.array_equal(np.flatnonzero(updates[0][1]), centers[X_next['compartment'][centers] == infected])
+    # The state at time t is left untouched
+    assert np.count_nonzero(X['compartment'] == infected) == len(leaves)
+
+def test_rule_mask_semantics():
+    c, A, X, centers = stars(20000, 2)
+    infection, recovery = c.transition_rules
+    fired = get_transition_mask(X, A, c, infection, rng = 3)
+    assert not fired[np.setdiff1d(np.arange(A.shape[0]), centers)].any()
+    assert abs(np.mean(fired[centers]) - (1 - 0.95 ** 2)) < 0.01
+    # Without nodes in the triggering state nothing fires
+    X['compartment'][:] = c.encode('compartment', 'susceptible')
+    assert not get_transition_mask(X, A, c, infection, rng = 3).any()
+    assert not get_transition_mask(X, A, c, recovery, rng = 3).any()
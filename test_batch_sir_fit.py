@@ -0,0 +1,39 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+sys.path.append(os.path.join(os.path.dirname(__file__), 'simple_fit'))
+from batch_sir_fit import integrate_sir, curves_from_aggregate, fit_sir_batch, fit_sir_table
+
+times = np.arange(0, 60, dtype = np.float64)
+true_params = np.array([[0.3, 0.1], [0.5, 0.2], [0.25, 0.05]])
+
+def sir_curves(params, N = 1000., infected = 10.):
+    y0 = np.tile([[N - infected], [infected], [0.]], (1, len(params)))
+    return integrate_sir(y0, params[:, 0], params[:, 1], times).transpose(2, 1, 0)
+
+def test_integration_conserves_the_population():
+    curves = sir_curves(true_params)
+    assert np.allclose(curves.sum(axis = 1), 1000.)
+    # The sensitivities agree with finite differences
+    y0 = curves[:1, :, 0].T
+    trajectory = integrate_sir(y0, np.array([0.3]), np.array([0.1]), times, sensitivities = True)
+    shifted = integrate_sir(y0, np.array([0.3 + 1e-6]), np.array([0.1]), times)
+    assert np.allclose((shifted - trajectory[:, :3]) / 1e-6, trajectory[:, 3:6], rtol = 1e-3, atol = 1e-2)
+
+def test_fit_recovers_the_parameters_of_every_run():
+    estimates_df = fit_sir_batch(sir_curves(true_params), times)
+    assert estimates_df['converged'].all()
+    assert np.allclose(estimates_df[['beta', 'gamma']].to_numpy(), true_params, rtol = 1e-4)
+    assert (estimates_df['loss'] < 1e-6).all()
+
+def test_fit_of_an_aggregate_table():
+    curves = sir_curves(true_params[:2])
+    rows = [(seed, state, t, curves[seed, k, t]) for seed in range(2) for k, state in enumerate(('susceptible', 'infected', 'removed'))
+            for t in range(len(times))]
+    experiment_df = pd.DataFrame(rows, columns = ['seed', 'compartment', 'time', 'value'])
+    table_curves, table_times, keys_df = curves_from_aggregate(experiment_df)
+    assert np.array_equal(table_curves, curves) and np.array_equal(table_times, times)
+    estimates_df = fit_sir_table(experiment_df, batch_size = 1)
+    assert list(estimates_df['seed']) == [0, 1]
+    assert np.allclose(estimates_df[['beta', 'gamma']].to_numpy(), true_params[:2], rtol = 1e-4)
@@ -0,0 +1,28 @@
+import json
+import numpy as np
+from utils.benchmark import build_benchmark_cases, run_benchmarks, compare_benchmarks
+
+def test_small_benchmark_run(tmp_path):
+    cases = build_benchmark_cases([300], ['GNM'], engines = ('discrete',), measures = ('aggregate',), steps = 3, graphml_max_size = 0)
+    assert [name for name, _ in cases] == ['generate', 'build', 'load', 'load', 'simulate', 'measure', 'measure', 'measure']
+    output_path = str(tmp_path / 'report.json')
+    report = run_benchmarks(cases, str(tmp_path / 'work'), output_path, verbosity = False)
+    with open(output_path) as report_file:
+        assert json.load(report_file) == report
+    assert len(report['results']) == len(cases)
+    for result, (name, kwargs) in zip(report['results'], cases):
+        assert result['benchmark'] == name and all(result[key] == value for key, value in kwargs.items())
+        assert result['seconds'] >= 0 and result['peak_rss_mb'] > 0
+    # Both loads read the same graph
+    build, edge_list, cache = report['results'][1:4]
+    assert edge_list['nnz'] == cache['nnz'] == build['nnz']
+
+def test_compare_benchmarks_matches_the_cases():
+    base = {'results': [{'benchmark': 'build', 'family': 'GNM', 'V': 100, 'seconds': 2.0, 'peak_rss_mb': 100.0},
+                        {'benchmark': 'build', 'family': 'BA', 'V': 100, 'seconds': 1.0, 'peak_rss_mb': 100.0}]}
+    new = {'results': [{'benchmark': 'build', 'family': 'GNM', 'V': 100, 'seconds': 1.0, 'peak_rss_mb': 150.0},
+                       {'benchmark': 'build', 'family': 'GNM', 'V': 1000, 'seconds': 1.0, 'peak_rss_mb': 100.0}]}
+    comparison_df = compare_benchmarks(base, new)
+    assert list(comparison_df.columns) == ['benchmark', 'family', 'V', 'base_seconds', 'new_seconds', 'time_ratio', 'rss_ratio']
+    assert len(comparison_df) == 1
+    assert np.allclose(comparison_df[['time_ratio', 'rss_ratio']].to_numpy(), [[0.5, 1.5]])
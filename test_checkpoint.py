@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from main import run_job
+from utils.engines import get_simulation_engine
+from utils.measurements_graph import Measure, read_state_matrix
+from utils.checkpoint import Checkpoint
+
+time_steps = 40
+
+class Interrupted(Exception):
+    pass
+
+def interrupt_at(measure, stop_time):
+    append = measure.append_experiment
+    def append_until(X, c, attribute, t):
+        if t == stop_time:
+            raise Interrupted
+        append(X, c, attribute, t)
+    measure.append_experiment = append_until
+
+def get_measure(mode, output_path = None):
+    measure = Measure(mode)
+    if output_path is not None:
+        measure.stream_to(output_path)
+    return measure
+
+def run_with_resume(sir, engine, mode, path, output_path = None):
+    c, A, X = sir
+    simulate = get_simulation_engine(engine)
+    measure = get_measure(mode, output_path)
+    interrupt_at(measure, 25)
+    with pytest.raises(Interrupted):
+        simulate(c, A, X, time_steps, measure, verbosity = False, rng = 5, checkpoint = Checkpoint(path, 10))
+    return simulate(c, A, X, time_steps, get_measure(mode, output_path), verbosity = False, rng = 5, checkpoint = Checkpoint(path, 10, resume = True))
+
+@pytest.mark.parametrize('engine', ['discrete', 'frontier', 'gillespie'])
+def test_resume_gives_the_uninterrupted_run(sir, engine, tmp_path):
+    c, A, X = sir
+    full = get_simulation_engine(engine)(c, A, X, time_steps, Measure('detailed'), verbosity = False, rng = 5)
+    resumed = run_with_resume(sir, engine, 'detailed', str(tmp_path / 'run.checkpoint'))
+    assert resumed.reset_index(drop = True).equals(full.reset_index(drop = True))
+
+def test_resume_transition_log(sir, tmp_path):
+    c, A, X = sir
+    full = get_simulation_engine('discrete')(c, A, X, time_steps, Measure('transitions'), verbosity = False, rng = 5)
+    resumed = run_with_resume(sir, 'discrete', 'transitions', str(tmp_path / 'run.checkpoint'))
+    assert resumed.aggregate().equals(full.aggregate())
+
+def test_resume_npy_stream(sir, tmp_path):
+    c, A, X = sir
+    full_path, resumed_path = str(tmp_path / 'full.npy'), str(tmp_path / 'resumed.npy')
+    get_simulation_engine('discrete')(c, A, X, time_steps, get_measure('detailed', full_path), verbosity = False, rng = 5).finalize()
+    run_with_resume(sir, 'discrete', 'detailed', str(tmp_path / 'run.checkpoint'), resumed_path).finalize()
+    full_states, _, full_times, _ = read_state_matrix(full_path)
+    resumed_states, _, resumed_times, _ = read_state_matrix(resumed_path)
+    assert np.array_equal(resumed_states, full_states) and list(resumed_times) == list(full_times)
+
+def test_checkpoints_rejected_when_streaming_to_parquet(tmp_path):
+    rng = np.random.default_rng(0)
+    np.savetxt(tmp_path / 'graph.edges', rng.integers(0, 100, (300, 2)), fmt = '%d')
+    (tmp_path / 'epidemics.ini').write_text(open(os.path.join(os.path.dirname(__file__), 'epidemics.ini')).read().replace('# checkpoint_every = 10', 'checkpoint_every = 10'))
+    (tmp_path / 'config.ini').write_text(f"""[epidemics configuration file path]
+epidemics_path = {tmp_path / 'epidemics.ini'}
+[graph file path]
+graph_path = {tmp_path / 'graph.edges'}
+[report and initial conditions output path]
+report_path = {tmp_path / 'report.dat'}
+[experiment output path]
+experiment_output_path = {tmp_path / 'experiment.parquet'}
+""")
+    with pytest.raises(ValueError, match = 'Checkpoints are not available'):
+        run_job(str(tmp_path / 'config.ini'))
@@ -1,15 +1,39 @@
-from utils.input_handler import read_input_config
+import os
+import numpy as np
+import pandas as pd
+import igraph as ig
+from utils.input_handler import read_epidemics_config
 from utils.infection import initialize_simulation, simulate_epidemic
+from utils.measurements_graph import Measure
 from utils.output_handler import write_initial_conditions_report, save_simulation_df
-import igraph as ig
 
-config_path = './config.ini'
+epidemics_path = os.path.join(os.path.dirname(__file__), 'epidemics.ini')
 
-attributes, dynamics, initial_conditions, time_steps, measure_mode = read_input_config(config_path)
-G = ig.Graph.Erdos_Renyi(n = 10, p = 0.2)
-c, A, G_t = initialize_simulation(G, attributes, dynamics, initial_conditions)
-write_initial_conditions_report(G_t, c, None)
-experiment_df = simulate_epidemic(c, A, G_t, time_steps, measure_mode)
-save_simulation_df(experiment_df, None)
+def test_simulation_on_igraph_graph(tmp_path):
+    attributes, dynamics, initial_conditions, time_steps, measure_mode = read_epidemics_config(epidemics_path)
+    G = ig.Graph.Erdos_Renyi(n = 100, p = 0.05)
+    c, A, X_t = initialize_simulation(G, attributes, dynamics, initial_conditions, rng = 1)
+    write_initial_conditions_report(A, {'name': 'ER', 'ecount': G.ecount()}, X_t, c, str(tmp_path / 'report.dat'))
+    experiment_df = simulate_epidemic(c, A, X_t, time_steps, measure_mode, verbosity = False, rng = 1)
+    save_simulation_df(experiment_df, str(tmp_path / 'experiment.pickle'))
+    saved_df = pd.read_pickle(tmp_path / 'experiment.pickle')
+    assert saved_df.equals(experiment_df)
+    # Every node is measured once per time, in one of the compartments
+    assert (saved_df.groupby('time').size() == G.vcount()).all()
+    assert list(np.unique(saved_df['time'])) == list(range(time_steps + 1))
+    assert set(saved_df['compartment']) <= set(attributes['compartment'])
 
+def test_initial_state_follows_the_initial_conditions(sir):
+    c, A, X_t = sir
+    counts = np.bincount(X_t['compartment'], minlength = 3)
+    assert X_t['compartment'].dtype == np.int8
+    assert counts[c.encode('compartment', 'removed')] == 0
+    assert abs(counts[c.encode('compartment', 'infected')] - 0.01 * A.shape[0]) < 0.01 * A.shape[0]
 
+def test_removed_nodes_never_leave(sir):
+    c, A, X_t = sir
+    detailed = simulate_epidemic(c, A, X_t, 30, Measure('detailed'), verbosity = False, rng = 2)
+    states = detailed.pivot(index = 'time', columns = 'node_index', values = 'compartment').to_numpy()
+    removed = states == 'removed'
+    # Once removed, a node stays removed
+    assert not (removed[:-1] & ~removed[1:]).any()
@@ -0,0 +1,37 @@
+import numpy as np
+import igraph as ig
+import pytest
+from utils.edge_list import read_edge_list_adjacency
+from utils.infection import sparse_adj_matrix
+
+edges = np.array([[0, 1], [1, 2], [2, 0], [3, 1], [1, 2]])
+
+def write_edges(tmp_path):
+    np.savetxt(tmp_path / 'graph.edges', edges, fmt = '%d', header = 'source target')
+    np.savetxt(tmp_path / 'graph.csv', edges, fmt = '%d', delimiter = ',')
+    np.save(tmp_path / 'graph.npy', edges)
+    return [str(tmp_path / name) for name in ('graph.edges', 'graph.csv', 'graph.npy')]
+
+@pytest.mark.parametrize('directed', [False, True])
+def test_edge_list_gives_the_igraph_adjacency(tmp_path, directed):
+    expected = sparse_adj_matrix(ig.Graph(edges = edges.tolist(), directed = directed)).toarray()
+    for graph_path in write_edges(tmp_path):
+        # Chunks smaller than the file are streamed and concatenated
+        A, meta, _ = read_edge_list_adjacency(graph_path, directed = directed, chunk_size = 2)
+        assert np.array_equal(A.toarray(), expected)
+        assert meta['vcount'] == 4 and meta['ecount'] == len(edges) and meta['directed'] == directed
+    # A[i, j] counts the edges j -> i: the repeated edge 1 -> 2 is one entry of value 2
+    A, _, _ = read_edge_list_adjacency(str(tmp_path / 'graph.npy'), directed = True)
+    assert A[2, 1] == 2 and A[1, 2] == 0 and A.nnz == 4
+    assert np.array_equal(A.toarray() + A.toarray().T, read_edge_list_adjacency(str(tmp_path / 'graph.npy'))[0].toarray())
+
+def test_weighted_edge_list(tmp_path):
+    np.savetxt(tmp_path / 'graph.edges', [[0, 1, 0.5], [1, 2, 0.25], [0, 1, 0.125]], fmt = ['%d', '%d', '%g'])
+    A, _, _ = read_edge_list_adjacency(str(tmp_path / 'graph.edges'), weighted = True, V = 5)
+    assert A.shape == (5, 5) and A.dtype == np.float64
+    assert A[1, 0] == A[0, 1] == 0.625 and A[2, 1] == 0.25
+
+def test_negative_indices_are_rejected(tmp_path):
+    np.savetxt(tmp_path / 'graph.edges', [[0, -1]], fmt = '%d')
+    with pytest.raises(ValueError, match = 'Negative node index'):
+        read_edge_list_adjacency(str(tmp_path / 'graph.edges'))
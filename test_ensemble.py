@@ -0,0 +1,58 @@
+import numpy as np
+from conftest import sir_initial_conditions
+from utils.ensemble import simulate_ensemble, count_states_per_realization
+from utils.infection import simulate_epidemic, advance_state
+from utils.initialize_data import initialize_state
+from utils.measurements_graph import Measure
+from utils.rng import RandomStreams
+
+def test_realizations_replay_as_single_runs(sir):
+    c, A, _ = sir
+    realizations_df, summary_df = simulate_ensemble(c, A, sir_initial_conditions, 30, 6, realizations_per_batch = 4, verbosity = False,
+                                                    rng = RandomStreams(7), stop_when_absorbed = False)
+    for r in (0, 5):
+        streams = RandomStreams(7).realization(r)
+        X = initialize_state(A.shape[0], c, sir_initial_conditions, rng = streams)
+        single_df = simulate_epidemic(c, A, X, 30, Measure('aggregate'), verbosity = False, rng = streams)
+        replayed = realizations_df[(realizations_df.realization == r) & (realizations_df.value > 0)]
+        key = ['time', 'compartment']
+        assert np.array_equal(replayed.sort_values(key)['value'].to_numpy(), single_df.sort_values(key)['value'].to_numpy())
+    assert len(summary_df) == 31 * 3
+
+def test_batches_do_not_change_the_realizations(sir):
+    c, A, _ = sir
+    runs = [simulate_ensemble(c, A, sir_initial_conditions, 20, 6, realizations_per_batch = batch, verbosity = False, rng = RandomStreams(7))[0]
+            for batch in (1, 6)]
+    assert runs[0].reset_index(drop = True).equals(runs[1].reset_index(drop = True))
+
+def test_matrix_step_advances_each_column_as_a_single_run(sir):
+    c, A, _ = sir
+    V, R = A.shape[0], 4
+    streams = RandomStreams(7).realizations(0, R)
+    X = initialize_state(V, c, sir_initial_conditions, n_realizations = R, rng = streams)
+    X_next = {attribute: np.empty_like(states) for attribute, states in X.items()}
+    for _ in range(3):
+        advance_state(c, A, X, X_next, streams)
+        X, X_next = X_next, X
+    for r in range(R):
+        single_streams = RandomStreams(7).realization(r)
+        x = initialize_state(V, c, sir_initial_conditions, rng = single_streams)
+        x_next = {attribute: np.empty_like(states) for attribute, states in x.items()}
+        for _ in range(3):
+            advance_state(c, A, x, x_next, single_streams)
+            x, x_next = x_next, x
+        assert np.array_equal(X['compartment'][:, r], x['compartment'])
+    counts = count_states_per_realization(X['compartment'], 3)
+    assert np.array_equal(counts, [np.bincount(X['compartment'][:, r], minlength = 3) for r in range(R)])
+
+def test_summary_of_the_realizations(sir):
+    c, A, _ = sir
+    realizations_df, summary_df = simulate_ensemble(c, A, sir_initial_conditions, 20, 5, verbosity = False, rng = RandomStreams(7),
+                                                    quantiles = (0., 1.))
+    grouped = realizations_df.groupby(['compartment', 'time'])['value']
+    summary_df = summary_df.set_index(['compartment', 'time'])
+    assert np.allclose(summary_df['mean'], grouped.mean().loc[summary_df.index])
+    assert np.array_equal(summary_df['q0.0'], grouped.min().loc[summary_df.index])
+    assert np.array_equal(summary_df['q1.0'], grouped.max().loc[summary_df.index])
+    # Every realization keeps all the nodes
+    assert (realizations_df.groupby(['realization', 'time'])['value'].sum() == A.shape[0]).all()
@@ -0,0 +1,27 @@
+import numpy as np
+from conftest import er_adjacency, sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.frontier import FrontierState, simulate_frontier
+from utils.infection import initialize_simulation_from_adjacency, simulate_epidemic
+from utils.measurements_graph import Measure
+
+def test_bookkeeping_matches_the_state(sir):
+    c, A, X = sir
+    X = {attribute: states.copy() for attribute, states in X.items()}
+    state = FrontierState(c, A, X, rng = 5)
+    for _ in range(20):
+        state.step()
+        for (attribute, code), counts in state.counts.items():
+            expected = A.dot((X[attribute] == code).astype(np.int64))
+            assert np.array_equal(counts, expected)
+            assert np.array_equal(np.sort(state.frontier[(attribute, code)]), np.flatnonzero(expected > 0))
+        for (attribute, code), members in state.members.items():
+            assert np.array_equal(np.sort(members), np.flatnonzero(X[attribute] == code))
+
+def test_final_size_follows_the_discrete_engine():
+    # Supercritical epidemic on a dense graph, whose final size varies little between runs
+    dynamics = dict(sir_dynamics, infection = dict(sir_dynamics['infection'], prob = 0.01))
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(1000, 50), sir_attributes, dynamics, sir_initial_conditions, 1)
+    final_size = lambda df: df[(df.time == 40) & (df.compartment == 'removed')]['value'].sum()
+    mean_final_sizes = [np.mean([final_size(simulate(c, A, X, 40, Measure('aggregate'), verbosity = False, rng = seed)) for seed in range(10)])
+                        for simulate in (simulate_epidemic, simulate_frontier)]
+    assert abs(mean_final_sizes[0] - mean_final_sizes[1]) < 0.04 * A.shape[0]
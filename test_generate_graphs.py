@@ -0,0 +1,42 @@
+import os
+import sys
+import random
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'graphs'))
+import generate_graphs
+
+@pytest.mark.parametrize('model, arguments', [('ER', (2000, 0.005)), ('GNP', (2000, 0.005)), ('GNM', (2000, 5000)), ('BA', (2000, 3)),
+                                              ('PL', (2000, 2.5, 2)), ('WS', (2000, 3, 0.1)), ('SBM', (2000, 4, 0.01, 0.001))])
+def test_same_seed_same_graph(model, arguments):
+    first = generate_graphs.graph_models[model](*arguments, seed = 7)
+    second = generate_graphs.graph_models[model](*arguments, seed = 7)
+    other = generate_graphs.graph_models[model](*arguments, seed = 8)
+    assert np.array_equal(first[0], second[0]) and np.array_equal(first[1], second[1])
+    assert not (np.array_equal(first[0], other[0]) and np.array_equal(first[1], other[1]))
+
+def test_global_random_state_is_untouched():
+    random.seed(3)
+    expected = random.random()
+    random.seed(3)
+    generate_graphs.ER(500, 0.01, seed = 1)
+    assert random.random() == expected
+
+def test_edge_counts():
+    N, p = 4000, 0.002
+    sources, targets, _, _ = generate_graphs.GNP(N, p, seed = 0)
+    expected = p * N * (N - 1) / 2
+    assert abs(len(sources) - expected) < 5 * np.sqrt(expected)
+    assert (sources != targets).all() and len(np.unique(sources * N + targets)) == len(sources)
+    sources, targets, _, _ = generate_graphs.GNM(N, 10000, seed = 0)
+    assert len(np.unique(np.minimum(sources, targets) * N + np.maximum(sources, targets))) == 10000
+    sources, _, _, _ = generate_graphs.WS(N, 3, 0.0, seed = 0)
+    assert len(sources) == 3 * N
+    sources, _, _, _ = generate_graphs.BA(N, 2, seed = 0)
+    assert len(sources) <= 2 * (N - 1)
+
+def test_unknown_model_is_rejected(monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['generate_graphs.py', '-f', 'XY(10, 2)', '-o', 'unused.npz'])
+    with pytest.raises(ValueError, match = 'not implemented yet'):
+        generate_graphs.main()
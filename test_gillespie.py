@@ -0,0 +1,25 @@
+import numpy as np
+from conftest import er_adjacency, sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.gillespie import SumTree, simulate_gillespie
+from utils.infection import initialize_simulation_from_adjacency
+from utils.mean_field import simulate_mean_field
+from utils.measurements_graph import Measure
+
+def test_sum_tree_samples_proportionally_to_the_weights():
+    weights = np.array([0., 1., 3., 0., 4.])
+    tree = SumTree(weights)
+    assert tree.total() == 8
+    assert [tree.sample(u) for u in (0.5, 1.5, 3.9, 4.5, 7.9)] == [1, 2, 2, 4, 4]
+    tree.update(np.array([0, 4]), np.array([2., 0.]))
+    assert tree.total() == 6 and tree.sample(1.0) == 0
+
+def test_mean_final_size_follows_the_continuous_mean_field():
+    # Dense graph: the heterogeneous mean-field is close to the average of the stochastic runs
+    dynamics = dict(sir_dynamics, infection = dict(sir_dynamics['infection'], prob = 0.01))
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(1000, 50), sir_attributes, dynamics, sir_initial_conditions, 1)
+    final_size = lambda df: df[(df.time == 60) & (df.compartment == 'removed')]['value'].sum()
+    runs = [simulate_gillespie(c, A, X, 60, Measure('aggregate'), verbosity = False, rng = seed) for seed in range(8)]
+    mean_field = simulate_mean_field(c, A, 60, X = X, method = 'hmf', time = 'continuous')
+    assert abs(np.mean([final_size(run) for run in runs]) - final_size(mean_field)) < 0.04 * A.shape[0]
+    # The population is conserved at every measurement
+    assert (runs[0].groupby('time')['value'].sum() == A.shape[0]).all()
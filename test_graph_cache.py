@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import utils.graph_cache as graph_cache
+from utils.graph_cache import read_cached_adjacency
+from utils.infection import adjacency_from_edges
+
+def write_edges(path, seed):
+    np.savetxt(path, np.random.default_rng(seed).integers(0, 100, (300, 2)), fmt = '%d')
+
+def build_adjacency(graph_path):
+    edges = np.loadtxt(graph_path, dtype = np.int64)
+    builds.append(graph_path)
+    return adjacency_from_edges(edges[:, 0], edges[:, 1], 100, False), {'name': os.path.basename(graph_path)}, {}
+
+builds = []
+
+def test_cache_hits_and_invalidation(tmp_path, monkeypatch):
+    hashes = []
+    get_file_hash = graph_cache.get_file_hash
+    monkeypatch.setattr(graph_cache, 'get_file_hash', lambda path: hashes.append(path) or get_file_hash(path))
+    graph_path, cache_dir = str(tmp_path / 'graph.edges'), str(tmp_path / 'cache')
+    write_edges(graph_path, 0)
+    builds.clear()
+    A, meta, _ = read_cached_adjacency(graph_path, build_adjacency, cache_dir, verbosity = False)
+    cached, cached_meta, _ = read_cached_adjacency(graph_path, build_adjacency, cache_dir, verbosity = False)
+    # The second read neither builds the matrix nor hashes the file again, and maps the stored arrays
+    assert len(builds) == 1 and len(hashes) == 1
+    assert not cached.data.flags.writeable and not cached.data.flags.owndata and (cached != A).nnz == 0
+    assert cached_meta['sha1'] == get_file_hash(graph_path)
+    # A touched file is hashed again but keeps its entry
+    os.utime(graph_path, ns = (0, 0))
+    read_cached_adjacency(graph_path, build_adjacency, cache_dir, verbosity = False)
+    assert len(builds) == 1 and len(hashes) == 2
+    # A changed file gets a new entry
+    write_edges(graph_path, 1)
+    changed, _, _ = read_cached_adjacency(graph_path, build_adjacency, cache_dir, verbosity = False)
+    assert len(builds) == 2 and (changed != A).nnz > 0
@@ -0,0 +1,80 @@
+import numpy as np
+from utils.infection import simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.termination import Termination
+from utils.interventions import get_interventions
+
+time_steps = 60
+vaccination = {'vaccines': {'type': 'vaccination', 'state': 'susceptible', 'final_state': 'removed', 'fraction': 0.01}}
+
+def final_counts(df):
+    final = df[df.time == df.time.max()]
+    return dict(zip(final['compartment'], final['value']))
+
+def run(sir, settings, termination = None, rng = 5):
+    c, A, X = sir
+    return simulate_epidemic(c, A, X, time_steps, Measure('aggregate'), verbosity = False, rng = rng, termination = termination,
+                             interventions = get_interventions(settings, A.shape[0]))
+
+def test_vaccination_continues_after_the_epidemic_dies_out(sir):
+    c, A, X = sir
+    # No transmission: the state is absorbing as soon as the first infected nodes recover
+    X = {'compartment': np.where(X['compartment'] == c.encode('compartment', 'infected'), c.encode('compartment', 'removed'), X['compartment'])}
+    stopped = run((c, A, X), vaccination, Termination())
+    full = run((c, A, X), vaccination)
+    assert stopped.attrs.get('stop_reason') is None
+    assert final_counts(stopped) == final_counts(full)
+    assert final_counts(full)['susceptible'] < X['compartment'].shape[0] * 0.6
+
+def test_absorbing_stop_once_the_budget_is_spent(sir):
+    c, A, X = sir
+    X = {'compartment': np.where(X['compartment'] == c.encode('compartment', 'infected'), c.encode('compartment', 'removed'), X['compartment'])}
+    settings = {'vaccines': dict(vaccination['vaccines'], budget = 100)}
+    stopped = run((c, A, X), settings, Termination())
+    assert stopped.attrs['stop_reason'] == 'absorbing'
+    assert final_counts(stopped) == final_counts(run((c, A, X), settings))
+
+def test_interventions_reduce_the_final_size(sir):
+    base = final_counts(run(sir, {}))
+    quarantine = {'isolation': {'type': 'quarantine', 'state': 'infected', 'duration': 14}}
+    assert final_counts(run(sir, quarantine))['susceptible'] > base['susceptible']
+    degree = {'vaccines': dict(vaccination['vaccines'], target = 'degree')}
+    assert final_counts(run(sir, degree))['removed'] > 0
+
+def test_isolated_nodes_have_no_contacts(sir):
+    c, A, X = sir
+    interventions = get_interventions({'isolation': {'type': 'quarantine', 'state': 'infected', 'duration': 3}}, A.shape[0])
+    infected = np.flatnonzero(X['compartment'] == c.encode('compartment', 'infected'))
+    interventions.isolate(infected, 3)
+    masked = interventions.adjacency(A, 0)
+    assert np.shares_memory(masked.indices, A.indices)
+    assert masked[infected].sum() == 0 and masked[:, infected].sum() == 0
+    assert interventions.adjacency(A, 3) is A
+
+def test_absorbing_stop_when_the_trigger_cannot_fire(sir):
+    c, A, X = sir
+    X = {'compartment': np.where(X['compartment'] == c.encode('compartment', 'infected'), c.encode('compartment', 'removed'), X['compartment'])}
+    # Vaccinate only during an outbreak: no node can be infected any more, so the run is absorbed
+    settings = {'vaccines': dict(vaccination['vaccines'], trigger = {'state': 'infected', 'above': 0.01})}
+    stopped = run((c, A, X), settings, Termination())
+    assert stopped.attrs['stop_reason'] == 'absorbing' and stopped.attrs['stop_time'] == 0
+    assert final_counts(stopped) == final_counts(run((c, A, X), settings))
+    late = {'vaccines': dict(vaccination['vaccines'], trigger = lambda time, c, X: time >= 40)}
+    assert run((c, A, X), late, Termination()).attrs.get('stop_reason') is None
+
+def test_masks_follow_the_isolation_changes(sir):
+    c, A, X = sir
+    interventions = get_interventions({'isolation': {'type': 'quarantine', 'state': 'infected', 'duration': 3}}, A.shape[0])
+    rng = np.random.default_rng(0)
+    for time in range(6):
+        interventions.isolate(rng.choice(A.shape[0], 50, replace = False), time + rng.integers(1, 4))
+        isolated = interventions.is_isolated(time)
+        masked = interventions.adjacency(A, time)
+        expected = A.multiply(np.outer(~isolated, ~isolated)).toarray()
+        assert np.array_equal(masked.toarray(), expected)
+        if time > 0:
+            # Only the entries of the nodes whose isolation changed are rewritten
+            touched = np.zeros(A.nnz, dtype = bool)
+            touched[interventions.changed_positions] = True
+            assert np.array_equal(masked.data[~touched], previous[~touched])
+        previous = masked.data.copy()
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from conftest import er_adjacency, sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.infection import initialize_simulation_from_adjacency, simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.mean_field import simulate_mean_field, screen_mean_field
+
+dense_dynamics = dict(sir_dynamics, infection = dict(sir_dynamics['infection'], prob = 0.01))
+
+def final_size(curve_df, V):
+    final = curve_df[curve_df.time == curve_df.time.max()]
+    return V - final[final.compartment == 'susceptible']['value'].sum()
+
+@pytest.mark.parametrize('method, time', [('hmf', 'discrete'), ('hmf', 'continuous'), ('pair', 'continuous')])
+def test_mean_field_conserves_the_population(sir, method, time):
+    c, A, X = sir
+    curve_df = simulate_mean_field(c, A, 30, X = X, method = method, time = time)
+    assert list(curve_df.columns) == ['compartment', 'value', 'time']
+    assert np.allclose(curve_df.groupby('time')['value'].sum(), A.shape[0])
+    # The curves start from the counts of X
+    initial = curve_df[curve_df.time == 0].set_index('compartment')['value']
+    counts = np.bincount(X['compartment'], minlength = 3)
+    assert np.allclose([initial[name] for name in c.state_names('compartment')], counts)
+
+def test_discrete_mean_field_follows_the_average_run():
+    V = 2000
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(V, 50), sir_attributes, dense_dynamics, sir_initial_conditions, 1)
+    mean_field = simulate_mean_field(c, A, 80, X = X)
+    runs = [simulate_epidemic(c, A, X, 80, Measure('aggregate'), verbosity = False, rng = seed) for seed in range(5)]
+    assert abs(final_size(mean_field, V) - np.mean([final_size(run, V) for run in runs])) < 0.04 * V
+
+def test_pair_approximation_agrees_with_the_mean_field_on_dense_graphs():
+    V = 2000
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(V, 50), sir_attributes, dense_dynamics, sir_initial_conditions, 1)
+    hmf = simulate_mean_field(c, A, 80, X = X, time = 'continuous')
+    pair = simulate_mean_field(c, A, 80, X = X, method = 'pair', time = 'continuous')
+    assert abs(final_size(hmf, V) - final_size(pair, V)) < 0.04 * V
+    with pytest.raises(ValueError, match = 'only available in continuous time'):
+        simulate_mean_field(c, A, 80, X = X, method = 'pair')
+
+def test_screen_over_the_probability_grid(sir):
+    c, A, X = sir
+    screen_df = screen_mean_field(A, sir_attributes, sir_dynamics, sir_initial_conditions, {'infection': (0.02, 0.06, 3), 'recovery': [0.2]}, 10)
+    assert list(screen_df.columns) == ['prob_infection', 'prob_recovery', 'compartment', 'value', 'time']
+    assert np.allclose(sorted(screen_df['prob_infection'].unique()), [0.02, 0.04, 0.06])
+    assert len(screen_df) == 3 * 3 * 11
+    # A higher infection probability never gives a smaller epidemic
+    sizes = [final_size(curve_df, A.shape[0]) for _, curve_df in screen_df.groupby('prob_infection')]
+    assert sizes == sorted(sizes)
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.infection import simulate_epidemic
+from utils.measurements_graph import Measure, read_state_matrix
+
+time_steps = 20
+
+def streamed_run(sir, output_path):
+    c, A, X = sir
+    measure = Measure('detailed')
+    measure.stream_to(output_path)
+    return simulate_epidemic(c, A, X, time_steps, measure, verbosity = False, rng = 5).finalize()
+
+def test_npy_stream_gives_the_detailed_states(sir, tmp_path):
+    c, A, X = sir
+    detailed = simulate_epidemic(c, A, X, time_steps, Measure('detailed'), verbosity = False, rng = 5)
+    streamed_run(sir, str(tmp_path / 'states.npy'))
+    states, state_names, times, attribute = read_state_matrix(str(tmp_path / 'states.npy'))
+    assert isinstance(states, np.memmap) and states.dtype == np.int8 and states.shape == (time_steps + 1, A.shape[0])
+    assert state_names == c.state_names('compartment') and list(times) == list(range(time_steps + 1)) and attribute == 'compartment'
+    expected = detailed.pivot(index = 'time', columns = 'node_index', values = 'compartment').to_numpy()
+    assert np.array_equal(np.asarray(state_names, dtype = object)[states], expected)
+
+def test_parquet_stream_gives_the_detailed_frame(sir, tmp_path):
+    pytest.importorskip('pyarrow')
+    c, A, X = sir
+    detailed = simulate_epidemic(c, A, X, time_steps, Measure('detailed'), verbosity = False, rng = 5)
+    streamed = pd.read_parquet(streamed_run(sir, str(tmp_path / 'states.parquet')))
+    assert list(streamed.columns) == list(detailed.columns)
+    assert isinstance(streamed['compartment'].dtype, pd.CategoricalDtype)
+    for column in detailed.columns:
+        assert streamed[column].astype(str).tolist() == detailed[column].astype(str).tolist()
+
+def test_only_detailed_measurements_are_streamed(tmp_path):
+    with pytest.raises(ValueError, match = 'Only detailed measurements'):
+        Measure('aggregate').stream_to(str(tmp_path / 'states.npy'))
+    with pytest.raises(ValueError, match = 'Streaming not implemented'):
+        Measure('detailed').stream_to(str(tmp_path / 'states.csv'))
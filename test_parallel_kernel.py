@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from utils.infection import simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.interventions import get_interventions
+from utils.parallel_kernel import ParallelKernel
+from utils.rng import RandomStreams, RULE_STREAM
+from utils.partitioned import PartitionedAdjacency, save_partitioned_adjacency
+from utils.temporal import TemporalAdjacency, save_temporal_adjacency
+
+@pytest.mark.parametrize('threads', [2, 3, 8])
+def test_threads_give_the_serial_run(sir, threads):
+    c, A, X = sir
+    serial = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    parallel = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5, threads = threads)
+    assert parallel.equals(serial)
+
+def test_kernel_neighbor_counts(sir):
+    c, A, X = sir
+    kernel = ParallelKernel(A, 3)
+    mask = X['compartment'] == c.encode('compartment', 'infected')
+    assert np.array_equal(kernel.neighbor_counts(mask), A.dot(mask.astype(np.float64)))
+    assert np.array_equal(kernel.flatnonzero_equal(X['compartment'], 0), np.flatnonzero(X['compartment'] == 0))
+
+def test_threads_on_a_temporal_graph(sir, tmp_path):
+    c, A, X = sir
+    # Two windows: the whole graph, then a random half of its edges
+    half = A.multiply(np.random.default_rng(0).random(A.shape) < 0.5).tocsr()
+    temporal_path = str(tmp_path / 'er.temporal')
+    save_temporal_adjacency([A, (half + half.T).tocsr()], temporal_path, {'name': 'ER'})
+    temporal = TemporalAdjacency(temporal_path, steps_per_window = 5)
+    serial = simulate_epidemic(c, temporal, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    assert simulate_epidemic(c, temporal, X, 30, Measure('detailed'), verbosity = False, rng = 5, threads = 3).equals(serial)
+
+def test_threads_rejected_on_partitioned_graphs(sir, tmp_path):
+    c, A, X = sir
+    save_partitioned_adjacency(A, str(tmp_path / 'er.parts'), 2, {'name': 'ER'})
+    with pytest.raises(ValueError, match = 'Threads are only available'):
+        simulate_epidemic(c, PartitionedAdjacency(str(tmp_path / 'er.parts')), X, 10, Measure('aggregate'), verbosity = False, rng = 5, threads = 2)
+
+def test_kernel_blocks_share_the_matrix(sir):
+    c, A, X = sir
+    kernel = ParallelKernel(A.copy(), 3)
+    assert all(np.shares_memory(block.data, kernel.A.data) for block in kernel.blocks)
+
+def test_threads_with_quarantine(sir):
+    c, A, X = sir
+    # Masks updated in place between the steps
+    quarantine = {'isolation': {'type': 'quarantine', 'state': 'infected', 'duration': 3, 'probability': 0.5}}
+    runs = [simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5, threads = threads,
+                              interventions = get_interventions(quarantine, A.shape[0])) for threads in (1, 3)]
+    assert runs[1].equals(runs[0])
+
+@pytest.mark.parametrize('n_blocks', [1, 2, 7])
+def test_parallel_draws_are_the_serial_draws(n_blocks):
+    serial = RandomStreams(3, block_size = 1000).realization(0).stream(RULE_STREAM)
+    parallel = RandomStreams(3, block_size = 1000).realization(0).stream(RULE_STREAM)
+    executor = ThreadPoolExecutor(max_workers = 2)
+    # Requests smaller and larger than a block, starting in a partly used block
+    for n in (10, 5000, 300, 12345, 1):
+        assert np.array_equal(parallel.random_blocks(n, executor, n_blocks), serial.random(n))
+    executor.shutdown()
+
+def test_kernel_blocks_cover_the_rows(sir):
+    c, A, X = sir
+    kernel = ParallelKernel(A, 3)
+    assert kernel.row_bounds[0] == 0 and kernel.row_bounds[-1] == A.shape[0] and (np.diff(kernel.row_bounds) >= 0).all()
+    assert sum(block.nnz for block in kernel.blocks) == A.nnz
+    # Blocks have about the same number of non-zeros
+    assert max(block.nnz for block in kernel.blocks) < 2 * A.nnz / kernel.n_blocks
+    covered = np.zeros(A.shape[0], dtype = np.int64)
+    def mark(first, last):
+        covered[first:last] += 1
+    kernel.map_chunks(mark, A.shape[0])
+    assert (covered == 1).all()
+    # Masks of a batch of realizations
+    mask = np.random.default_rng(0).random((A.shape[0], 4)) < 0.1
+    assert np.array_equal(kernel.neighbor_counts(mask), A.dot(mask.astype(np.float64)))
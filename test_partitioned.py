@@ -0,0 +1,44 @@
+import numpy as np
+from conftest import sir_initial_conditions
+from utils.ensemble import simulate_ensemble
+from utils.infection import simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.partitioned import PartitionedAdjacency, save_partitioned_adjacency
+from utils.rng import RandomStreams
+
+def get_partitioned(A, directory, n_partitions = 4):
+    save_partitioned_adjacency(A, directory, n_partitions, {'name': 'ER'})
+    return PartitionedAdjacency(directory)
+
+def test_partitions_give_the_whole_matrix_run(sir, tmp_path):
+    c, A, X = sir
+    partitioned = get_partitioned(A, str(tmp_path / 'er.parts'))
+    assert len(partitioned) == 4 and partitioned.sum() == A.sum()
+    whole = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    assert simulate_epidemic(c, partitioned, X, 30, Measure('detailed'), verbosity = False, rng = 5).equals(whole)
+
+def test_partitioned_ensemble(sir, tmp_path):
+    c, A, _ = sir
+    partitioned = get_partitioned(A, str(tmp_path / 'er.parts'), 3)
+    runs = [simulate_ensemble(c, graph, sir_initial_conditions, 20, 4, verbosity = False, rng = RandomStreams(7))[0] for graph in (A, partitioned)]
+    assert runs[0].equals(runs[1])
+
+def test_halo_exchange_at_the_boundaries(sir, tmp_path):
+    c, A, X = sir
+    partitioned = get_partitioned(A, str(tmp_path / 'er.parts'))
+    states = np.random.default_rng(0).integers(0, 3, (A.shape[0], 2)).astype(np.int8)
+    rows = 0
+    for partition in partitioned.partitions:
+        assert partition.first == rows
+        rows = partition.last
+        # The halo is every neighbor outside the partition
+        neighbors = np.unique(A[partition.first:partition.last].indices)
+        outside = neighbors[(neighbors < partition.first) | (neighbors >= partition.last)]
+        assert np.array_equal(partition.halo, outside)
+        local_states = partition.gather(states)
+        assert np.array_equal(local_states, states[np.concatenate([np.arange(partition.first, partition.last), outside])])
+        # Local counts are the counts of the whole matrix on the owned rows
+        mask = local_states == c.encode('compartment', 'infected')
+        expected = A[partition.first:partition.last].dot((states == c.encode('compartment', 'infected')).astype(np.float64))
+        assert np.array_equal(partition.neighbor_counts(mask), expected)
+    assert rows == A.shape[0]
@@ -0,0 +1,36 @@
+import numpy as np
+from conftest import er_adjacency, sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.infection import initialize_simulation_from_adjacency, simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.rng import RandomStreams, RULE_STREAM, EVENT_STREAM, draw_per_realization
+
+def test_substreams_do_not_depend_on_the_order_of_the_draws():
+    first = RandomStreams(7).realization(3)
+    expected = first.stream(RULE_STREAM, 1).random(1000).copy()
+    # Drawing from other substreams and realizations first does not shift the draws
+    second = RandomStreams(7).realization(3)
+    second.stream(RULE_STREAM, 0).random(500)
+    second.stream(EVENT_STREAM).random(100)
+    RandomStreams(7).realization(2).stream(RULE_STREAM, 1).random(100)
+    assert np.array_equal(second.stream(RULE_STREAM, 1).random(1000), expected)
+    # The substreams are distinct
+    assert not np.array_equal(first.stream(RULE_STREAM, 0).random(1000), expected)
+    assert not np.array_equal(RandomStreams(7).realization(4).stream(RULE_STREAM, 1).random(1000), expected)
+
+def test_values_do_not_depend_on_the_request_sizes():
+    expected = RandomStreams(7, block_size = 100).realization(0).stream(RULE_STREAM).random(1000).copy()
+    stream = RandomStreams(7, block_size = 64).realization(0).stream(RULE_STREAM)
+    sample = np.concatenate([stream.random(n) for n in (1, 63, 200, 0, 736)])
+    assert np.array_equal(sample, expected)
+
+def test_draws_per_realization_come_from_each_realization():
+    streams = RandomStreams(7).realizations(0, 3)
+    sample = draw_per_realization(streams, RULE_STREAM, 0, np.array([0, 0, 2, 2, 2]))
+    expected = [RandomStreams(7).realization(r).stream(RULE_STREAM, 0).random(n) for r, n in ((0, 2), (2, 3))]
+    assert np.array_equal(sample, np.concatenate(expected))
+
+def test_same_seed_same_run():
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(), sir_attributes, sir_dynamics, sir_initial_conditions, RandomStreams(3))
+    runs = [simulate_epidemic(c, A, X, 20, Measure('aggregate'), verbosity = False, rng = RandomStreams(seed)) for seed in (3, 3, 4)]
+    assert runs[0].equals(runs[1])
+    assert not runs[0].equals(runs[2])
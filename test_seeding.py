@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from utils.initialize_data import initialize_state
+from utils.seeding import Seeding, get_seeding
+
+def seeded_states(sir, options):
+    c, A, X = sir
+    seeding = get_seeding(options, A)
+    assert isinstance(seeding, Seeding)
+    return c, initialize_state(A.shape[0], c, {'compartment': {'susceptible': 1.0, 'infected': 0.0, 'removed': 0.0}}, rng = 1, seeding = seeding)['compartment']
+
+def test_file_seeding_reads_names_and_codes(sir, tmp_path):
+    c, A, _ = sir
+    names = np.array(c.state_names('compartment'))
+    expected = np.random.default_rng(0).integers(0, 3, A.shape[0])
+    (tmp_path / 'names.txt').write_text('\n'.join(names[expected]))
+    (tmp_path / 'codes.txt').write_text('\n'.join(map(str, expected)))
+    np.save(tmp_path / 'codes.npy', expected)
+    np.save(tmp_path / 'names.npy', names[expected])
+    for file_name in ('names.txt', 'codes.txt', 'codes.npy', 'names.npy'):
+        _, states = seeded_states(sir, {'strategy': 'file', 'path': str(tmp_path / file_name)})
+        assert np.array_equal(states, expected)
+
+def test_file_seeding_of_listed_nodes(sir, tmp_path):
+    (tmp_path / 'seeds.csv').write_text('3,infected\n7,2\n')
+    c, states = seeded_states(sir, {'strategy': 'file', 'path': str(tmp_path / 'seeds.csv')})
+    assert states[3] == c.encode('compartment', 'infected') and states[7] == c.encode('compartment', 'removed')
+    assert np.count_nonzero(states) == 2
+
+def test_file_seeding_rejects_unknown_states(sir, tmp_path):
+    (tmp_path / 'seeds.csv').write_text('3,exposed\n7,5\n')
+    with pytest.raises(ValueError, match = 'not found'):
+        seeded_states(sir, {'strategy': 'file', 'path': str(tmp_path / 'seeds.csv')})
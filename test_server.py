@@ -0,0 +1,35 @@
+import os
+from utils.server import GraphStore
+
+def test_graph_store_reuses_graphs(tmp_path):
+    path = tmp_path / 'graph.edges'
+    path.write_text('0 1\n')
+    store = GraphStore(max_graphs = 2)
+    loads = []
+    load = lambda: loads.append(1) or len(loads)
+    assert store.get(str(path), {'directed': False}, load) == 1
+    assert store.get(str(path), {'directed': False}, load) == 1
+    assert store.get(str(path), {'directed': True}, load) == 2
+    assert len(loads) == 2
+
+def test_graph_store_drops_modified_files(tmp_path):
+    path = tmp_path / 'graph.edges'
+    path.write_text('0 1\n')
+    store = GraphStore(max_graphs = 2)
+    store.get(str(path), {}, lambda: 'old')
+    os.utime(path, (0, os.path.getmtime(path) + 10))
+    assert store.get(str(path), {}, lambda: 'new') == 'new'
+    assert len(store) == 1
+
+def test_graph_store_evicts_the_least_recently_used(tmp_path):
+    paths = [tmp_path / f'graph_{k}.edges' for k in range(3)]
+    for path in paths:
+        path.write_text('0 1\n')
+    store = GraphStore(max_graphs = 2)
+    store.get(str(paths[0]), {}, lambda: 0)
+    store.get(str(paths[1]), {}, lambda: 1)
+    store.get(str(paths[0]), {}, lambda: None)
+    store.get(str(paths[2]), {}, lambda: 2)
+    assert len(store) == 2
+    assert store.get(str(paths[0]), {}, lambda: 'reloaded') == 0
+    assert store.get(str(paths[1]), {}, lambda: 'reloaded') == 'reloaded'
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import pytest
+from conftest import er_adjacency, sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.sweep import build_sweep_grid, run_sweep
+from utils.infection import initialize_simulation_from_adjacency, simulate_epidemic
+from utils.interventions import get_interventions
+from utils.measurements_graph import Measure
+from utils.rng import RandomStreams
+
+def sweep(runs_dir, time_steps = 20, dynamics = sir_dynamics, experiment_options = None):
+    runs = build_sweep_grid({'infection': [0.03, 0.06]}, ['er.npz'], [1, 2])
+    return run_sweep(runs, lambda graph_path: er_adjacency(), sir_attributes, dynamics, [sir_initial_conditions], time_steps, runs_dir,
+                     max_workers = 2, verbosity = False, experiment_options = experiment_options)
+
+def run_files(runs_dir):
+    return {name: os.path.getmtime(os.path.join(runs_dir, name)) for name in os.listdir(runs_dir)}
+
+def test_sweep_resume(tmp_path):
+    runs_dir = str(tmp_path)
+    sweep_df = sweep(runs_dir)
+    files = run_files(runs_dir)
+    assert len(files) == 4
+    # An interrupted sweep only runs the missing runs, with the same results
+    removed = sorted(files)[0]
+    os.remove(os.path.join(runs_dir, removed))
+    resumed_df = sweep(runs_dir)
+    assert resumed_df.equals(sweep_df)
+    assert {name: mtime for name, mtime in run_files(runs_dir).items() if name != removed} == {name: mtime for name, mtime in files.items() if name != removed}
+
+def test_sweep_reruns_changed_configurations(tmp_path):
+    runs_dir = str(tmp_path)
+    sweep(runs_dir)
+    sweep(runs_dir, time_steps = 30)
+    recovery = dict(sir_dynamics, recovery = dict(sir_dynamics['recovery'], prob = 0.1))
+    sweep_df = sweep(runs_dir, dynamics = recovery)
+    assert len(run_files(runs_dir)) == 12
+    assert sweep_df['time'].max() == 20
+
+def test_sweep_applies_the_interventions(tmp_path):
+    options = {'stop_when_absorbed': False, 'steady_state_tolerance': None, 'steady_state_window': 20, 'horizon': 'pad', 'seeding': None,
+               'interventions': {'vaccines': {'type': 'vaccination', 'fraction': 0.02}}}
+    sweep_df = sweep(str(tmp_path / 'vaccinated'), experiment_options = options)
+    # Each run is the single run with the same seed and interventions
+    run = sweep_df[(sweep_df.seed == 1) & (sweep_df.prob_infection == 0.03)]
+    dynamics = dict(sir_dynamics, infection = dict(sir_dynamics['infection'], prob = 0.03))
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(), sir_attributes, dynamics, sir_initial_conditions, RandomStreams(1))
+    single = simulate_epidemic(c, A, X, 20, Measure('aggregate'), verbosity = False, rng = RandomStreams(1),
+                               interventions = get_interventions(options['interventions'], A.shape[0]))
+    assert np.array_equal(run['value'].to_numpy(), single['value'].to_numpy())
+    assert not sweep(str(tmp_path / 'none'))['value'].equals(sweep_df['value'])
+    with pytest.raises(ValueError, match = 'only available with the discrete engine'):
+        run_sweep([], er_adjacency, sir_attributes, sir_dynamics, [sir_initial_conditions], 20, str(tmp_path), engine = 'frontier', experiment_options = options)
@@ -0,0 +1,32 @@
+import json
+import pytest
+from utils.infection import simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.telemetry import Telemetry, telemetry_phases
+
+def test_records_of_a_run(sir, tmp_path):
+    c, A, X = sir
+    path = str(tmp_path / 'telemetry.jsonl')
+    records = []
+    telemetry = Telemetry(path, callback = records.append, every = 5)
+    instrumented = simulate_epidemic(c, A, X, 20, Measure('aggregate'), verbosity = False, rng = 5, telemetry = telemetry)
+    telemetry.close()
+    with open(path) as telemetry_file:
+        assert [json.loads(line) for line in telemetry_file] == json.loads(json.dumps(records))
+    # Instrumentation does not change the run
+    assert instrumented.equals(simulate_epidemic(c, A, X, 20, Measure('aggregate'), verbosity = False, rng = 5))
+    # The last record times the final measurement, after the last step
+    assert [record['time'] for record in records] == [5, 10, 15, 20, 20]
+    assert [record['steps'] for record in records] == [5, 5, 5, 5, 0]
+    assert [phase for phase, seconds in records[-1]['phases'].items() if seconds > 0] == ['measure']
+    for record in records:
+        assert list(record['phases']) == telemetry_phases
+        assert record['wall_seconds'] >= sum(record['phases'].values())
+        assert sum(record['counts'].values()) == A.shape[0]
+        assert record['peak_rss_mb'] > 0
+    final = instrumented[instrumented.time == 20].set_index('compartment')['value']
+    assert all(records[-1]['counts'][name] == final.get(name, 0) for name in c.state_names('compartment'))
+
+def test_records_need_a_positive_period():
+    with pytest.raises(ValueError, match = 'every positive number of steps'):
+        Telemetry(every = 0)
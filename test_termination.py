@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+from conftest import er_adjacency, sir_attributes, sir_dynamics, sir_initial_conditions
+from utils.engines import get_simulation_engine
+from utils.infection import initialize_simulation_from_adjacency
+from utils.measurements_graph import Measure
+from utils.termination import Termination, get_termination, is_absorbing
+from utils.input_handler import read_experiment_options
+
+time_steps = 200
+
+@pytest.fixture
+def subcritical():
+    """
+    SIR model whose epidemic dies out long before time_steps.
+    """
+    dynamics = dict(sir_dynamics, infection = dict(sir_dynamics['infection'], prob = 0.01), recovery = dict(sir_dynamics['recovery'], prob = 0.5))
+    return initialize_simulation_from_adjacency(er_adjacency(), sir_attributes, dynamics, sir_initial_conditions, 1)
+
+@pytest.mark.parametrize('engine', ['discrete', 'frontier'])
+def test_padded_stop_gives_the_full_run(subcritical, engine):
+    c, A, X = subcritical
+    simulate = get_simulation_engine(engine)
+    full = simulate(c, A, X, time_steps, Measure('aggregate'), verbosity = False, rng = 5)
+    padded = simulate(c, A, X, time_steps, Measure('aggregate'), verbosity = False, rng = 5, termination = Termination())
+    assert padded.attrs['stop_reason'] == 'absorbing' and padded.attrs['stop_time'] < time_steps
+    assert padded.reset_index(drop = True).equals(full.reset_index(drop = True))
+
+def test_truncated_stop_ends_at_the_stop_time(subcritical):
+    c, A, X = subcritical
+    simulate = get_simulation_engine('discrete')
+    full = simulate(c, A, X, time_steps, Measure('aggregate'), verbosity = False, rng = 5)
+    truncated = simulate(c, A, X, time_steps, Measure('aggregate'), verbosity = False, rng = 5, termination = Termination(horizon = 'truncate'))
+    stop_time = truncated.attrs['stop_time']
+    assert truncated['time'].max() == stop_time
+    assert truncated.reset_index(drop = True).equals(full[full.time <= stop_time].reset_index(drop = True))
+    # Absorbing: the state at the stop is final
+    final = full[full.time == stop_time]['value'].to_numpy()
+    assert np.array_equal(full[full.time == time_steps]['value'].to_numpy(), final)
+
+def test_no_early_stop_by_default():
+    epidemics_path = os.path.join(os.path.dirname(__file__), 'epidemics.ini')
+    assert get_termination(read_experiment_options(epidemics_path)) is None
+
+def test_steady_state_stop_at_the_first_flat_window():
+    # SIS model: an endemic state that is never absorbing
+    attributes = {'compartment': ['susceptible', 'infected']}
+    dynamics = {'infection': dict(sir_dynamics['infection'], prob = 0.1), 'recovery': dict(sir_dynamics['recovery'], final_state = 'susceptible')}
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(), attributes, dynamics, {'compartment': {'susceptible': 0.9, 'infected': 0.1}}, 1)
+    termination = Termination(absorbing = False, steady_state_tolerance = 0.04, steady_state_window = 10, horizon = 'truncate')
+    truncated = get_simulation_engine('discrete')(c, A, X, time_steps, Measure('aggregate'), verbosity = False, rng = 5, termination = termination)
+    stop_time = truncated.attrs['stop_time']
+    assert truncated.attrs['stop_reason'] == 'steady_state' and stop_time < time_steps
+    infected = truncated[truncated.compartment == 'infected'].set_index('time')['value'].reindex(range(stop_time + 1), fill_value = 0).to_numpy() / A.shape[0]
+    spreads = np.array([np.ptp(infected[t - 9:t + 1]) for t in range(9, stop_time + 1)])
+    assert spreads[-1] <= 0.04 and (spreads[:-1] > 0.04).all()
+    assert infected[-1] > 0.4
+
+def test_absorbing_states(subcritical):
+    c, A, X = subcritical
+    assert not is_absorbing(c, X)
+    X = {'compartment': np.full_like(X['compartment'], c.encode('compartment', 'removed'))}
+    assert is_absorbing(c, X)
+    # A batch is absorbing only when every realization is
+    batch = np.stack([X['compartment'], X['compartment']], axis = 1)
+    batch[0, 1] = c.encode('compartment', 'infected')
+    assert not is_absorbing(c, {'compartment': batch})
+    with pytest.raises(ValueError, match = 'Horizon stop not implemented yet'):
+        Termination(horizon = 'stop')
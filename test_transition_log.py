@@ -0,0 +1,50 @@
+import numpy as np
+from utils.infection import simulate_epidemic, get_state_changes
+from utils.measurements_graph import Measure
+from utils.transition_log import read_transition_log
+
+def test_log_reconstructs_the_state(sir, tmp_path):
+    c, A, X = sir
+    log = simulate_epidemic(c, A, X, 30, Measure('transitions'), verbosity = False, rng = 5)
+    detailed = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    log.save(str(tmp_path / 'log.npz'))
+    loaded = read_transition_log(str(tmp_path / 'log.npz'))
+    names = np.asarray(c.state_names('compartment'))
+    for t in (0, 7, 30):
+        expected = detailed[detailed.time == t].sort_values('node_index')['compartment'].to_numpy()
+        assert np.array_equal(names[log.state_at(t)], expected)
+        assert np.array_equal(loaded.state_at(t), log.state_at(t))
+
+def test_log_events_follow_the_rules(sir):
+    c, A, X = sir
+    events = simulate_epidemic(c, A, X, 30, Measure('transitions'), verbosity = False, rng = 5).events_df()
+    assert len(events) > 0
+    assert set(zip(events['from'], events['to'], events['rule_name'])) == {('susceptible', 'infected', 'infection'), ('infected', 'removed', 'recovery')}
+
+def test_state_changes_of_many_rules():
+    # More rules and interventions than an int8 holds
+    X_t, X_t_plus_1 = {'compartment': np.zeros(300, dtype = np.int8)}, {'compartment': np.ones(300, dtype = np.int8)}
+    rule = type('Rule', (), {'attribute': 'compartment'})
+    updates = [(rule, np.arange(300) == k) for k in range(300)]
+    nodes, _, _, rule_indices = get_state_changes(X_t, X_t_plus_1, updates, 'compartment')
+    assert np.array_equal(rule_indices, nodes)
+
+def test_replayed_events_give_every_detailed_state(sir, tmp_path):
+    c, A, X = sir
+    log = simulate_epidemic(c, A, X, 30, Measure('transitions'), verbosity = False, rng = 5)
+    detailed = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5)
+    aggregate = simulate_epidemic(c, A, X, 30, Measure('aggregate'), verbosity = False, rng = 5)
+    states = detailed.pivot(index = 'time', columns = 'node_index', values = 'compartment').to_numpy()
+    events = log.events_df()
+    replayed = np.asarray(c.state_names('compartment'), dtype = object)[log.initial_state]
+    assert np.array_equal(replayed, states[0])
+    for t in range(1, 31):
+        step = events[events.time == t]
+        # One event per node changed in the step, starting from the state of the node
+        assert np.array_equal(np.sort(step['node_index'].to_numpy()), np.flatnonzero(states[t] != states[t - 1]))
+        assert np.array_equal(replayed[step['node_index']], step['from'].to_numpy())
+        replayed[step['node_index']] = step['to'].to_numpy()
+        assert np.array_equal(replayed, states[t])
+    key = ['time', 'compartment']
+    for curves in (log.aggregate(), read_transition_log(log.save(str(tmp_path / 'log.npz'))).aggregate()):
+        assert curves.sort_values(key).reset_index(drop = True).equals(aggregate.sort_values(key).reset_index(drop = True)[curves.columns])
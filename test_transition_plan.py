@@ -0,0 +1,42 @@
+import numpy as np
+from conftest import er_adjacency, sir_attributes, sir_dynamics
+from utils.infection import initialize_simulation_from_adjacency, choose_competing_rules, sample_transitions
+
+sird_attributes = {'compartment': sir_attributes['compartment'] + ['dead']}
+sird_dynamics = dict(sir_dynamics, death = {'name': 'death', 'attribute': 'compartment', 'initial_state': 'infected', 'triggering_state': None,
+                                            'final_state': 'dead', 'prob': 0.1, 'mode': 'rate'})
+sird_initial_conditions = {'compartment': {'susceptible': 0.5, 'infected': 0.5, 'removed': 0.0, 'dead': 0.0}}
+
+def test_competing_rules_fire_with_the_total_hazard():
+    hazards = np.repeat([[0.3], [0.1]], 100000, axis = 1)
+    # Evenly spaced samples: the fractions are exact up to the spacing
+    sample = (np.arange(100000) + 0.5) / 100000
+    choice = choose_competing_rules(hazards, sample)
+    assert abs(np.mean(choice >= 0) - (1 - np.exp(-0.4))) < 1e-4
+    assert abs(np.mean(choice == 0) / np.mean(choice >= 0) - 0.75) < 1e-4
+    # A single rule fires with its own probability
+    choice = choose_competing_rules(hazards[:1], sample)
+    assert abs(np.mean(choice == 0) - (1 - np.exp(-0.3))) < 1e-4
+
+def test_plan_groups_the_rules_by_initial_state():
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(), sird_attributes, sird_dynamics, sird_initial_conditions, 1)
+    plan = c.get_plan()
+    infected = c.encode('compartment', 'infected')
+    assert sorted(plan.groups) == [('compartment', c.encode('compartment', 'susceptible')), ('compartment', infected)]
+    group = plan.groups[('compartment', infected)]
+    assert [c.transition_rules[k].name for k in group.rule_indices] == ['recovery', 'death']
+    assert group.triggers == [None, None]
+    assert plan.trigger_keys == [('compartment', infected)]
+    assert c.get_plan() is plan
+
+def test_competing_rules_split_the_infected_nodes():
+    c, A, X = initialize_simulation_from_adjacency(er_adjacency(20000), sird_attributes, sird_dynamics, sird_initial_conditions, 1)
+    infected = X['compartment'] == c.encode('compartment', 'infected')
+    fired = dict(zip([transition.name for transition in c.transition_rules], sample_transitions(c, A, X, rng = 2)))
+    # Only infected nodes recover or die, never both
+    assert not ((fired['recovery'] | fired['death']) & ~infected).any()
+    assert not (fired['recovery'] & fired['death']).any()
+    recovery_hazard, death_hazard = -np.log(0.8), -np.log(0.9)
+    left = np.count_nonzero(fired['recovery'] | fired['death'])
+    assert abs(left / np.count_nonzero(infected) - (1 - 0.8 * 0.9)) < 0.02
+    assert abs(np.count_nonzero(fired['recovery']) / left - recovery_hazard / (recovery_hazard + death_hazard)) < 0.03
@@ -0,0 +1,43 @@
+import numpy as np
+from utils.infection import adjacency_from_edges, simulate_epidemic
+from utils.measurements_graph import Measure
+from utils.interventions import get_interventions
+from utils.weighted import EdgeHazards, get_edge_hazards, get_weighted_neighbor_hazards
+
+def test_unit_weights_give_the_unweighted_run(sir):
+    c, A, X = sir
+    weighted = A.astype(np.float64)
+    for threads in (1, 3):
+        unweighted_df = simulate_epidemic(c, A, X, 30, Measure('detailed'), verbosity = False, rng = 5, threads = threads)
+        weighted_df = simulate_epidemic(c, weighted, X, 30, Measure('detailed'), verbosity = False, rng = 5, threads = threads)
+        assert weighted_df.equals(unweighted_df)
+
+def test_edge_hazards_are_cached_per_hazard():
+    rng = np.random.default_rng(0)
+    A = adjacency_from_edges(rng.integers(0, 50, 200), rng.integers(0, 50, 200), 50, False, weights = rng.random(200))
+    mask = rng.random(50) < 0.3
+    hazard = -np.log1p(-0.2)
+    expected = np.array([sum(-np.log1p(-0.2 * A[i, j]) for j in np.flatnonzero(mask) if A[i, j] != 0) for i in range(50)])
+    edge_hazards = EdgeHazards(A)
+    assert np.allclose(get_weighted_neighbor_hazards(edge_hazards, mask, hazard), expected)
+    assert edge_hazards.get(hazard) is edge_hazards.get(hazard)
+    assert edge_hazards.get(hazard) is not edge_hazards.get(2 * hazard)
+    # The cache belongs to the matrix it was built on
+    assert get_edge_hazards(edge_hazards, A) is edge_hazards and get_edge_hazards(edge_hazards, A.copy()) is not edge_hazards
+    # Changed weights are recomputed in place
+    A.data[:10] = 0
+    edge_hazards.update(np.arange(10))
+    assert np.allclose(edge_hazards.get(hazard).data, EdgeHazards(A).get(hazard).data)
+
+def test_repeated_edges_are_merged():
+    A = adjacency_from_edges(np.array([0, 0]), np.array([1, 1]), 2, True, weights = np.array([0.25, 0.5]))
+    hazard = -np.log1p(-0.4)
+    assert np.isclose(get_weighted_neighbor_hazards(EdgeHazards(A), np.array([True, False]), hazard)[1], -np.log1p(-0.4 * 0.75))
+
+def test_unit_weights_with_masked_edges(sir):
+    c, A, X = sir
+    quarantine = {'isolation': {'type': 'quarantine', 'state': 'infected', 'duration': 3, 'probability': 0.5}}
+    for threads in (1, 3):
+        runs = [simulate_epidemic(c, graph, X, 30, Measure('detailed'), verbosity = False, rng = 5, threads = threads,
+                                  interventions = get_interventions(quarantine, A.shape[0])) for graph in (A, A.astype(np.float64))]
+        assert runs[1].equals(runs[0])
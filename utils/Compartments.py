@@ -1,3 +1,5 @@
+import numpy as np
+
 class TransitionRule:
     def __init__(self):
         self.name = None
@@ -9,27 +11,24 @@ class TransitionRule:
         self.mode = None
         
     def _validate_dynamics(self, attributes):
-        available_attributes = ['compartment']
+        available_attributes = list(attributes.keys())
         available_modes = ['rate', 'neighbor']
 
         if self.attribute is None:
             raise RuntimeError("Attribute not initialized")
         if self.attribute not in available_attributes:
             raise RuntimeError(f"Attribute should be equal to one of these: {', '.join(map(str, available_attributes))}")
+        states_name = attributes[self.attribute]
 
         if self.initial_state is None:
             raise RuntimeError("Initial state not initialized")
-        if self.attribute == 'compartment':
-            compartments_name = attributes['compartment']
-            if self.initial_state not in compartments_name:
-                raise RuntimeError(f"Initial state should be equal to one of these: {', '.join(map(str, compartments_name))}")
+        if self.initial_state not in states_name:
+            raise RuntimeError(f"Initial state should be equal to one of these: {', '.join(map(str, states_name))}")
 
         if self.final_state is None:
             raise RuntimeError("Final state not initialized")
-        if self.attribute == 'compartment':
-            compartments_name = attributes['compartment']
-            if self.final_state not in compartments_name:
-                raise RuntimeError(f"Final state should be equal to one of these: {', '.join(map(str, compartments_name))}")
+        if self.final_state not in states_name:
+            raise RuntimeError(f"Final state should be equal to one of these: {', '.join(map(str, states_name))}")
         
         if self.prob is None:
             raise RuntimeError("Probability not initialized")
@@ -38,12 +37,10 @@ class TransitionRule:
         if self.mode is None:
             raise RuntimeError("Mode not initialized")
         if self.mode not in available_modes:
-            raise RuntimeError(f"Mode should be equal to one of these: {', '.join(map(str, compartments_name))}")
+            raise RuntimeError(f"Mode should be equal to one of these: {', '.join(map(str, available_modes))}")
         if self.mode == 'neighbor':
-            if self.attribute == 'compartment':
-                compartments_name = attributes['compartment']
-                if self.triggering_state not in compartments_name:
-                    raise RuntimeError(f"Triggering state should be equal to one of these: {', '.join(map(str, compartments_name))}")
+            if self.triggering_state not in states_name:
+                raise RuntimeError(f"Triggering state should be equal to one of these: {', '.join(map(str, states_name))}")
 
         return True
 
@@ -58,14 +55,81 @@ class TransitionRule:
                 f"Check Status: {self.check_status}")
 
 
+class TransitionGroup:
+    """
+    Rules sharing the same attribute and initial state. They compete on the same nodes:
+    each rule k has hazard h_k = -log(1 - p_k) ('rate') or h_k = -n log(1 - p_k) with n neighbors in the
+    triggering state ('neighbor'), a node fires with probability 1 - exp(-sum_k h_k) and, if it does,
+    it follows rule k with probability h_k / sum_k h_k.
+    A group with a single rule fires with probability p ('rate') or 1 - (1 - p)^n ('neighbor').
+    """
+    def __init__(self, attribute, initial_code):
+        self.attribute = attribute
+        self.initial_code = initial_code
+        self.rule_indices = []
+        self.hazards = []
+        self.final_codes = []
+        # (attribute, triggering code) of each 'neighbor' rule, None for 'rate' rules
+        self.triggers = []
+
+class TransitionPlan:
+    """
+    Transition rules compiled once: rules grouped by initial state, and the set of triggering
+    states whose neighbor counts are computed once per step and shared by all the rules using them.
+    """
+    def __init__(self, c):
+        self.groups = {}
+        for k, transition in enumerate(c.transition_rules):
+            initial_code = c.encode(transition.attribute, transition.initial_state)
+            group = self.groups.setdefault((transition.attribute, initial_code), TransitionGroup(transition.attribute, initial_code))
+            group.rule_indices.append(k)
+            group.hazards.append(-np.log(1 - transition.prob))
+            group.final_codes.append(c.encode(transition.attribute, transition.final_state))
+            if transition.mode == 'neighbor':
+                group.triggers.append((transition.attribute, c.encode(transition.attribute, transition.triggering_state)))
+            else:
+                group.triggers.append(None)
+        self.trigger_keys = sorted({trigger for group in self.groups.values() for trigger in group.triggers if trigger is not None})
+        # Distinct hazards of the 'neighbor' rules of each triggering state: on weighted graphs each one has its own neighbor sum
+        self.trigger_hazards = {trigger: sorted({hazard for group in self.groups.values() for hazard, group_trigger in zip(group.hazards, group.triggers)
+                                                 if group_trigger == trigger}) for trigger in self.trigger_keys}
+
 class Compartment:
     def __init__(self, attributes):
         self.attributes = attributes
         self.transition_rules = []
+        # Each state is stored in the simulation as a small integer: its position in the attribute list
+        self.state_codes = {attribute: {state: code for code, state in enumerate(states)} for attribute, states in attributes.items()}
+        self.plan = None
         
+    def encode(self, attribute, state):
+        """
+        Code of the state of attribute, given by its name or by its code, e.g. an integer or a number read from a text file.
+        """
+        codes = self.state_codes[attribute]
+        if state in codes:
+            return codes[state]
+        if isinstance(state, (int, np.integer)) or (isinstance(state, str) and state.strip().isdigit()):
+            if 0 <= int(state) < len(codes):
+                return int(state)
+        raise ValueError(f"State {state} of {attribute} not found. Choose between {', '.join(map(str, codes))} or their codes 0 to {len(codes) - 1}")
+
+    def state_names(self, attribute):
+        return list(self.attributes[attribute])
+
+    def compile_plan(self):
+        self.plan = TransitionPlan(self)
+        return self.plan
+
+    def get_plan(self):
+        if self.plan is None:
+            self.compile_plan()
+        return self.plan
+
     def add_dynamic_from_transition_rule(self, tr):
         tr._validate_dynamics(self.attributes)
         self.transition_rules.append(tr)
+        self.plan = None
 
     def add_dynamic_from_dictionary(self, **kwargs):
         new_transition_rule = TransitionRule()
@@ -78,6 +142,7 @@ class Compartment:
         new_transition_rule.mode = kwargs['mode']
         new_transition_rule._validate_dynamics(self.attributes)
         self.transition_rules.append(new_transition_rule)
+        self.plan = None
         
     def __str__(self):
         string = "SUMMARY"
@@ -0,0 +1,246 @@
+import numpy as np
+from .measurements_graph import read_state_matrix
+from .transition_log import TransitionLog, read_transition_log
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Number of node states read at once from the experiment outputs
+default_chunk_size = 1 << 22
+
+class StateAccumulator:
+    """
+    Compartment curves and per-node infection times of a run, accumulated chunk by chunk on the integer state codes.
+    The infection time of a node is the first measurement time at which it is not in the susceptible state:
+    nodes infected at the start get the first measurement time, nodes never infected NaN.
+
+    Parameters:
+        - state_names: list of state names, indexed by code
+        - susceptible: name of the susceptible state. None to skip the infection times
+    """
+    def __init__(self, state_names: list, susceptible = None):
+        self.state_names = list(state_names)
+        self.n_states = len(self.state_names)
+        self.susceptible_code = None if susceptible is None else get_state_code(self.state_names, susceptible)
+        self.counts = {}
+        self.first_time = np.full(0, np.nan)
+
+    def _add_counts(self, times: np.ndarray, counts: np.ndarray):
+        for t, counts_t in zip(times.tolist(), counts):
+            if t in self.counts:
+                self.counts[t] += counts_t
+            else:
+                self.counts[t] = counts_t
+
+    def _reserve(self, V):
+        if V > self.first_time.shape[0]:
+            self.first_time = np.concatenate([self.first_time, np.full(V - self.first_time.shape[0], np.nan)])
+
+    def add_long(self, times: np.ndarray, nodes: np.ndarray, codes: np.ndarray):
+        """
+        Add a chunk of rows (time, node_index, state code) in any order, as in the detailed measurement DataFrame.
+        """
+        time_index, chunk_times = pd.factorize(times, sort = False)
+        counts = np.bincount(time_index * self.n_states + codes, minlength = len(chunk_times) * self.n_states)
+        self._add_counts(np.asarray(chunk_times), counts.reshape(len(chunk_times), self.n_states))
+        if self.susceptible_code is None or nodes.shape[0] == 0: return
+        self._reserve(int(nodes.max()) + 1)
+        infected = codes != self.susceptible_code
+        # NaN marks the nodes not infected yet: fmin keeps the earliest time seen
+        np.fmin.at(self.first_time, nodes[infected], times[infected].astype(np.float64))
+
+    def add_dense(self, times: np.ndarray, states: np.ndarray):
+        """
+        Add the states of every node at consecutive measurement times: states has shape (len(times), V).
+        """
+        k = states.shape[0]
+        # Shift the codes of row j by j * n_states so that a single bincount counts every row
+        counts = np.bincount((states + (self.n_states * np.arange(k))[:, None]).ravel(), minlength = k * self.n_states)
+        self._add_counts(np.asarray(times), counts.reshape(k, self.n_states))
+        if self.susceptible_code is None or k == 0: return
+        self._reserve(states.shape[1])
+        infected = states != self.susceptible_code
+        first_row = infected.argmax(axis = 0)
+        new = infected.any(axis = 0) & np.isnan(self.first_time[:states.shape[1]])
+        self.first_time[np.flatnonzero(new)] = np.asarray(times, dtype = np.float64)[first_row[new]]
+
+    def curves(self, attribute = 'compartment'):
+        """
+        Compartment curves in the format of the 'aggregate' measurement mode: columns attribute, value, time.
+        """
+        times = sorted(self.counts)
+        counts = np.array([self.counts[t] for t in times], dtype = np.int64).reshape(len(times), self.n_states)
+        time_index, state_index = np.nonzero(counts)
+        return pd.DataFrame({attribute: np.asarray(self.state_names, dtype = object)[state_index],
+                             'value': counts[time_index, state_index],
+                             'time': np.asarray(times)[time_index]})
+
+    def infection_times(self):
+        return None if self.susceptible_code is None else self.first_time
+
+def get_state_code(state_names: list, name):
+    if name not in state_names:
+        raise ValueError(f"State {name} not found. Choose between {', '.join(state_names)}")
+    return state_names.index(name)
+
+def get_codes(values, state_names: list):
+    """
+    int8 codes of an array of state names.
+    """
+    codes = pd.Categorical(values, categories = state_names).codes
+    if (codes < 0).any():
+        unknown = sorted(set(pd.unique(np.asarray(values)[codes < 0])))
+        raise ValueError(f"States {', '.join(map(str, unknown))} not found. Choose between {', '.join(state_names)}")
+    return codes.astype(np.int8, copy = False)
+
+def get_frame_state_names(df: 'pd.DataFrame', attribute):
+    if isinstance(df[attribute].dtype, pd.CategoricalDtype):
+        return list(df[attribute].cat.categories)
+    return sorted(pd.unique(df[attribute]))
+
+def iter_frame_chunks(df: 'pd.DataFrame', attribute, state_names: list, chunk_size):
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size]
+        yield chunk['time'].to_numpy(), chunk['node_index'].to_numpy(), get_codes(chunk[attribute].to_numpy(), state_names)
+
+def iter_parquet_chunks(path, attribute, chunk_size):
+    """
+    Chunks of a detailed measurement streamed to a .parquet file, with the state names of its dictionary column.
+    """
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required to analyze a .parquet output")
+    parquet_file = pq.ParquetFile(path)
+    state_names = None
+    for batch in parquet_file.iter_batches(batch_size = chunk_size, columns = ['node_index', attribute, 'time']):
+        column = batch.column(attribute)
+        names = column.dictionary.to_pylist()
+        if state_names is None:
+            state_names = names
+        # Each batch may carry its own dictionary: translate its indices to the codes of the first one
+        lookup = get_codes(names, state_names)
+        codes = lookup[column.indices.to_numpy(zero_copy_only = False)]
+        yield state_names, batch.column('time').to_numpy(), batch.column('node_index').to_numpy(), codes
+
+def analyze_states(source, state_names = None, attribute = 'compartment', susceptible = 'susceptible', chunk_size = default_chunk_size):
+    """
+    Compartment curves and per-node infection times of a detailed measurement, computed by bincount on the
+    state codes one chunk at a time: files larger than memory are never loaded whole.
+
+    Parameters:
+        - source: detailed measurement DataFrame, or path of a detailed output: .npy or .parquet streamed by the
+          engines (read in chunks), .csv (read in chunks) or .pickle. A TransitionLog or its .npz file is
+          analyzed from its events
+        - state_names: list of state names, indexed by code. Default: the names stored in the output, or the sorted
+          states of the DataFrame. Required for .csv files
+        - attribute: measured attribute
+        - susceptible: name of the susceptible state. None to skip the infection times
+        - chunk_size: number of node states read at once
+    Returns:
+        curves_df: DataFrame with columns attribute, value, time, as the 'aggregate' measurement mode
+        infection_times: array with the infection time of each node (NaN if never infected), None without susceptible
+    """
+    if isinstance(source, TransitionLog) or (isinstance(source, str) and source.endswith('.npz')):
+        log = read_transition_log(source) if isinstance(source, str) else source
+        return log.aggregate(), None if susceptible is None else get_log_infection_times(log, susceptible)
+    elif isinstance(source, str) and source.endswith('.npy'):
+        states, names, times, attribute = read_state_matrix(source)
+        accumulator = StateAccumulator(names if state_names is None else state_names, susceptible)
+        rows = max(1, chunk_size // max(1, states.shape[1]))
+        for start in range(0, states.shape[0], rows):
+            accumulator.add_dense(times[start:start + rows], np.asarray(states[start:start + rows]))
+    elif isinstance(source, str) and source.endswith('.parquet'):
+        accumulator = None
+        for names, times, nodes, codes in iter_parquet_chunks(source, attribute, chunk_size):
+            if accumulator is None:
+                accumulator = StateAccumulator(names if state_names is None else state_names, susceptible)
+            if state_names is not None:
+                codes = get_codes(np.asarray(names, dtype = object)[codes], state_names)
+            accumulator.add_long(times, nodes, codes)
+        if accumulator is None:
+            raise ValueError(f"No measurement found in {source}")
+    elif isinstance(source, str) and source.endswith('.csv'):
+        if state_names is None:
+            raise ValueError("The state names are required to analyze a .csv output")
+        accumulator = StateAccumulator(state_names, susceptible)
+        for chunk in pd.read_csv(source, usecols = ['node_index', attribute, 'time'], chunksize = chunk_size):
+            accumulator.add_long(chunk['time'].to_numpy(), chunk['node_index'].to_numpy(), get_codes(chunk[attribute].to_numpy(), state_names))
+    else:
+        df = pd.read_pickle(source) if isinstance(source, str) else source
+        if state_names is None:
+            state_names = get_frame_state_names(df, attribute)
+        accumulator = StateAccumulator(state_names, susceptible)
+        for times, nodes, codes in iter_frame_chunks(df, attribute, state_names, chunk_size):
+            accumulator.add_long(times, nodes, codes)
+    return accumulator.curves(attribute), accumulator.infection_times()
+
+def get_log_infection_times(log: TransitionLog, susceptible = 'susceptible'):
+    """
+    Infection time of each node of a TransitionLog: the time of its first event leaving the susceptible state,
+    the first measurement time for nodes not susceptible at the start, NaN for nodes never infected.
+    """
+    susceptible_code = get_state_code(log.state_names, susceptible)
+    time, nodes, from_codes, _, _ = log._events()
+    first_time = np.full(log.initial_state.shape[0], np.nan)
+    first_time[log.initial_state != susceptible_code] = log.times[0] if len(log.times) > 0 else 0
+    leaving = from_codes == susceptible_code
+    np.fmin.at(first_time, nodes[leaving], time[leaving])
+    return first_time
+
+def iter_frames(source):
+    if isinstance(source, pd.DataFrame):
+        yield source
+        return
+    for frame in source:
+        yield pd.read_pickle(frame) if isinstance(frame, str) else frame
+
+def summarize_runs(source, group_columns = None, attribute = 'compartment', susceptible = 'susceptible', infected = 'infected'):
+    """
+    Final size, attack rate, peak time and peak height of every run of aggregate curves, vectorized over the runs.
+    The final size is the number of nodes out of the susceptible state at the last time of the run, the peak
+    is the maximum of the infected curve (first time it is reached).
+
+    Parameters:
+        - source: aggregate DataFrame (columns attribute, value, time and the keys of the runs, e.g. the
+          realizations of an ensemble, a sweep or the curves of analyze_states), or an iterable of such
+          DataFrames or of paths of pickled ones, e.g. the run files of a sweep. Each run lies in a single DataFrame
+        - group_columns: columns identifying a run. Default: every column except attribute, value and time
+        - susceptible, infected: names of the susceptible and infected states
+    Returns:
+        DataFrame with the group columns and final_size, attack_rate, peak_time, peak_height
+    """
+    summaries = [summarize_frame(df, group_columns, attribute, susceptible, infected) for df in iter_frames(source)]
+    return pd.concat(summaries, ignore_index = True)
+
+def summarize_frame(df: 'pd.DataFrame', group_columns, attribute, susceptible, infected):
+    if group_columns is None:
+        group_columns = [column for column in df.columns if column not in (attribute, 'value', 'time')]
+    times, time_index = np.unique(df['time'].to_numpy(), return_inverse = True)
+    if len(group_columns) > 0:
+        groups = df.groupby(group_columns, sort = True)
+        run_index = groups.ngroup().to_numpy()
+        keys_df = groups.size().index.to_frame(index = False)
+    else:
+        run_index = np.zeros(len(df), dtype = np.int64)
+        keys_df = pd.DataFrame(index = [0])
+    n_runs, T = len(keys_df), times.shape[0]
+    cell = run_index * T + time_index
+    values = df['value'].to_numpy(dtype = np.float64)
+    names = df[attribute].to_numpy()
+    found = set(pd.unique(names))
+    for name in (susceptible, infected):
+        if name not in found:
+            raise ValueError(f"State {name} not found in the {attribute} column. Choose between {', '.join(map(str, sorted(found)))}")
+    # Curves of shape (n_runs, T): states missing at a time have no nodes
+    total = np.bincount(cell, weights = values, minlength = n_runs * T).reshape(n_runs, T)
+    S = np.bincount(cell[names == susceptible], weights = values[names == susceptible], minlength = n_runs * T).reshape(n_runs, T)
+    I = np.bincount(cell[names == infected], weights = values[names == infected], minlength = n_runs * T).reshape(n_runs, T)
+    last = np.zeros(n_runs, dtype = np.int64)
+    np.maximum.at(last, run_index, time_index)
+    runs = np.arange(n_runs)
+    N = total.max(axis = 1)
+    final_size = N - S[runs, last]
+    peak = I.argmax(axis = 1)
+    return keys_df.assign(final_size = final_size, attack_rate = final_size / np.maximum(N, 1),
+                          peak_time = times[peak], peak_height = I[runs, peak])
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .infection import adjacency_from_edges, initialize_simulation_from_adjacency
+from .input_handler import read_input_adjacency
+from .engines import get_simulation_engine
+from .measurements_graph import Measure
+from .output_handler import save_simulation_df
+from .telemetry import get_peak_rss_mb
+
+# Graph family -> generator call with V nodes and mean degree close to 10
+graph_families = {'GNM': lambda V: f'GNM({V}, {5 * V})',
+                  'BA': lambda V: f'BA({V}, 5)',
+                  'PL': lambda V: f'PL({V}, 2.5, 3)',
+                  'WS': lambda V: f'WS({V}, 5, 0.1)'}
+
+# SIR model simulated by the benchmarks: supercritical on the graph families above
+benchmark_attributes = {'compartment': ['susceptible', 'infected', 'removed']}
+benchmark_dynamics = {'infection': {'name': 'infection', 'attribute': 'compartment', 'initial_state': 'susceptible', 'triggering_state': 'infected',
+                                    'final_state': 'infected', 'prob': 0.05, 'mode': 'neighbor'},
+                      'recovery': {'name': 'recovery', 'attribute': 'compartment', 'initial_state': 'infected', 'triggering_state': None,
+                                   'final_state': 'removed', 'prob': 0.1, 'mode': 'rate'}}
+benchmark_initial_conditions = {'compartment': {'susceptible': 0.99, 'infected': 0.01, 'removed': 0.0}}
+
+def get_graph_path(work_dir, family, V):
+    return os.path.join(work_dir, f'{family}_{V}.npy')
+
+def load_edges(graph_path):
+    edges = np.load(graph_path)
+    return edges[:, 0], edges[:, 1], int(edges.max()) + 1 if len(edges) > 0 else 0
+
+def bench_generate(work_dir, family, V, seed = 0):
+    """
+    Sample the graph and save it as a .npy edge list, used by the other benchmarks.
+    """
+    sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'graphs'))
+    import generate_graphs
+    function_name, arguments = generate_graphs.parse_function_string(graph_families[family](V))
+    start = time.perf_counter()
+    sources, targets, _, _ = getattr(generate_graphs, function_name)(*arguments, seed = seed)
+    seconds = time.perf_counter() - start
+    np.save(get_graph_path(work_dir, family, V), np.column_stack([sources, targets]))
+    return {'seconds': seconds, 'E': int(len(sources))}
+
+def bench_build(work_dir, family, V):
+    """
+    CSR adjacency from in-memory edge arrays.
+    """
+    sources, targets, _ = load_edges(get_graph_path(work_dir, family, V))
+    start = time.perf_counter()
+    A = adjacency_from_edges(sources, targets, V, directed = False)
+    return {'seconds': time.perf_counter() - start, 'E': int(len(sources)), 'nnz': int(A.nnz)}
+
+def bench_load(work_dir, family, V, source = 'edge_list'):
+    """
+    Adjacency read from disk as the simulator does it:
+        - edge_list: streaming .npy edge list reader, no cache
+        - cache: memory-mapped binary cache entry, built beforehand
+        - graphml: GraphML file parsed with igraph, no cache
+    """
+    graph_path = get_graph_path(work_dir, family, V)
+    use_cache = source == 'cache'
+    if source == 'graphml':
+        import igraph as ig
+        sources, targets, _ = load_edges(graph_path)
+        graph_path = os.path.splitext(graph_path)[0] + '.graphml'
+        if not os.path.exists(graph_path):
+            ig.Graph(n = V, edges = np.column_stack([sources, targets])).write_graphml(graph_path)
+    if use_cache:
+        read_input_adjacency(graph_path, use_cache = True, cache_dir = os.path.join(work_dir, '.graph_cache'))
+    start = time.perf_counter()
+    A, _ = read_input_adjacency(graph_path, use_cache = use_cache, cache_dir = os.path.join(work_dir, '.graph_cache'))
+    # Touch the arrays, so that memory-mapped pages are actually read
+    checksum = int(A.indptr[-1]) + int(A.indices.sum())
+    return {'seconds': time.perf_counter() - start, 'nnz': int(A.nnz), 'checksum': checksum}
+
+def bench_simulate(work_dir, family, V, engine = 'discrete', measure = 'aggregate', steps = 10, seed = 0, threads = 1):
+    """
+    Time steps of a simulation engine, measurements included. The output is not saved.
+    """
+    sources, targets, _ = load_edges(get_graph_path(work_dir, family, V))
+    A = adjacency_from_edges(sources, targets, V, directed = False)
+    del sources, targets
+    c, A, X_t = initialize_simulation_from_adjacency(A, benchmark_attributes, benchmark_dynamics, benchmark_initial_conditions, seed)
+    simulate_epidemic = get_simulation_engine(engine)
+    start = time.perf_counter()
+    engine_options = {'threads': threads} if threads > 1 else {}
+    simulate_epidemic(c, A, X_t, steps, Measure(measure), verbosity = False, rng = seed, **engine_options)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'steps': steps, 'seconds_per_step': seconds / steps, 'seconds_per_node_step': seconds / (steps * V)}
+
+def bench_measure(work_dir, family, V, measure = 'aggregate', output_extension = '.pickle', steps = 10, seed = 0):
+    """
+    Measurement of a fixed state at every step and serialization of the measurements, without simulating.
+    """
+    c, A, X_t = initialize_simulation_from_adjacency(adjacency_from_edges(np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64), V, False),
+                                                     benchmark_attributes, benchmark_dynamics, benchmark_initial_conditions, seed)
+    output_path = os.path.join(work_dir, f'measure_{family}_{V}_{measure}{output_extension}')
+    measure_mode = Measure(measure)
+    if output_extension in ('.npy', '.parquet'):
+        measure_mode.stream_to(output_path)
+    start = time.perf_counter()
+    for t in range(steps + 1):
+        measure_mode.append_experiment(X_t, c, 'compartment', t)
+    measured = time.perf_counter()
+    save_simulation_df(measure_mode.concatenate_experiment(), output_path)
+    saved = time.perf_counter()
+    return {'seconds': saved - start, 'measure_seconds': measured - start, 'save_seconds': saved - measured,
+            'steps': steps, 'seconds_per_step': (measured - start) / (steps + 1), 'bytes': os.path.getsize(output_path)}
+
+benchmark_functions = {'generate': bench_generate, 'build': bench_build, 'load': bench_load, 'simulate': bench_simulate, 'measure': bench_measure}
+
+def _run_case(name, kwargs):
+    result = benchmark_functions[name](**kwargs)
+    result['peak_rss_mb'] = get_peak_rss_mb()
+    return result
+
+def run_case(name, **kwargs):
+    """
+    Run a benchmark in a fresh process, so that its peak resident memory is not polluted by the previous ones.
+
+    Returns:
+        Dictionary with the case parameters, the timings and peak_rss_mb
+    """
+    with ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context('spawn')) as executor:
+        result = executor.submit(_run_case, name, kwargs).result()
+    case = {'benchmark': name}
+    case.update({key: value for key, value in kwargs.items() if key != 'work_dir'})
+    case.update(result)
+    return case
+
+def build_benchmark_cases(sizes, families, engines = ('discrete', 'frontier'), measures = ('aggregate', 'detailed'), steps = 10,
+                          graphml_max_size = 100_000, threads = (1,)):
+    """
+    List of (benchmark name, parameters) covering graph load, adjacency build, simulation steps and measurements
+    for every graph family and size. Graph generation comes first, since the other benchmarks read its output.
+    The discrete engine is timed with each number of threads.
+    """
+    cases = []
+    for V in sizes:
+        for family in families:
+            cases.append(('generate', {'family': family, 'V': V}))
+            cases.append(('build', {'family': family, 'V': V}))
+            sources = ['edge_list', 'cache'] + (['graphml'] if V <= graphml_max_size else [])
+            cases.extend(('load', {'family': family, 'V': V, 'source': source}) for source in sources)
+            for engine in engines:
+                cases.extend(('simulate', {'family': family, 'V': V, 'engine': engine, 'measure': measure, 'steps': steps}) for measure in measures)
+            for n_threads in threads:
+                if n_threads > 1 and 'discrete' in engines:
+                    cases.append(('simulate', {'family': family, 'V': V, 'engine': 'discrete', 'measure': 'aggregate', 'steps': steps,
+                                               'threads': n_threads}))
+        family = families[0]
+        cases.append(('measure', {'family': family, 'V': V, 'measure': 'aggregate', 'output_extension': '.pickle', 'steps': steps}))
+        for output_extension in ('.pickle', '.npy'):
+            cases.append(('measure', {'family': family, 'V': V, 'measure': 'detailed', 'output_extension': output_extension, 'steps': steps}))
+    return cases
+
+def get_environment():
+    """
+    Metadata of the benchmark run: commit, library versions and machine.
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True,
+                                cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import scipy
+    return {'commit': commit, 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'scipy': scipy.__version__, 'pandas': pd.__version__,
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+
+def run_benchmarks(cases, work_dir, output_path = None, verbosity = True):
+    """
+    Run the cases one by one and write {'environment': ..., 'results': [...]} to output_path as JSON
+    after each case, so that a partial run keeps its results.
+    """
+    os.makedirs(work_dir, exist_ok = True)
+    report = {'environment': get_environment(), 'results': []}
+    for k, (name, kwargs) in enumerate(cases):
+        result = run_case(name, work_dir = work_dir, **kwargs)
+        report['results'].append(result)
+        if verbosity: print(f"[{k+1}/{len(cases)}] {name} {kwargs}: {result['seconds']:.4f} s, peak RSS {result['peak_rss_mb']:.1f} MB")
+        if output_path is not None:
+            with open(output_path, 'w') as output_file:
+                json.dump(report, output_file, indent = 1)
+    return report
+
+# Parameters that identify a benchmark case across reports
+case_parameters = ('benchmark', 'family', 'V', 'source', 'engine', 'measure', 'output_extension', 'steps', 'threads')
+
+def get_case_key(result):
+    return tuple((key, result[key]) for key in case_parameters if key in result)
+
+def compare_benchmarks(base_report, new_report):
+    """
+    Table of the cases present in both reports with their time and peak memory ratio new / base.
+    """
+    base = {get_case_key(result): result for result in base_report['results']}
+    rows = []
+    for result in new_report['results']:
+        key = get_case_key(result)
+        if key not in base: continue
+        row = dict(key)
+        row.update(base_seconds = base[key]['seconds'], new_seconds = result['seconds'], time_ratio = result['seconds'] / max(base[key]['seconds'], 1e-12),
+                   rss_ratio = result['peak_rss_mb'] / max(base[key]['peak_rss_mb'], 1e-12))
+        rows.append(row)
+    comparison_df = pd.DataFrame(rows)
+    return comparison_df[[column for column in case_parameters if column in comparison_df.columns] +
+                         ['base_seconds', 'new_seconds', 'time_ratio', 'rss_ratio']] if rows else comparison_df
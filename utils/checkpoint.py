@@ -0,0 +1,58 @@
+import os
+import pickle
+
+class Checkpoint:
+    """
+    Periodic snapshot of a single run: the state of the engine (node states and its bookkeeping),
+    the random streams, the time step and the measurements recorded so far.
+    A run resumed from a snapshot gives the same result as an uninterrupted run.
+
+    Parameters:
+        - path: file holding the latest snapshot
+        - every: number of time steps between two snapshots
+        - resume: load the snapshot in path, if any, and continue from it
+    """
+    def __init__(self, path, every = 10, resume = False):
+        if every < 1:
+            raise ValueError(f"Checkpoints should be taken every positive number of steps. Got {every}")
+        self.path = path
+        self.every = every
+        self.saved = None
+        if resume and os.path.exists(path):
+            with open(path, 'rb') as checkpoint_file:
+                self.saved = pickle.load(checkpoint_file)
+
+    def is_due(self, time, start):
+        return time > start and time % self.every == 0
+
+    def save(self, engine, time, state: dict, rng, measure):
+        """
+        Store the snapshot taken at time, before the measurement of time.
+        The file is written under a temporary name and renamed, so that a run killed while saving
+        keeps the previous snapshot.
+        """
+        snapshot = {'engine': engine, 'time': time, 'state': state, 'rng': rng, 'measure': measure.get_checkpoint()}
+        with open(self.path + '.tmp', 'wb') as checkpoint_file:
+            pickle.dump(snapshot, checkpoint_file, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(self.path + '.tmp', self.path)
+
+    def restore(self, engine, measure):
+        """
+        Restore the measurements of the loaded snapshot in measure.
+
+        Returns:
+            time, state, rng: as given to save. None if there is no snapshot to resume from
+        """
+        if self.saved is None:
+            return None
+        if self.saved['engine'] != engine:
+            raise ValueError(f"The checkpoint {self.path} was taken by the {self.saved['engine']} engine, not by {engine}")
+        measure.restore_checkpoint(self.saved['measure'])
+        return self.saved['time'], self.saved['state'], self.saved['rng']
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def get_checkpoint_path(experiment_output_path):
+    return os.path.splitext(experiment_output_path)[0] + '.checkpoint'
@@ -0,0 +1,183 @@
+import numpy as np
+import os
+import shutil
+from .infection import adjacency_from_edges
+from .partitioned import get_row_bounds, localize_partition, write_partitioned_store
+from .temporal import TemporalWriter
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Plain-text edge lists: one "source target" pair of integer node indices per line
+text_edge_list_extensions = ('.edges', '.edgelist', '.txt', '.tsv', '.csv')
+# Binary edge lists: .npy array of shape (E, 2) with integer node indices
+binary_edge_list_extensions = ('.npy',)
+edge_list_extensions = text_edge_list_extensions + binary_edge_list_extensions
+
+def iter_edge_chunks(graph_path, chunk_size = 10_000_000, columns = 2):
+    """
+    Yield (sources, targets) NumPy arrays of at most chunk_size edges, without reading the whole file at once.
+    Text files may use spaces or tabs (commas for .csv) as separator and '#' for comment lines.
+    With more than 2 columns the following ones are read as floats and yielded after the targets,
+    e.g. the weights of the edges or the times of the contacts.
+    """
+    if graph_path.endswith(binary_edge_list_extensions):
+        edges = np.load(graph_path, mmap_mode = 'r')
+        if edges.ndim != 2 or edges.shape[1] != columns:
+            raise ValueError(f"Binary edge list {graph_path} should have shape (E, {columns}). Got {edges.shape}")
+        for first in range(0, edges.shape[0], chunk_size):
+            chunk = np.asarray(edges[first:first + chunk_size])
+            yield (chunk[:, 0].astype(np.int64), chunk[:, 1].astype(np.int64)) + tuple(chunk[:, k].astype(np.float64) for k in range(2, columns))
+    elif graph_path.endswith(text_edge_list_extensions):
+        separator = ',' if graph_path.endswith('.csv') else r'\s+'
+        dtypes = {k: np.int64 if k < 2 else np.float64 for k in range(columns)}
+        reader = pd.read_csv(graph_path, sep = separator, comment = '#', header = None, usecols = list(range(columns)),
+                             dtype = dtypes, chunksize = chunk_size, engine = 'c')
+        for chunk in reader:
+            yield tuple(chunk[k].to_numpy() for k in range(columns))
+    else:
+        raise TypeError(f"The edge list extension is not supported. Choose between {', '.join(edge_list_extensions)}")
+
+def read_edge_list_adjacency(graph_path, directed = False, V = None, chunk_size = 10_000_000, weighted = False):
+    """
+    Build the adjacency matrix of a large edge list streaming it in chunks.
+    Edges are kept as compact integer arrays: no igraph Graph nor Python tuples are created.
+    Node indices are used as they are: the graph has V = max index + 1 nodes unless V is given.
+    With weighted the third column holds the weight of each edge.
+
+    Returns:
+        A: sparse adjacency matrix
+        meta: Dictionary with the graph name, direction, number of nodes and edges
+        node_attributes: empty dictionary, edge lists carry no node metadata
+    """
+    sources, targets, weights = [], [], []
+    index_dtype = np.int32
+    for chunk in iter_edge_chunks(graph_path, chunk_size, 3 if weighted else 2):
+        chunk_sources, chunk_targets = chunk[:2]
+        if len(chunk_sources) == 0: continue
+        if min(chunk_sources.min(), chunk_targets.min()) < 0:
+            raise ValueError(f"Negative node index in the edge list {graph_path}")
+        # Downcast each chunk as soon as it is read, to keep 8 bytes per edge when possible
+        if max(chunk_sources.max(), chunk_targets.max()) >= np.iinfo(np.int32).max:
+            index_dtype = np.int64
+        sources.append(chunk_sources.astype(index_dtype))
+        targets.append(chunk_targets.astype(index_dtype))
+        if weighted: weights.append(chunk[2])
+    sources = np.concatenate(sources) if len(sources) > 0 else np.empty(0, dtype = index_dtype)
+    targets = np.concatenate(targets) if len(targets) > 0 else np.empty(0, dtype = index_dtype)
+    if V is None:
+        V = int(max(sources.max(), targets.max())) + 1 if len(sources) > 0 else 0
+    weights = (np.concatenate(weights) if len(weights) > 0 else np.empty(0)) if weighted else None
+    A = adjacency_from_edges(sources, targets, V, directed, weights)
+    meta = {'name': os.path.basename(graph_path), 'directed': directed, 'vcount': V, 'ecount': int(len(sources))}
+    return A, meta, {}
+
+def partition_edge_list(graph_path, directory, n_partitions, directed = False, V = None, chunk_size = 10_000_000):
+    """
+    Store the adjacency matrix of an edge list as n_partitions row blocks without holding the whole graph in memory.
+    A first pass counts the entries of each row to balance the partitions, a second pass appends the entries
+    to a temporary file per partition, and each partition is then built and stored on its own.
+
+    Returns:
+        directory of the store, to be opened with PartitionedAdjacency
+        meta: Dictionary with the graph name, direction, number of nodes and edges
+    """
+    def iter_entries():
+        # Entries (row, column) of the adjacency matrix: A[i, j] counts the edges j -> i
+        for chunk_sources, chunk_targets in iter_edge_chunks(graph_path, chunk_size):
+            if len(chunk_sources) == 0: continue
+            if min(chunk_sources.min(), chunk_targets.min()) < 0:
+                raise ValueError(f"Negative node index in the edge list {graph_path}")
+            if directed:
+                yield chunk_targets.astype(np.int64), chunk_sources.astype(np.int64)
+            else:
+                yield np.concatenate([chunk_sources, chunk_targets]).astype(np.int64), np.concatenate([chunk_targets, chunk_sources]).astype(np.int64)
+    row_counts = np.zeros(0 if V is None else V, dtype = np.int64)
+    ecount = 0
+    for rows, cols in iter_entries():
+        ecount += rows.shape[0] if directed else rows.shape[0] // 2
+        size = int(max(rows.max(), cols.max())) + 1
+        if size > row_counts.shape[0]:
+            row_counts = np.concatenate([row_counts, np.zeros(size - row_counts.shape[0], dtype = np.int64)])
+        row_counts += np.bincount(rows, minlength = row_counts.shape[0])
+    V = row_counts.shape[0]
+    row_bounds = get_row_bounds(row_counts, n_partitions)
+    del row_counts
+    # Spill the entries of each partition to its own file
+    spill_directory = f'{directory}.spill{os.getpid()}'
+    os.makedirs(spill_directory, exist_ok = True)
+    spill_paths = [os.path.join(spill_directory, f'part_{k}.bin') for k in range(n_partitions)]
+    spill_files = [open(path, 'wb') for path in spill_paths]
+    try:
+        for rows, cols in iter_entries():
+            partition = np.searchsorted(row_bounds, rows, side = 'right') - 1
+            order = np.argsort(partition, kind = 'stable')
+            starts = np.searchsorted(partition[order], np.arange(n_partitions + 1))
+            for k in range(n_partitions):
+                selected = order[starts[k]:starts[k + 1]]
+                if selected.shape[0] > 0:
+                    np.column_stack([rows[selected], cols[selected]]).tofile(spill_files[k])
+    finally:
+        for spill_file in spill_files: spill_file.close()
+    def build_partition(k, first, last):
+        entries = np.fromfile(spill_paths[k], dtype = np.int64).reshape(-1, 2)
+        os.remove(spill_paths[k])
+        return localize_partition(first, last, entries[:, 0], entries[:, 1])
+    meta = {'name': os.path.basename(graph_path), 'directed': directed, 'vcount': V, 'ecount': int(ecount)}
+    try:
+        write_partitioned_store(directory, (V, V), row_bounds, meta, build_partition)
+    finally:
+        shutil.rmtree(spill_directory, ignore_errors = True)
+    return directory, meta
+
+def write_temporal_edge_list(graph_path, directory, window, directed = False, weighted = False, V = None, chunk_size = 10_000_000):
+    """
+    Store the snapshots of a timestamped edge list, one per time window of length window, streaming the file in chunks.
+    Each line holds source, target, time and, with weighted, the weight of the contact (e.g. its duration).
+    Lines should be sorted by time, so that only the contacts of the current window are held in memory.
+    The contacts of a pair in the same window are merged: their weights (or numbers of contacts) are summed.
+
+    Returns:
+        directory of the store, to be opened with TemporalAdjacency
+        meta: Dictionary with the graph name, direction, number of nodes and contacts, window and start time
+    """
+    columns = 4 if weighted else 3
+    # First pass: number of nodes and time span
+    max_index, start_time, n_contacts = -1, None, 0
+    for chunk in iter_edge_chunks(graph_path, chunk_size, columns):
+        if len(chunk[0]) == 0: continue
+        if min(chunk[0].min(), chunk[1].min()) < 0:
+            raise ValueError(f"Negative node index in the edge list {graph_path}")
+        max_index = max(max_index, int(chunk[0].max()), int(chunk[1].max()))
+        start_time = chunk[2].min() if start_time is None else min(start_time, chunk[2].min())
+        n_contacts += len(chunk[0])
+    V = max_index + 1 if V is None else V
+    start_time = 0. if start_time is None else float(start_time)
+    writer = TemporalWriter(directory, V, weighted)
+    buffered = []
+    def flush_windows(last_window):
+        # Write the buffered window and the empty windows up to last_window
+        contacts = [np.concatenate(column) for column in zip(*buffered)] if len(buffered) > 0 else [np.empty(0, dtype = np.int64)] * 2 + [np.empty(0)] * 2
+        writer.append(adjacency_from_edges(contacts[0], contacts[1], V, directed, contacts[3] if weighted else None))
+        buffered.clear()
+        while writer.n_windows <= last_window:
+            writer.append(adjacency_from_edges(np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64), V, directed,
+                                               np.empty(0) if weighted else None))
+    # Second pass: snapshots window by window
+    current_window = 0
+    for chunk in iter_edge_chunks(graph_path, chunk_size, columns):
+        if len(chunk[0]) == 0: continue
+        windows = np.floor((chunk[2] - start_time) / window).astype(np.int64)
+        if np.any(np.diff(windows) < 0) or windows[0] < current_window:
+            raise ValueError(f"The contacts of {graph_path} should be sorted by time")
+        # Positions where the window changes within the chunk
+        boundaries = np.flatnonzero(np.diff(windows)) + 1
+        for first, last in zip(np.concatenate([[0], boundaries]), np.concatenate([boundaries, [len(windows)]])):
+            if windows[first] != current_window:
+                flush_windows(windows[first] - 1)
+                current_window = windows[first]
+            buffered.append(tuple(column[first:last] for column in chunk))
+    flush_windows(current_window)
+    meta = {'name': os.path.basename(graph_path), 'directed': directed, 'vcount': V, 'ecount': n_contacts,
+            'window': window, 'start_time': start_time}
+    return writer.close(meta), meta
@@ -0,0 +1,15 @@
+from .infection import simulate_epidemic
+from .gillespie import simulate_gillespie
+from .frontier import simulate_frontier
+
+available_engines = {'discrete': simulate_epidemic, 'frontier': simulate_frontier, 'gillespie': simulate_gillespie}
+
+def get_simulation_engine(engine_name):
+    """
+    Simulation function selected by the 'engine' setting of the [experiment] section.
+    Every engine has the signature (c, A, X_t, time_steps, measure, verbosity, rng, checkpoint, termination)
+    and returns the measurements.
+    """
+    if engine_name not in available_engines:
+        raise ValueError(f"Engine {engine_name} not implemented yet. Choose between {', '.join(available_engines)}")
+    return available_engines[engine_name]
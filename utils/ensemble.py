@@ -0,0 +1,96 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from .Compartments import Compartment
+from .initialize_data import initialize_state
+from .infection import advance_state
+from .rng import RandomStreams
+from .termination import is_absorbing
+from .temporal import get_adjacency_at
+from .weighted import get_edge_hazards
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+def count_states_per_realization(states: np.ndarray, n_states: int):
+    """
+    Count the nodes in each state for every column of a (V, R) state matrix.
+
+    Returns:
+        counts: numpy array of shape (R, n_states)
+    """
+    R = states.shape[1]
+    # Shift the codes of realization r by r * n_states so that a single bincount does the job
+    shifted_codes = states + n_states * np.arange(R)
+    return np.bincount(shifted_codes.ravel(), minlength = n_states * R).reshape(R, n_states)
+
+def simulate_ensemble(c: Compartment, A: csr_matrix, initial_conditions: dict, time_steps: int, n_realizations: int,
+                      realizations_per_batch = None, quantiles = (0.05, 0.5, 0.95), attribute = 'compartment', verbosity = True,
+                      rng = None, stop_when_absorbed = True, seeding = None):
+    """
+    Run n_realizations independent realizations of the epidemic advancing them together:
+    the state of a batch is a (V, R) matrix and each neighbor count is one sparse x dense product.
+
+    Parameters:
+        - c: Compartment object
+        - A: sparse adjacency matrix, PartitionedAdjacency or TemporalAdjacency
+        - initial_conditions: Dictionary containing initial probabilities for attributes
+        - time_steps: number of time steps
+        - n_realizations: number of realizations
+        - realizations_per_batch: maximum number of realizations held in memory together. Default: all of them
+        - quantiles: quantiles of the ensemble reported in the summary
+        - attribute: attribute measured
+        - rng: RandomStreams or seed. Realization r draws from rng.realization(r) whatever its batch,
+          so it can be replayed alone by a single run with the same streams
+        - stop_when_absorbed: stop a batch once no rule can fire in any of its realizations. Its curves stay constant up to time_steps
+        - seeding: Seeding prepared once on the graph (see get_seeding) and applied to every realization
+    Returns:
+        realizations_df: DataFrame with columns realization, attribute, value, time
+        summary_df: DataFrame with columns attribute, time, mean and one column per quantile
+    """
+    V = A.shape[0]
+    state_names = c.state_names(attribute)
+    n_states = len(state_names)
+    if not isinstance(rng, RandomStreams):
+        rng = RandomStreams(rng)
+    if realizations_per_batch is None:
+        realizations_per_batch = n_realizations
+    # counts[t, r, k]: number of nodes in state k at time t in realization r
+    counts = np.zeros((time_steps + 1, n_realizations, n_states), dtype = np.int64)
+    # Hazards of the edges of a weighted graph, shared by the batches and the steps on the same matrix
+    edge_hazards = None
+
+    for first in range(0, n_realizations, realizations_per_batch):
+        last = min(first + realizations_per_batch, n_realizations)
+        streams = rng.realizations(first, last)
+        X_t = initialize_state(V, c, initial_conditions, n_realizations = last - first, rng = streams, seeding = seeding)
+        X_t_plus_1 = {key: states.copy() for key, states in X_t.items()}
+        for time in range(0, time_steps):
+            if verbosity: print(f"Realizations {first+1}-{last} / {n_realizations}. Time: {time+1} / {time_steps}")
+            counts[time, first:last] = count_states_per_realization(X_t[attribute], n_states)
+            if stop_when_absorbed and is_absorbing(c, X_t):
+                counts[time + 1:, first:last] = counts[time, first:last]
+                break
+            A_t = get_adjacency_at(A, time)
+            edge_hazards = get_edge_hazards(edge_hazards, A_t)
+            advance_state(c, A_t, X_t, X_t_plus_1, streams, edge_hazards = edge_hazards)
+            X_t, X_t_plus_1 = X_t_plus_1, X_t
+        else:
+            counts[time_steps, first:last] = count_states_per_realization(X_t[attribute], n_states)
+
+    # Per-realization curves, in the same long format of the aggregate measurement
+    time_index, realization_index, state_index = np.indices(counts.shape)
+    realizations_df = pd.DataFrame({'realization': realization_index.ravel(),
+                                    attribute: np.asarray(state_names, dtype = object)[state_index.ravel()],
+                                    'value': counts.ravel(),
+                                    'time': time_index.ravel()})
+
+    # Ensemble mean and quantiles over the realizations
+    time_index, state_index = np.indices((time_steps + 1, n_states))
+    summary = {attribute: np.asarray(state_names, dtype = object)[state_index.ravel()],
+               'time': time_index.ravel(),
+               'mean': counts.mean(axis = 1).ravel()}
+    for q, values in zip(quantiles, np.quantile(counts, quantiles, axis = 1)):
+        summary[f'q{q}'] = values.ravel()
+    summary_df = pd.DataFrame(summary)
+
+    return realizations_df, summary_df
@@ -0,0 +1,186 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from .Compartments import Compartment
+from .infection import choose_competing_rules
+from .rng import RULE_STREAM, get_realization_streams
+from .telemetry import get_telemetry
+from .weighted import check_static_unweighted
+
+def gather_rows(indptr: np.ndarray, rows: np.ndarray):
+    """
+    Positions in the indices/data arrays of a CSR matrix of all the entries of the given rows.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    # Offset of each entry from the start of its row
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+class FrontierState:
+    """
+    State of the discrete-time engine with incremental bookkeeping:
+        - members[(attribute, code)]: nodes in the initial state of a group with a 'rate' rule
+        - counts[(attribute, code)]: number of neighbors of each node in the triggering state of a 'neighbor' rule
+        - frontier[(attribute, code)]: nodes with at least one neighbor in the triggering state
+    After each step only the nodes that changed state and their neighbors are touched.
+    """
+    def __init__(self, c: Compartment, A: csr_matrix, X: dict, rng = None):
+        check_static_unweighted(A, 'frontier')
+        self.c = c
+        self.X = X
+        self.rng = get_realization_streams(rng)
+        self.plan = c.get_plan()
+        # Nodes whose count depends on node k are the rows with a non-zero in column k
+        self.A_transposed = A.transpose().tocsr()
+        self.members = {}
+        self.counts = {}
+        self.frontier = {}
+        for key, group in self.plan.groups.items():
+            if None in group.triggers:
+                self.members[key] = np.flatnonzero(X[key[0]] == key[1])
+        for key in self.plan.trigger_keys:
+            self.counts[key] = A.dot((X[key[0]] == key[1]).astype(np.int64))
+            self.frontier[key] = np.flatnonzero(self.counts[key] > 0)
+
+    def sample_group(self, group, telemetry = None):
+        """
+        Sample the competing rules of the group. Random numbers are drawn only for the candidate nodes:
+        the members of the initial state if the group has a 'rate' rule, otherwise the nodes of the
+        initial state in the frontier of the triggering states.
+
+        Returns:
+            candidates: candidate nodes
+            choice: position in the group of the rule fired on each candidate, -1 if none fires
+        """
+        telemetry = get_telemetry(telemetry)
+        key = (group.attribute, group.initial_code)
+        with telemetry.phase('query'):
+            if key in self.members:
+                candidates = self.members[key]
+            else:
+                candidates = np.unique(np.concatenate([self.frontier[trigger] for trigger in set(group.triggers)]))
+                candidates = candidates[self.X[group.attribute][candidates] == group.initial_code]
+        telemetry.add('sampled_nodes', candidates.shape[0])
+        with telemetry.phase('sample'):
+            hazards = np.zeros((len(group.rule_indices), candidates.shape[0]))
+            for position, (hazard, trigger) in enumerate(zip(group.hazards, group.triggers)):
+                if trigger is None:
+                    hazards[position] = hazard
+                else:
+                    hazards[position] = hazard * self.counts[trigger][candidates]
+            sample = self.rng.stream(RULE_STREAM, group.rule_indices[0]).random(candidates.shape[0])
+            choice = choose_competing_rules(hazards, sample)
+        return candidates, choice
+
+    def step(self, telemetry = None):
+        """
+        Advance the state by one time step. As in the dense engine every rule reads the state at time t
+        and rules with the same initial state compete on the same nodes.
+
+        Returns:
+            changes: Dictionary attribute -> (nodes, from_codes, to_codes, rule_indices) of the nodes that changed state
+        """
+        telemetry = get_telemetry(telemetry)
+        sampled = [(group, *self.sample_group(group, telemetry)) for group in self.plan.groups.values()]
+        changes = {}
+        for attribute, states in self.X.items():
+            with telemetry.phase('update'):
+                fired = []
+                for group, candidates, choice in sampled:
+                    if group.attribute != attribute: continue
+                    fires = choice >= 0
+                    chosen = choice[fires]
+                    fired.append((candidates[fires], np.full(chosen.shape[0], group.initial_code),
+                                   np.asarray(group.final_codes)[chosen], np.asarray(group.rule_indices)[chosen]))
+                if len(fired) == 0: continue
+                nodes, old_codes, new_codes, rule_indices = (np.concatenate(column) for column in zip(*fired))
+                states[nodes] = new_codes
+                changed = old_codes != new_codes
+                changes[attribute] = (nodes[changed], old_codes[changed], new_codes[changed], rule_indices[changed].astype(np.int16))
+            telemetry.add('changed_nodes', changes[attribute][0].shape[0])
+            with telemetry.phase('neighbor_counts'):
+                self._update_bookkeeping(attribute, *changes[attribute][:3])
+        return changes
+
+    def is_absorbing(self):
+        """
+        True when no rule can fire: no node is in the initial state of the 'rate' rules
+        and no node has a neighbor in the triggering state of the 'neighbor' rules.
+        """
+        for key, group in self.plan.groups.items():
+            for hazard, trigger in zip(group.hazards, group.triggers):
+                if hazard == 0: continue
+                candidates = self.members[key] if trigger is None else self.frontier[trigger]
+                if candidates.shape[0] > 0: return False
+        return True
+
+    def _update_bookkeeping(self, attribute, nodes, old_codes, new_codes):
+        states = self.X[attribute]
+        for key in self.members:
+            if key[0] != attribute: continue
+            # Drop the nodes that left the state and append the ones that entered it
+            members = self.members[key]
+            self.members[key] = np.concatenate([members[states[members] == key[1]], nodes[new_codes == key[1]]])
+        for key in self.counts:
+            if key[0] != attribute: continue
+            entered = nodes[(new_codes == key[1])]
+            left = nodes[(old_codes == key[1])]
+            if len(entered) == 0 and len(left) == 0: continue
+            positions_entered = gather_rows(self.A_transposed.indptr, entered)
+            positions_left = gather_rows(self.A_transposed.indptr, left)
+            neighbors = np.concatenate([self.A_transposed.indices[positions_entered], self.A_transposed.indices[positions_left]])
+            weights = np.concatenate([self.A_transposed.data[positions_entered], -self.A_transposed.data[positions_left]])
+            # Sum the contributions to the same neighbor
+            neighbors, inverse = np.unique(neighbors, return_inverse = True)
+            delta = np.bincount(inverse, weights = weights, minlength = neighbors.shape[0]).astype(np.int64)
+            counts = self.counts[key]
+            before = counts[neighbors]
+            counts[neighbors] = before + delta
+            # Keep in the frontier the nodes with a positive count
+            frontier = self.frontier[key]
+            newly_positive = neighbors[(before == 0) & (counts[neighbors] > 0)]
+            self.frontier[key] = np.concatenate([frontier[counts[frontier] > 0], newly_positive])
+
+def simulate_frontier(c: Compartment, A: csr_matrix, X_t: dict, time_steps, measure, verbosity = True, rng = None, checkpoint = None, termination = None,
+                      telemetry = None):
+    """
+    Discrete-time simulation equivalent to simulate_epidemic, whose cost per step scales with the number of
+    nodes in the initial state of 'rate' rules and with the frontier of 'neighbor' rules instead of the whole graph.
+    Best suited for runs where the epidemic stays small.
+    """
+    telemetry = get_telemetry(telemetry)
+    start = 0
+    saved = None if checkpoint is None else checkpoint.restore('frontier', measure)
+    if saved is not None:
+        start, saved_state, rng = saved
+        X_t, termination = saved_state['X'], saved_state['termination']
+    X_t = {attribute: states.copy() for attribute, states in X_t.items()}
+    state = FrontierState(c, A, X_t, rng)
+    if saved is not None:
+        # The order of the members and of the frontier sets which node gets which random number
+        state.members, state.counts, state.frontier = saved_state['members'], saved_state['counts'], saved_state['frontier']
+    for time in range(start, time_steps):
+        if checkpoint is not None and checkpoint.is_due(time, start):
+            with telemetry.phase('io'):
+                checkpoint.save('frontier', time, {'X': X_t, 'members': state.members, 'counts': state.counts, 'frontier': state.frontier,
+                                                   'termination': termination}, state.rng, measure)
+        if verbosity: print(f"Time: {time+1} / {time_steps}")
+        with telemetry.phase('measure'):
+            measure.append_experiment(X_t, c, 'compartment', time)
+        if termination is not None:
+            with telemetry.phase('termination'):
+                reason = termination.should_stop(time, c, X_t, termination.absorbing and state.is_absorbing())
+            if reason is not None:
+                with telemetry.phase('measure'):
+                    termination.finish(measure, c, X_t, time, time_steps, reason)
+                telemetry.flush(time, c, X_t)
+                return measure.concatenate_experiment()
+        changes = state.step(telemetry)
+        if measure.records_transitions and 'compartment' in changes:
+            with telemetry.phase('measure'):
+                measure.append_transitions(time + 1, *changes['compartment'])
+        telemetry.end_step(time + 1, c, X_t)
+    with telemetry.phase('measure'):
+        measure.append_experiment(X_t, c, 'compartment', time_steps)
+    telemetry.flush(time_steps, c, X_t)
+    return measure.concatenate_experiment()
@@ -0,0 +1,201 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from .Compartments import Compartment
+from .rng import EVENT_STREAM, get_realization_streams
+from .telemetry import get_telemetry
+from .weighted import check_static_unweighted
+
+class SumTree:
+    """
+    Binary tree whose leaves are non-negative weights and whose inner nodes hold the sum of their children.
+    Updating k weights costs O(k log V) and sampling a leaf proportionally to its weight costs O(log V).
+    """
+    def __init__(self, weights: np.ndarray):
+        self.n_leaves = weights.shape[0]
+        self.size = 1
+        while self.size < self.n_leaves:
+            self.size *= 2
+        self.tree = np.zeros(2 * self.size)
+        self.tree[self.size:self.size + self.n_leaves] = weights
+        # Fill the inner nodes level by level, from the leaves to the root
+        first = self.size // 2
+        while first >= 1:
+            parents = np.arange(first, 2 * first)
+            self.tree[parents] = self.tree[2 * parents] + self.tree[2 * parents + 1]
+            first //= 2
+
+    def total(self):
+        return self.tree[1]
+
+    def weight(self, index):
+        return self.tree[self.size + index]
+
+    def update(self, indices: np.ndarray, weights: np.ndarray):
+        positions = indices + self.size
+        self.tree[positions] = weights
+        # Recompute the sums from the children, so that rounding errors do not pile up
+        positions = np.unique(positions // 2)
+        while positions[0] >= 1:
+            self.tree[positions] = self.tree[2 * positions] + self.tree[2 * positions + 1]
+            if positions[0] == 1: break
+            positions = np.unique(positions // 2)
+
+    def sample(self, u):
+        """
+        Index of the leaf at which the cumulative weight exceeds u, with 0 <= u < total().
+        """
+        position = 1
+        while position < self.size:
+            left = self.tree[2 * position]
+            if u < left:
+                position = 2 * position
+            else:
+                u -= left
+                position = 2 * position + 1
+        return position - self.size
+
+def get_rule_rates(c: Compartment):
+    """
+    Continuous-time rate of every transition rule.
+    The rate r = -log(1 - p) makes the probability of firing within one unit of time equal to p,
+    the probability used by the discrete-time engine: per node for 'rate' rules, per neighbor in
+    the triggering state for 'neighbor' rules.
+    """
+    return [-np.log(1 - transition.prob) for transition in c.transition_rules]
+
+class GillespieState:
+    """
+    Node states, neighbor-trigger counts and per-node total hazard of the continuous-time engine.
+    """
+    def __init__(self, c: Compartment, A: csr_matrix, X: dict, rng = None):
+        check_static_unweighted(A, 'gillespie')
+        self.c = c
+        self.X = X
+        # Waiting times, nodes and rules of the events are drawn from the same stream
+        self.stream = get_realization_streams(rng).stream(EVENT_STREAM)
+        self.rates = get_rule_rates(c)
+        # Nodes whose count depends on node k are the rows with a non-zero in column k
+        self.A_transposed = A.transpose().tocsr()
+        # One neighbor count per (attribute, triggering state) used by a 'neighbor' rule
+        self.triggers = {(t.attribute, c.encode(t.attribute, t.triggering_state)) for t in c.transition_rules if t.mode == 'neighbor'}
+        self.counts = {}
+        for attribute, code in self.triggers:
+            self.counts[(attribute, code)] = A.dot((X[attribute] == code).astype(np.float64))
+        V = A.shape[0]
+        self.tree = SumTree(self.node_hazards(np.arange(V)))
+
+    def rule_hazards(self, nodes: np.ndarray):
+        """
+        Returns:
+            hazards: array of shape (number of rules, len(nodes)) with the hazard of each rule on each node
+        """
+        hazards = np.zeros((len(self.c.transition_rules), len(nodes)))
+        for k, (transition, rate) in enumerate(zip(self.c.transition_rules, self.rates)):
+            in_initial_state = self.X[transition.attribute][nodes] == self.c.encode(transition.attribute, transition.initial_state)
+            if transition.mode == 'rate':
+                hazards[k] = rate * in_initial_state
+            elif transition.mode == 'neighbor':
+                trigger = (transition.attribute, self.c.encode(transition.attribute, transition.triggering_state))
+                hazards[k] = rate * in_initial_state * self.counts[trigger][nodes]
+            else: raise ValueError(f"transition.mode {transition.mode} not implemented yet.")
+        return hazards
+
+    def node_hazards(self, nodes: np.ndarray):
+        return self.rule_hazards(nodes).sum(axis = 0)
+
+    def fire(self, node, transition):
+        """
+        Apply the transition to node and update the hazards of the node and of its neighbors: O(degree log V).
+
+        Returns:
+            old_code, new_code: state of node before and after the transition
+        """
+        attribute = transition.attribute
+        old_code = self.X[attribute][node]
+        new_code = self.c.encode(attribute, transition.final_state)
+        self.X[attribute][node] = new_code
+        touched = [np.array([node])]
+        for trigger in ((attribute, old_code), (attribute, new_code)):
+            if trigger in self.triggers and old_code != new_code:
+                start, end = self.A_transposed.indptr[node], self.A_transposed.indptr[node + 1]
+                neighbors = self.A_transposed.indices[start:end]
+                sign = -1 if trigger[1] == old_code else 1
+                self.counts[trigger][neighbors] += sign * self.A_transposed.data[start:end]
+                touched.append(neighbors)
+        touched = np.unique(np.concatenate(touched))
+        self.tree.update(touched, self.node_hazards(touched))
+        return old_code, new_code
+
+    def next_event(self):
+        """
+        Sample the node and the rule of the next event.
+
+        Returns:
+            node, index of the rule in the transition_rules list
+        """
+        while True:
+            node = self.tree.sample(self.stream.random(1)[0] * self.tree.total())
+            # Guard against rounding errors landing on a leaf with null weight
+            if self.tree.weight(node) > 0: break
+        hazards = self.rule_hazards(np.array([node]))[:, 0]
+        k = np.searchsorted(np.cumsum(hazards), self.stream.random(1)[0] * hazards.sum(), side = 'right')
+        return node, min(k, len(hazards) - 1)
+
+def simulate_gillespie(c: Compartment, A: csr_matrix, X_t: dict, time_steps, measure, verbosity = True, rng = None, checkpoint = None, termination = None,
+                       telemetry = None):
+    """
+    Continuous-time simulation of the epidemic: each event costs O(degree log V) instead of O(V),
+    so the cost scales with the number of transitions.
+    The state is measured at the integer times 0, 1, ..., time_steps, as in the discrete-time engine.
+    """
+    rng = get_realization_streams(rng)
+    telemetry = get_telemetry(telemetry)
+    t = 0.
+    start = 0
+    saved = None if checkpoint is None else checkpoint.restore('gillespie', measure)
+    if saved is not None:
+        start, saved_state, rng = saved
+        X_t, t, termination = saved_state['X'], saved_state['t'], saved_state['termination']
+    X_t = {attribute: states.copy() for attribute, states in X_t.items()}
+    # Counts and hazards are rebuilt from the node states: they hold the same values as the ones updated event by event
+    state = GillespieState(c, A, X_t, rng)
+    for time in range(start, time_steps + 1):
+        if checkpoint is not None and checkpoint.is_due(time, start):
+            with telemetry.phase('io'):
+                checkpoint.save('gillespie', time, {'X': X_t, 't': t, 'termination': termination}, rng, measure)
+        events = []
+        n_events = 0
+        # Fire all the events happening before the measurement at time
+        while state.tree.total() > 0:
+            with telemetry.phase('sample'):
+                dt = state.stream.exponential(1 / state.tree.total())
+                if t + dt > time:
+                    # Memoryless waiting times: the sample past the measurement is discarded
+                    t = time
+                    break
+                t += dt
+                node, k = state.next_event()
+            transition = c.transition_rules[k]
+            # Updates of the neighbor counts and of the hazards included
+            with telemetry.phase('update'):
+                old_code, new_code = state.fire(node, transition)
+            n_events += 1
+            if measure.records_transitions and transition.attribute == 'compartment' and old_code != new_code:
+                events.append((t, node, old_code, new_code, k))
+        telemetry.add('events', n_events)
+        if verbosity and time > 0: print(f"Time: {time} / {time_steps}")
+        with telemetry.phase('measure'):
+            if len(events) > 0:
+                measure.append_transitions(*(np.array(column) for column in zip(*events)))
+            measure.append_experiment(X_t, c, 'compartment', time)
+        if termination is not None:
+            # With a null total hazard no event can happen anymore
+            with telemetry.phase('termination'):
+                reason = termination.should_stop(time, c, X_t, termination.absorbing and state.tree.total() == 0)
+            if reason is not None:
+                with telemetry.phase('measure'):
+                    termination.finish(measure, c, X_t, time, time_steps, reason)
+                break
+        if time > start: telemetry.end_step(time, c, X_t)
+    telemetry.flush(time, c, X_t)
+    return measure.concatenate_experiment()
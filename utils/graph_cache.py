@@ -0,0 +1,117 @@
+import numpy as np
+import os
+import json
+import shutil
+import hashlib
+from scipy.sparse import csr_matrix
+
+# Version of the layout of the cache entries. Entries of other versions are ignored
+cache_version = 2
+# Extension of the directories written by save_adjacency that are given directly as graph files
+adjacency_store_extension = '.csr'
+
+def get_file_hash(path, chunk_size = 1 << 24):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def get_cached_file_hash(graph_path, cache_dir):
+    """
+    sha1 of the file in graph_path, hashed again only when its size or modification time changed: the last hash is
+    kept with the stat of the file in cache_dir, so that a cache hit does not read the whole file.
+    """
+    path = os.path.abspath(graph_path)
+    stat = os.stat(path)
+    key = {'path': path, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    hash_path = os.path.join(cache_dir, f'{os.path.basename(path)}.sha1.json')
+    if os.path.exists(hash_path):
+        with open(hash_path, 'r') as hash_file:
+            saved = json.load(hash_file)
+        if all(saved.get(name) == value for name, value in key.items()):
+            return saved['sha1']
+    file_hash = get_file_hash(path)
+    os.makedirs(cache_dir, exist_ok = True)
+    # Written and renamed, so that concurrent processes never read a partial file
+    tmp_path = f'{hash_path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as hash_file:
+        json.dump(dict(key, sha1 = file_hash), hash_file)
+    os.replace(tmp_path, hash_path)
+    return file_hash
+
+def get_default_cache_dir(graph_path):
+    return os.path.join(os.path.dirname(os.path.abspath(graph_path)), '.graph_cache')
+
+def save_adjacency(A: csr_matrix, directory, meta: dict, node_attributes = None):
+    """
+    Store the CSR arrays of A as .npy files in directory, plus the graph metadata in meta.json
+    and each array of node_attributes (attribute name -> array of length V) in node_<name>.npy.
+    The directory is written under a temporary name and renamed at the end, so that concurrent
+    processes never see a partial entry.
+    """
+    tmp_directory = f'{directory}.tmp{os.getpid()}'
+    os.makedirs(tmp_directory, exist_ok = True)
+    np.save(os.path.join(tmp_directory, 'indptr.npy'), A.indptr)
+    np.save(os.path.join(tmp_directory, 'indices.npy'), A.indices)
+    np.save(os.path.join(tmp_directory, 'data.npy'), A.data)
+    node_attributes = {} if node_attributes is None else node_attributes
+    for name, values in node_attributes.items():
+        np.save(os.path.join(tmp_directory, f'node_{name}.npy'), values)
+    meta = dict(meta, shape = list(A.shape), nnz = int(A.nnz), node_attributes = list(node_attributes))
+    with open(os.path.join(tmp_directory, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file)
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another process stored the same entry in the meantime
+        shutil.rmtree(tmp_directory)
+    return directory
+
+def load_adjacency(directory, mmap = True):
+    """
+    Load an adjacency matrix stored by save_adjacency.
+    With mmap the arrays are memory-mapped read-only: loading is near-instant and
+    processes using the same entry share the same pages.
+
+    Returns:
+        A: csr_matrix
+        meta: Dictionary with the graph metadata
+        node_attributes: Dictionary attribute name -> array of length V
+    """
+    mmap_mode = 'r' if mmap else None
+    with open(os.path.join(directory, 'meta.json'), 'r') as meta_file:
+        meta = json.load(meta_file)
+    indptr = np.load(os.path.join(directory, 'indptr.npy'), mmap_mode = mmap_mode)
+    indices = np.load(os.path.join(directory, 'indices.npy'), mmap_mode = mmap_mode)
+    data = np.load(os.path.join(directory, 'data.npy'), mmap_mode = mmap_mode)
+    A = csr_matrix((data, indices, indptr), shape = tuple(meta['shape']), copy = False)
+    node_attributes = {name: np.load(os.path.join(directory, f'node_{name}.npy'), mmap_mode = mmap_mode) for name in meta['node_attributes']}
+    return A, meta, node_attributes
+
+def read_cached_adjacency(graph_path, build_adjacency, cache_dir = None, variant = '', verbosity = True):
+    """
+    Adjacency matrix of the graph in graph_path, from the cache entry keyed by the hash of the file, which is
+    computed again only when the size or the modification time of the file changed (see get_cached_file_hash).
+    When the entry does not exist it is built with build_adjacency and stored.
+
+    Parameters:
+        - graph_path: path of the source graph file
+        - build_adjacency: function graph_path -> (csr_matrix, metadata dictionary, node attributes dictionary)
+        - cache_dir: directory of the cache. Default: .graph_cache next to the graph file
+        - variant: label of the way the adjacency is built from the file, part of the key of the entry
+    Returns:
+        A: memory-mapped csr_matrix
+        meta: Dictionary with the graph metadata
+        node_attributes: Dictionary attribute name -> memory-mapped array of length V
+    """
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir(graph_path)
+    file_hash = get_cached_file_hash(graph_path, cache_dir)
+    directory = os.path.join(cache_dir, f'{os.path.basename(graph_path)}_{file_hash[:16]}_{variant}_v{cache_version}')
+    if not os.path.exists(os.path.join(directory, 'meta.json')):
+        if verbosity: print(f"Graph {graph_path} not cached. Storing its adjacency in {directory}")
+        A, meta, node_attributes = build_adjacency(graph_path)
+        os.makedirs(cache_dir, exist_ok = True)
+        save_adjacency(A, directory, dict(meta, source = os.path.abspath(graph_path), sha1 = file_hash), node_attributes)
+    return load_adjacency(directory)
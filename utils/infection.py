@@ -1,82 +1,374 @@
 import numpy as np
-import igraph as ig
 from scipy.sparse import csr_matrix
-from .Compartments import TransitionRule
+from .Compartments import TransitionRule, Compartment
 from .measurements_graph import Measure
-from .initialize_data import initialize_compartments, initialize_graph
-
-def sparse_adj_matrix(G: ig.Graph, undirected = False):
-    E = G.get_edgelist()
-    row = [e[0] for e in E]
-    col = [e[1] for e in E]
-    data = [1 for _ in E]
-    
-    if undirected is False:
-        row, col = row + col, col + row
-        data = data + data
-
-    V = G.vcount()        
-    A_sparse = csr_matrix((data, (row, col)), shape = (V, V))
-    return A_sparse
-
-def get_updated_indices_to_update(G: ig.Graph, A: csr_matrix, transition: TransitionRule):
-    V = G.vcount()
+from .initialize_data import initialize_compartments, initialize_state
+from .rng import RULE_STREAM, get_realization_streams, get_column_streams, draw_per_realization
+from .termination import is_absorbing
+from .telemetry import get_telemetry
+from .parallel_kernel import get_parallel_kernel
+from .partitioned import PartitionedAdjacency
+from .weighted import is_weighted, EdgeHazards, get_edge_hazards, get_weighted_neighbor_hazards
+from .temporal import get_adjacency_at
+from .lazy import lazy_import
+
+ig = lazy_import('igraph')
+
+def adjacency_from_edges(sources: np.ndarray, targets: np.ndarray, V: int, directed: bool, weights: np.ndarray = None):
+    """
+    Build the sparse adjacency matrix from NumPy arrays of edge endpoints.
+    A[i, j] is the number of edges j -> i, so that A.dot(x)[i] sums x over the in-neighbors of i.
+    Undirected edges are stored in both directions.
+    With weights, A[i, j] is the sum of the weights of the edges j -> i, stored as floats: see is_weighted.
+    Repeated edges are merged into a single entry, with the sum of their weights (see get_weighted_neighbor_hazards).
+    """
+    index_dtype = np.int32 if V < np.iinfo(np.int32).max else np.int64
+    if directed:
+        row, col = targets.astype(index_dtype), sources.astype(index_dtype)
+    else:
+        row = np.concatenate([sources, targets]).astype(index_dtype)
+        col = np.concatenate([targets, sources]).astype(index_dtype)
+    if weights is None:
+        data = np.ones(row.shape[0], dtype = np.int32)
+    else:
+        data = np.asarray(weights, dtype = np.float64)
+        data = data if directed else np.concatenate([data, data])
+    return csr_matrix((data, (row, col)), shape = (V, V))
+
+def sparse_adj_matrix(G: 'ig.Graph', directed = None, weight_attribute = None):
+    """
+    Sparse adjacency matrix of G. By default edges are directed if G is directed.
+    With weight_attribute the edges are weighted by that edge attribute.
+    """
+    if directed is None:
+        directed = G.is_directed()
+    E = np.array(G.get_edgelist(), dtype = np.int64).reshape(-1, 2)
+    weights = None if weight_attribute is None else np.asarray(G.es[weight_attribute], dtype = np.float64)
+    return adjacency_from_edges(E[:, 0], E[:, 1], G.vcount(), directed, weights)
+
+def get_neighbor_trigger_counts(plan, get_mask, count, weighted: bool, telemetry):
+    """
+    Neighbor terms of the 'neighbor' rules, computed once per triggering state and shared by the rules using it.
+
+    Parameters:
+        - get_mask: function triggering state (attribute, code) -> boolean array of the nodes in that state
+        - count: function (mask, hazard) -> sum over the neighbors in mask, of the edges (hazard None) or
+          of the weighted hazards of the rule (see get_weighted_neighbor_hazards)
+    Returns:
+        Dictionary trigger -> number of neighbors in the triggering state, or (trigger, hazard) -> hazard of the rule
+        on weighted graphs. None when no node is in the triggering state
+    """
+    neighbor_trigger_counts = {}
+    for trigger in plan.trigger_keys:
+        with telemetry.phase('query'):
+            trigger_mask = get_mask(trigger)
+            any_trigger = trigger_mask.any()
+        # Count for each node how many neighbors are in the trigger state
+        with telemetry.phase('neighbor_counts'):
+            if not weighted:
+                neighbor_trigger_counts[trigger] = count(trigger_mask, None) if any_trigger else None
+                continue
+            for hazard in plan.trigger_hazards[trigger]:
+                neighbor_trigger_counts[(trigger, hazard)] = count(trigger_mask, hazard) if any_trigger else None
+    return neighbor_trigger_counts
+
+def get_transition_mask(X: dict, A: csr_matrix, c: Compartment, transition: TransitionRule, rng = None):
+    """
+    Sample the nodes updated by the transition.
+    The state arrays in X can be either of shape (V,) for a single realization or
+    (V, R) for R realizations advanced together: in the latter case the neighbor count
+    is a single sparse matrix x dense matrix product.
+    The uniform numbers are drawn from the stream of the rule in rng (see get_realization_streams).
+
+    Returns:
+        fired: boolean array with the same shape of the state arrays
+    """
+    states = X[transition.attribute]
+    # Query nodes with the initial state
+    init_mask = states == c.encode(transition.attribute, transition.initial_state)
+    if not init_mask.any():
+        return np.zeros(states.shape, dtype = bool)
+
     if transition.mode == 'neighbor':
-        # Query nodes with the initial state
-        initial_attribute_indices = [v.index for v in G.vs() if v[transition.attribute] == transition.initial_state]
-        if len(initial_attribute_indices) == 0:
-            return []
         # Query nodes with the triggering state
-        triggering_attribute_indices = [v.index for v in G.vs() if v[transition.attribute] == transition.triggering_state]
-        if len(triggering_attribute_indices) == 0:
-            return []
-        
-        init_vec = np.zeros(V)
-        init_vec[initial_attribute_indices] = 1
-        trigger_vec = np.zeros(V)
-        trigger_vec[triggering_attribute_indices] = 1
+        trigger_mask = states == c.encode(transition.attribute, transition.triggering_state)
+        if not trigger_mask.any():
+            return np.zeros(states.shape, dtype = bool)
         # Count for each node how many neighbors are in the trigger state
-        neighbor_trigger_attribute_count = A.dot(trigger_vec)
-        # Apply a mask to get the vector containing the number of neighbors given the initial state
-        neigh_given_init = np.where(init_vec == 1, neighbor_trigger_attribute_count, 0)
-        # Apply the function
-        transition_prob = 1 - np.power(1 - transition.prob, neigh_given_init)
-        sample = np.random.random(V)
-        indices = list(np.where(sample < transition_prob)[0])
-        return indices
-    
-    elif transition.mode == 'rate':
-        # Query nodes with the initial state
-        initial_attribute_indices = [v.index for v in G.vs() if v[transition.attribute] == transition.initial_state]
-        if len(initial_attribute_indices) == 0:
-            return []
-        init_vec = np.zeros(V)
-        init_vec[initial_attribute_indices] = 1
+        neighbor_trigger_attribute_count = A.dot(trigger_mask.astype(np.float64))
+        # Apply the function only on the nodes with the initial state
+        transition_prob = np.zeros(states.shape)
+        transition_prob[init_mask] = 1 - np.power(1 - transition.prob, neighbor_trigger_attribute_count[init_mask])
 
+    elif transition.mode == 'rate':
         # Apply the function
-        transition_prob = transition.prob * init_vec
-        sample = np.random.random(V)
-        indices = list(np.where(sample < transition_prob)[0])
-        return indices
+        transition_prob = transition.prob * init_mask
 
     else: raise ValueError(f"transition.mode {transition.mode} not implemented yet.")
 
-def initialize_simulation(G: ig.Graph, attributes, dynamics, initial_conditions):
+    sample = get_realization_streams(rng).stream(RULE_STREAM, c.transition_rules.index(transition)).random(states.size)
+    return sample.reshape(states.shape) < transition_prob
+
+def get_updated_indices_to_update(X: dict, A: csr_matrix, c: Compartment, transition: TransitionRule, rng = None):
+    return np.flatnonzero(get_transition_mask(X, A, c, transition, rng))
+
+def choose_competing_rules(hazards: np.ndarray, sample: np.ndarray):
+    """
+    Sample which of the competing rules fires on each node.
+
+    Parameters:
+        - hazards: array of shape (number of rules, number of nodes)
+        - sample: one uniform number in [0, 1) per node
+    Returns:
+        choice: position of the rule fired on each node, -1 if none fires
+    """
+    cumulative_hazards = np.cumsum(hazards, axis = 0)
+    total_hazards = cumulative_hazards[-1]
+    fire_prob = -np.expm1(-total_hazards)
+    fires = sample < fire_prob
+    choice = np.full(total_hazards.shape[0], -1, dtype = np.int64)
+    # Given that the node fires, sample / fire_prob is uniform in [0, 1): reuse it to pick the rule
+    level = sample[fires] / fire_prob[fires] * total_hazards[fires]
+    choice[fires] = np.minimum((cumulative_hazards[:, fires] <= level).sum(axis = 0), hazards.shape[0] - 1)
+    return choice
+
+def sample_transitions(c: Compartment, A: csr_matrix, X: dict, rng = None, telemetry = None, kernel = None, edge_hazards = None):
+    """
+    Sample the nodes updated by every rule with the compiled plan of c: each triggering state is queried
+    and multiplied by A once, shared by all the rules using it, and rules with the same initial state
+    compete on the same nodes. Random numbers are drawn only for the nodes in an initial state.
+    The state arrays in X can be either of shape (V,) or (V, R). The uniform numbers of each rule group
+    are drawn from the stream of the group in the realization of each column (see get_column_streams),
+    so a realization follows the same trajectory whether it is run alone or in a batch.
+    With a ParallelKernel the state arrays of a single run are queried, multiplied and sampled block by block
+    in parallel, with the same result. A PartitionedAdjacency is processed one partition at a time.
+    On a weighted graph, edge_hazards is the EdgeHazards of A kept by the caller across steps, built here if None.
+
+    Returns:
+        fired: list of boolean arrays with the same shape of the state arrays, one per rule
+    """
+    telemetry = get_telemetry(telemetry)
+    plan = c.get_plan()
+    streams = get_column_streams(rng, next(iter(X.values())).shape)
+    if isinstance(A, PartitionedAdjacency):
+        return sample_transitions_partitioned(c, A, X, streams, telemetry)
+    weighted = is_weighted(A)
+    edge_hazards = get_edge_hazards(edge_hazards, A)
+    if kernel is not None:
+        count = lambda mask, hazard: kernel.neighbor_counts(mask, None if hazard is None else edge_hazards.get(hazard))
+    else:
+        count = lambda mask, hazard: A.dot(mask.astype(np.float64)) if hazard is None else get_weighted_neighbor_hazards(edge_hazards, mask, hazard)
+    neighbor_trigger_counts = get_neighbor_trigger_counts(plan, lambda trigger: X[trigger[0]] == trigger[1], count, weighted, telemetry)
+    fired = [None] * len(c.transition_rules)
+    for group in plan.groups.values():
+        states = X[group.attribute]
+        if kernel is not None and states.ndim == 1:
+            sample_group_parallel(group, states, fired, neighbor_trigger_counts, streams[0], kernel, telemetry, weighted)
+            continue
+        with telemetry.phase('query'):
+            for k in group.rule_indices:
+                fired[k] = np.zeros(states.shape, dtype = bool)
+            # Query nodes with the initial state, sorted by realization
+            if states.ndim == 1:
+                initial_nodes = (np.flatnonzero(states == group.initial_code),)
+                realizations = np.zeros(initial_nodes[0].shape[0], dtype = np.int64)
+            else:
+                realizations, nodes = np.nonzero(states.T == group.initial_code)
+                initial_nodes = (nodes, realizations)
+        if realizations.shape[0] == 0: continue
+        telemetry.add('sampled_nodes', realizations.shape[0])
+        with telemetry.phase('sample'):
+            hazards = get_group_hazards(group, neighbor_trigger_counts, initial_nodes, realizations.shape[0], weighted)
+            sample = draw_per_realization(streams, RULE_STREAM, group.rule_indices[0], realizations)
+            choice = choose_competing_rules(hazards, sample)
+        with telemetry.phase('update'):
+            for position, k in enumerate(group.rule_indices):
+                selected = choice == position
+                fired[k][tuple(index[selected] for index in initial_nodes)] = True
+    return fired
+
+def get_group_hazards(group, neighbor_trigger_counts: dict, nodes, n_nodes, weighted = False):
+    """
+    Hazards of the rules of group on the nodes, indices of the arrays of neighbor_trigger_counts
+    (see get_neighbor_trigger_counts).
+
+    Returns:
+        hazards: array of shape (number of rules of the group, n_nodes)
+    """
+    hazards = np.zeros((len(group.rule_indices), n_nodes))
+    for position, (hazard, trigger) in enumerate(zip(group.hazards, group.triggers)):
+        if trigger is None:
+            hazards[position] = hazard
+        elif weighted:
+            if neighbor_trigger_counts[(trigger, hazard)] is not None:
+                hazards[position] = neighbor_trigger_counts[(trigger, hazard)][nodes]
+        elif neighbor_trigger_counts[trigger] is not None:
+            hazards[position] = hazard * neighbor_trigger_counts[trigger][nodes]
+    return hazards
+
+def sample_transitions_partitioned(c: Compartment, A: PartitionedAdjacency, X: dict, streams: list, telemetry):
+    """
+    sample_transitions on an adjacency matrix stored as row blocks. The neighbor counts of each partition are
+    computed from the states of its nodes and of its halo, and its nodes are sampled before moving to the next one.
+    Partitions are visited in row order, so every stream gives its numbers to the same nodes as with the whole matrix.
+    """
+    plan = c.get_plan()
+    fired = [np.zeros(X[transition.attribute].shape, dtype = bool) for transition in c.transition_rules]
+    for partition in A.partitions:
+        weighted = is_weighted(partition.A)
+        edge_hazards = EdgeHazards(partition.A) if weighted else None
+        count = lambda mask, hazard: partition.neighbor_counts(mask) if hazard is None else get_weighted_neighbor_hazards(edge_hazards, mask, hazard)
+        neighbor_trigger_counts = get_neighbor_trigger_counts(plan, lambda trigger: partition.gather(X[trigger[0]]) == trigger[1], count,
+                                                              weighted, telemetry)
+        for group in plan.groups.values():
+            with telemetry.phase('query'):
+                states = X[group.attribute][partition.first:partition.last]
+                if states.ndim == 1:
+                    local_nodes = (np.flatnonzero(states == group.initial_code),)
+                    realizations = np.zeros(local_nodes[0].shape[0], dtype = np.int64)
+                else:
+                    realizations, nodes = np.nonzero(states.T == group.initial_code)
+                    local_nodes = (nodes, realizations)
+            if realizations.shape[0] == 0: continue
+            telemetry.add('sampled_nodes', realizations.shape[0])
+            with telemetry.phase('sample'):
+                hazards = get_group_hazards(group, neighbor_trigger_counts, local_nodes, realizations.shape[0], weighted)
+                sample = draw_per_realization(streams, RULE_STREAM, group.rule_indices[0], realizations)
+                choice = choose_competing_rules(hazards, sample)
+            with telemetry.phase('update'):
+                for position, k in enumerate(group.rule_indices):
+                    selected = choice == position
+                    fired[k][(local_nodes[0][selected] + partition.first,) + tuple(index[selected] for index in local_nodes[1:])] = True
+    return fired
+
+def sample_group_parallel(group, states: np.ndarray, fired: list, neighbor_trigger_counts: dict, streams, kernel, telemetry, weighted = False):
+    """
+    Sample the competing rules of group on a single run with the blocks of kernel, writing the nodes
+    updated by each rule in fired. The draws are the ones of the serial path of sample_transitions.
+    """
+    with telemetry.phase('query'):
+        for k in group.rule_indices:
+            fired[k] = np.zeros(states.shape, dtype = bool)
+        initial_nodes = kernel.flatnonzero_equal(states, group.initial_code)
+    if initial_nodes.shape[0] == 0: return
+    telemetry.add('sampled_nodes', initial_nodes.shape[0])
+    with telemetry.phase('sample'):
+        sample = kernel.random(streams.stream(RULE_STREAM, group.rule_indices[0]), initial_nodes.shape[0])
+        def sample_chunk(first, last):
+            nodes = initial_nodes[first:last]
+            hazards = get_group_hazards(group, neighbor_trigger_counts, nodes, nodes.shape[0], weighted)
+            choice = choose_competing_rules(hazards, sample[first:last])
+            # Chunks hold distinct nodes, so the writes do not overlap
+            for position, k in enumerate(group.rule_indices):
+                fired[k][nodes[choice == position]] = True
+        kernel.map_chunks(sample_chunk, initial_nodes.shape[0])
+
+def advance_state(c: Compartment, A: csr_matrix, X_t: dict, X_t_plus_1: dict, rng = None, telemetry = None, kernel = None, edge_hazards = None):
+    """
+    Write in X_t_plus_1 the state reached from X_t after one time step.
+    Every rule reads the state at time t. Rules with the same initial state compete on the
+    same nodes, so at most one rule per attribute fires on each node.
+
+    Returns:
+        updates: list of (transition, boolean mask of the nodes updated by the transition)
+    """
+    telemetry = get_telemetry(telemetry)
+    sampled = sample_transitions(c, A, X_t, rng, telemetry, kernel, edge_hazards)
+    with telemetry.phase('update'):
+        for attribute, states in X_t.items():
+            np.copyto(X_t_plus_1[attribute], states)
+        updates = []
+        for transition, fired in zip(c.transition_rules, sampled):
+            X_t_plus_1[transition.attribute][fired] = c.encode(transition.attribute, transition.final_state)
+            updates.append((transition, fired))
+    return updates
+
+def get_state_changes(X_t: dict, X_t_plus_1: dict, updates: list, attribute):
+    """
+    Nodes whose attribute changed between X_t and X_t_plus_1, with the rule responsible for the change.
+
+    Returns:
+        nodes, from_codes, to_codes, rule_indices (positions of the rules in the updates list)
+    """
+    nodes = np.flatnonzero(X_t[attribute] != X_t_plus_1[attribute])
+    rule_indices = np.zeros(len(nodes), dtype = np.int16)
+    for k, (transition, fired) in enumerate(updates):
+        if transition.attribute == attribute:
+            rule_indices[fired[nodes]] = k
+    return nodes, X_t[attribute][nodes], X_t_plus_1[attribute][nodes], rule_indices
+
+def initialize_simulation(G: 'ig.Graph', attributes, dynamics, initial_conditions, rng = None):
+    return initialize_simulation_from_adjacency(sparse_adj_matrix(G), attributes, dynamics, initial_conditions, rng)
+
+def initialize_simulation_from_adjacency(A: csr_matrix, attributes, dynamics, initial_conditions, rng = None, seeding = None):
     c = initialize_compartments(attributes, dynamics, initial_conditions)
-    A = sparse_adj_matrix(G)
-    G_t = initialize_graph(G, initial_conditions)
-    return c, A, G_t
+    X_t = initialize_state(A.shape[0], c, initial_conditions, rng = rng, seeding = seeding)
+    return c, A, X_t
 
-def simulate_epidemic(c, A, G_t, time_steps, measure, verbosity = True):
-    
-    for time in range(0, time_steps):
+def simulate_epidemic(c, A, X_t, time_steps, measure, verbosity = True, rng = None, checkpoint = None, termination = None, telemetry = None,
+                      threads = 1, interventions = None):
+    rng = get_realization_streams(rng)
+    telemetry = get_telemetry(telemetry)
+    start = 0
+    saved = None if checkpoint is None else checkpoint.restore('discrete', measure)
+    if saved is not None:
+        start, state, rng = saved
+        X_t, termination = state['X'], state['termination']
+        if interventions is not None and state.get('interventions') is not None:
+            interventions.restore_checkpoint(state['interventions'])
+    # Neighbor counts and sampling split across threads on large graphs
+    kernel = get_parallel_kernel(get_adjacency_at(A, start), threads)
+    # Hazards of the edges of a weighted graph, kept while the adjacency of the steps is the same matrix
+    edge_hazards = None
+    # Double buffer: the state at time t + 1 is written over the arrays of time t - 1
+    X_t = {attribute: states.copy() for attribute, states in X_t.items()}
+    X_t_plus_1 = {attribute: states.copy() for attribute, states in X_t.items()}
+    if interventions is not None:
+        interventions.check(c)
+        measure.intervention_names = interventions.names
+        if start == 0:
+            with telemetry.phase('intervention'):
+                interventions.apply(0, c, X_t, get_adjacency_at(A, 0), rng, telemetry)
+    for time in range(start, time_steps):
+        if checkpoint is not None and checkpoint.is_due(time, start):
+            with telemetry.phase('io'):
+                checkpoint.save('discrete', time, {'X': X_t, 'termination': termination,
+                                                   'interventions': None if interventions is None else interventions.get_checkpoint()}, rng, measure)
         if verbosity: print(f"Time: {time+1} / {time_steps}")
-        measure.append_experiment(G_t, 'compartment', time)
-        G_t_plus_1 = G_t.copy()
-        nodes_t_plus_1 = G_t_plus_1.vs()
-        for transition in c.transition_rules:
-            node_update_index = get_updated_indices_to_update(G_t, A, transition)
-            nodes_t_plus_1[node_update_index][transition.attribute] = transition.final_state
-        G_t = G_t_plus_1.copy()
-    measure.append_experiment(G_t, 'compartment', time)
+        with telemetry.phase('measure'):
+            measure.append_experiment(X_t, c, 'compartment', time)
+        if termination is not None:
+            with telemetry.phase('termination'):
+                # A run is not absorbed while an intervention can still change the states
+                absorbing = termination.absorbing and is_absorbing(c, X_t) and (interventions is None or not interventions.can_change_states(time + 1, time_steps + 1, c, X_t))
+                reason = termination.should_stop(time, c, X_t, absorbing)
+            if reason is not None:
+                with telemetry.phase('measure'):
+                    termination.finish(measure, c, X_t, time, time_steps, reason)
+                telemetry.flush(time, c, X_t)
+                return measure.concatenate_experiment()
+        A_t = get_adjacency_at(A, time)
+        if interventions is not None:
+            # Edges of the isolated nodes are masked during the step
+            with telemetry.phase('intervention'):
+                A_t = interventions.adjacency(A_t, time)
+                if edge_hazards is not None and edge_hazards.A is A_t and interventions.changed_positions is not None:
+                    edge_hazards.update(interventions.changed_positions)
+        edge_hazards = get_edge_hazards(edge_hazards, A_t)
+        if kernel is not None and kernel.A is not A_t:
+            kernel.set_matrix(A_t)
+        updates = advance_state(c, A_t, X_t, X_t_plus_1, rng, telemetry, kernel, edge_hazards)
+        if interventions is not None:
+            with telemetry.phase('intervention'):
+                updates += interventions.apply(time + 1, c, X_t_plus_1, get_adjacency_at(A, time + 1), rng, telemetry)
+        if telemetry.enabled:
+            telemetry.add('changed_nodes', sum(np.count_nonzero(X_t[attribute] != X_t_plus_1[attribute]) for attribute in X_t))
+        if measure.records_transitions:
+            with telemetry.phase('measure'):
+                measure.append_transitions(time + 1, *get_state_changes(X_t, X_t_plus_1, updates, 'compartment'))
+        X_t, X_t_plus_1 = X_t_plus_1, X_t
+        telemetry.end_step(time + 1, c, X_t)
+    with telemetry.phase('measure'):
+        measure.append_experiment(X_t, c, 'compartment', time_steps)
+    telemetry.flush(time_steps, c, X_t)
     return measure.concatenate_experiment()
@@ -1,6 +1,9 @@
 import numpy as np
 from .Compartments import *
-import igraph as ig
+from .rng import INITIAL_STATE_STREAM, SEEDING_STREAM, get_column_streams
+
+# Integer type of the node state arrays
+STATE_DTYPE = np.int8
 
 def initialize_compartments(attributes: dict, dynamics: dict, initial_conditions: dict):
     def check_data(c: Compartment, initial_conditions: dict):
@@ -25,35 +28,58 @@ def initialize_compartments(attributes: dict, dynamics: dict, initial_conditions
     
     # Check data consistency between Compartment attributes, dynamics, and initial_conditions
     check_data(c, initial_conditions)
+
+    # Group the rules by initial state and collect the triggering states once
+    c.compile_plan()
     
     return c
 
-def initialize_graph(G_model: ig.Graph, initial_conditions: dict):
+def initialize_state(V: int, c: Compartment, initial_conditions: dict, n_realizations = None, rng = None, seeding = None):
     """
-    Initialize compartments of nodes in the graph G based on given probabilities.
+    Initialize the state of the V nodes based on given probabilities.
+    The number of nodes in each state is drawn from the multinomial distribution and the states are
+    assigned to the nodes by a random permutation, written straight as integer codes.
 
     Parameters:
-        - G_model: Graph object
+        - V: number of nodes
+        - c: Compartment object holding the integer code of each state
         - initial_conditions: Dictionary containing initial probabilities for attributes
+        - n_realizations: if given, draw independent initial conditions for this many realizations
+        - rng: random streams of the realizations (see get_column_streams). Each attribute of each realization has its own stream
+        - seeding: Seeding prepared on the graph (see get_seeding), applied to each realization after the probabilities
     Returns:
-        G: Graph object with initialized attributes
+        X: Dictionary attribute -> numpy array of shape (V,) or (V, n_realizations) with the integer code of each node's state
     """
     def check_normalization(attributes):
-            # Check if the probabilities are normalized
-            sum = 0
-            for _, value in attributes.items():
-                sum += value
-            if sum != 1: raise ValueError(f"Initial conditions on attributes should sum to 1. Their sum is {sum}")
-            
-    G = G_model.copy()
+            # Check if the probabilities are normalized, up to the rounding of their sum
+            total = sum(attributes.values())
+            if not np.isclose(total, 1, rtol = 0, atol = 1e-9): raise ValueError(f"Initial conditions on attributes should sum to 1. Their sum is {total}")
+            return total
+
+    shape = (V,) if n_realizations is None else (V, n_realizations)
+    streams = get_column_streams(rng, shape)
+    attribute_indices = {attribute: index for index, attribute in enumerate(c.attributes)}
+    X = {}
     for attribute in initial_conditions.keys():
-        if attribute == 'compartment':
-            check_normalization(initial_conditions[attribute])
-            # Extract compartment names and probabilities
-            compartments_names, compartments_probs = zip(*initial_conditions[attribute].items())
-            # Initialize compartments for nodes
-            initial_nodes_compartments = np.random.choice(compartments_names, G.vcount(), p=compartments_probs)
-            # Assign compartments to graph nodes
-            G.vs[attribute] = initial_nodes_compartments
-        else: raise ValueError(f"Attribute {attribute} not implemented yet.")
-    return G
\ No newline at end of file
+        if attribute in c.attributes:
+            total = check_normalization(initial_conditions[attribute])
+            # Extract state codes and probabilities
+            states_codes = np.asarray([c.encode(attribute, name) for name in initial_conditions[attribute].keys()], dtype = STATE_DTYPE)
+            states_probs = np.asarray(list(initial_conditions[attribute].values()), dtype = np.float64) / total
+            columns = []
+            for stream in streams:
+                generator = stream.generator(INITIAL_STATE_STREAM, attribute_indices[attribute])
+                # Number of nodes in each state, then a random order of the nodes
+                states = np.repeat(states_codes, generator.multinomial(V, states_probs))
+                generator.shuffle(states)
+                columns.append(states)
+            X[attribute] = columns[0] if n_realizations is None else np.stack(columns, axis = 1)
+        else: raise ValueError(f"Attribute {attribute} not declared in the attributes.")
+    if seeding is not None:
+        if seeding.attribute not in X:
+            raise ValueError(f"Attribute {seeding.attribute} of the seeding not found in the initial conditions")
+        for r, stream in enumerate(streams):
+            # Views on the column of the realization: the seeded nodes are written in place
+            X_r = X if n_realizations is None else {attribute: states[:, r] for attribute, states in X.items()}
+            seeding.apply(X_r, c, stream.generator(SEEDING_STREAM))
+    return X
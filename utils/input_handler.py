@@ -1,8 +1,16 @@
-from configparser import SafeConfigParser
+from configparser import ConfigParser
 import ast
 import os
-from .measurements_graph import *
-import igraph as ig
+import numpy as np
+from .measurements_graph import Measure
+from .infection import sparse_adj_matrix
+from .graph_cache import read_cached_adjacency, load_adjacency, adjacency_store_extension
+from .edge_list import edge_list_extensions, read_edge_list_adjacency, partition_edge_list, write_temporal_edge_list
+from .partitioned import PartitionedAdjacency, partitioned_store_extension, read_partitioned_adjacency, save_partitioned_adjacency
+from .temporal import TemporalAdjacency, temporal_store_extension, read_temporal_adjacency
+from .lazy import lazy_import
+
+ig = lazy_import('igraph')
 
 def check_file_existance(path, describer):
     if os.path.exists(path) is False:
@@ -10,7 +18,7 @@ def check_file_existance(path, describer):
 
 def read_input_config(config_path):
 
-    config = SafeConfigParser()
+    config = ConfigParser()
     config.read(config_path)
     check_file_existance(config_path, 'Configuration')
 
@@ -20,11 +28,34 @@ def read_input_config(config_path):
     experiment_output_path = config.get('experiment output path', 'experiment_output_path')
     
     return epidemics_path, graph_path, report_path, experiment_output_path
-    
+
+def read_graph_options(config_path):
+    """
+    Read the optional settings of the [graph file path] section.
+    """
+    check_file_existance(config_path, 'Configuration')
+    config = ConfigParser()
+    config.read(config_path)
+
+    options = {}
+    # Binary adjacency cache: enabled by default, stored next to the graph unless cache_dir is given
+    options['use_cache'] = config.getboolean('graph file path', 'use_cache', fallback = True)
+    options['cache_dir'] = config.get('graph file path', 'cache_dir', fallback = None)
+    # Direction of the edges of edge list files. GraphML and pickle graphs carry their own
+    options['directed'] = config.getboolean('graph file path', 'directed', fallback = False)
+    # Out-of-core mode: adjacency stored in the cache as this number of row blocks, memory-mapped one at a time. 0 to disable it
+    options['partitions'] = config.getint('graph file path', 'partitions', fallback = 0)
+    # Weighted edges: third column of edge lists, 'weight' edge attribute of GraphML and pickle graphs
+    options['weighted'] = config.getboolean('graph file path', 'weighted', fallback = False)
+    # Temporal contacts: edge list of (source, target, time[, weight]) grouped in windows of this length. None for a static graph
+    options['window'] = config.getfloat('graph file path', 'window', fallback = None)
+    options['steps_per_window'] = config.getint('graph file path', 'steps_per_window', fallback = 1)
+    return options
+
 def read_epidemics_config(epidemics_path):
     
     check_file_existance(epidemics_path, 'Epidemics configuration')
-    config = SafeConfigParser()
+    config = ConfigParser()
     config.read(epidemics_path)
     print(config.sections())
     # Extract compartments' names
@@ -45,12 +76,83 @@ def read_epidemics_config(epidemics_path):
     
     return attributes, dynamics, initial_conditions, time_steps, meas_func
 
+def read_experiment_options(epidemics_path):
+    """
+    Read the optional settings of the [experiment] section.
+    Settings missing from the file take their default value.
+    """
+    check_file_existance(epidemics_path, 'Epidemics configuration')
+    config = ConfigParser()
+    config.read(epidemics_path)
+
+    options = {}
+    # Ensemble mode: number of realizations, realizations advanced together and quantiles reported
+    options['n_realizations'] = config.getint('experiment', 'n_realizations', fallback = 1)
+    options['realizations_per_batch'] = config.getint('experiment', 'realizations_per_batch', fallback = None)
+    options['quantiles'] = ast.literal_eval(config.get('experiment', 'quantiles', fallback = '[0.05, 0.5, 0.95]'))
+    if options['n_realizations'] < 1:
+        raise ValueError(f"n_realizations should be a positive integer. Got {options['n_realizations']}")
+    # Simulation engine: 'discrete' time steps, 'frontier', continuous-time 'gillespie' or one of the analytic mean-field engines
+    options['engine'] = config.get('experiment', 'engine', fallback = 'discrete')
+    if options['n_realizations'] > 1 and options['engine'] != 'discrete':
+        raise ValueError(f"The ensemble mode is only available with the discrete engine. Got {options['engine']}")
+    # Random seed of the experiment. Default: fresh entropy, printed so that the run can be replayed
+    options['seed'] = config.getint('experiment', 'seed', fallback = None)
+    # Single run mode: realization of the ensemble with the same seed that is simulated
+    options['replay_realization'] = config.getint('experiment', 'replay_realization', fallback = 0)
+    # Early stops, off by default: once no rule can fire, and optionally once the fraction of nodes in each compartment is stable
+    options['stop_when_absorbed'] = config.getboolean('experiment', 'stop_when_absorbed', fallback = False)
+    options['steady_state_tolerance'] = config.getfloat('experiment', 'steady_state_tolerance', fallback = None)
+    options['steady_state_window'] = config.getint('experiment', 'steady_state_window', fallback = 20)
+    # Measurements after an early stop: 'pad' repeats the final state up to time_steps, 'truncate' ends at the stop
+    options['horizon'] = config.get('experiment', 'horizon', fallback = 'pad')
+    # Time steps between two checkpoints of a single run, 0 to disable them
+    options['checkpoint_every'] = config.getint('experiment', 'checkpoint_every', fallback = 0)
+    if options['checkpoint_every'] > 0 and options['n_realizations'] > 1:
+        raise ValueError("Checkpoints are only available for single runs, with n_realizations = 1")
+    # Worker threads of the neighbor counts and sampling of a single run with the discrete engine
+    options['threads'] = config.getint('experiment', 'threads', fallback = 1)
+    if options['threads'] > 1 and (options['engine'] != 'discrete' or options['n_realizations'] > 1):
+        raise ValueError("Threads are only available for single runs with the discrete engine")
+    # Per-step telemetry of a single run, written as JSON lines every telemetry_every steps. None to disable it
+    options['telemetry_path'] = config.get('experiment', 'telemetry_path', fallback = None)
+    options['telemetry_every'] = config.getint('experiment', 'telemetry_every', fallback = 1)
+    # Structured seeding of the [initial_conditions] section, applied on top of the initial probabilities. None to disable it
+    options['seeding'] = ast.literal_eval(config.get('initial_conditions', 'seeding', fallback = 'None'))
+    # Interventions of the [interventions] section, one dictionary of settings per intervention name, applied at every step of a single run
+    options['interventions'] = {name: ast.literal_eval(value) for name, value in config.items('interventions')} if config.has_section('interventions') else {}
+    if options['interventions'] and (options['engine'] != 'discrete' or options['n_realizations'] > 1):
+        raise ValueError("Interventions are only available for single runs with the discrete engine")
+
+    return options
+
+def read_sweep_config(sweep_path):
+    check_file_existance(sweep_path, 'Sweep configuration')
+    config = ConfigParser()
+    config.read(sweep_path)
+
+    epidemics_path = config.get('sweep', 'epidemics_path')
+    graph_paths = ast.literal_eval(config.get('sweep', 'graph_paths'))
+    prob_ranges = ast.literal_eval(config.get('sweep', 'prob_ranges'))
+    # Seeds are either a list or the number of seeds to use
+    seeds = ast.literal_eval(config.get('sweep', 'seeds'))
+    if isinstance(seeds, int):
+        seeds = list(range(seeds))
+    initial_conditions_str = config.get('sweep', 'initial_conditions', fallback = None)
+    initial_conditions = None if initial_conditions_str is None else ast.literal_eval(initial_conditions_str)
+    runs_dir = config.get('sweep output', 'runs_dir')
+    output_path = config.get('sweep output', 'output_path')
+
+    return epidemics_path, graph_paths, prob_ranges, seeds, initial_conditions, runs_dir, output_path
+
 def read_input_graph(graph_path):
     check_file_existance(graph_path, 'Graph')
     if graph_path.endswith(".graphml"):
         G = ig.Graph.Read_GraphML(graph_path)
     elif graph_path.endswith(".pickle"):
         G = ig.Graph.Read_Pickle(graph_path)
+    elif graph_path.endswith(edge_list_extensions):
+        raise TypeError("Edge lists are not read as igraph Graphs. Use read_input_adjacency")
     else:
         raise TypeError("The graph extension is not supported")
 
@@ -62,3 +164,84 @@ def read_input_graph(graph_path):
         G['name'] = graph_name
     
     return G
+
+def build_adjacency_from_graph(graph_path, weight_attribute = None):
+    """
+    Read the graph and build its adjacency matrix, weighted by the edge attribute weight_attribute if given.
+
+    Returns:
+        A: sparse adjacency matrix
+        meta: Dictionary with the graph name, direction, number of nodes and edges
+        node_attributes: Dictionary with the string and numeric vertex attributes
+    """
+    G = read_input_graph(graph_path)
+    meta = {'name': G['name'], 'directed': G.is_directed(), 'vcount': G.vcount(), 'ecount': G.ecount()}
+    node_attributes = {}
+    for attribute in G.vs.attributes():
+        values = np.asarray(G.vs[attribute])
+        if values.dtype.kind in 'biufU':
+            node_attributes[attribute] = values
+    return sparse_adj_matrix(G, weight_attribute = weight_attribute), meta, node_attributes
+
+def read_input_adjacency(graph_path, use_cache = True, cache_dir = None, directed = False, partitions = 0, weighted = False, window = None,
+                         steps_per_window = 1):
+    """
+    Adjacency matrix of the graph in graph_path.
+    GraphML and pickle files are read with igraph, while edge lists are streamed straight to the adjacency matrix.
+    Binary adjacency stores (.csr directories written by save_adjacency) are memory-mapped.
+    With use_cache the matrix is memory-mapped from the binary cache, which is filled on the first run.
+    With partitions the matrix is stored in the cache as row blocks and returned as a PartitionedAdjacency:
+    edge lists are partitioned out of core. Partitioned stores (.parts directories) are opened as they are.
+    With window the edge list is a contact trace, stored in the cache as one snapshot per window and returned
+    as a TemporalAdjacency. Temporal stores (.temporal directories) are opened as they are.
+
+    Parameters:
+        - graph_path: path of the graph file
+        - use_cache: whether to use the binary adjacency cache
+        - cache_dir: directory of the cache
+        - directed: direction of the edges of an edge list
+        - partitions: number of row blocks of the out-of-core mode, 0 to disable it
+        - weighted: read the weights of the edges
+        - window: length of the time windows of a contact trace, None for a static graph
+        - steps_per_window: number of time steps of the simulation spent in each window
+    Returns:
+        A: sparse adjacency matrix, PartitionedAdjacency or TemporalAdjacency
+        meta: Dictionary with the graph name, direction, number of nodes and edges
+    """
+    check_file_existance(graph_path, 'Graph')
+    # Binary adjacency stores are memory-mapped as they are
+    if graph_path.rstrip(os.sep).endswith(adjacency_store_extension):
+        A, meta, _ = load_adjacency(graph_path)
+        return A, meta
+    if graph_path.rstrip(os.sep).endswith(partitioned_store_extension):
+        A = PartitionedAdjacency(graph_path)
+        return A, A.get_graph_meta()
+    if graph_path.rstrip(os.sep).endswith(temporal_store_extension):
+        A = TemporalAdjacency(graph_path, steps_per_window)
+        return A, A.get_graph_meta()
+    if graph_path.endswith(edge_list_extensions):
+        build_adjacency = lambda path: read_edge_list_adjacency(path, directed, weighted = weighted)
+        variant = ('directed' if directed else 'undirected') + ('_weighted' if weighted else '')
+    else:
+        build_adjacency = lambda path: build_adjacency_from_graph(path, 'weight' if weighted else None)
+        variant = 'graph' + ('_weighted' if weighted else '')
+    if window is not None:
+        if not graph_path.endswith(edge_list_extensions):
+            raise TypeError("Temporal contacts are read from edge lists of (source, target, time[, weight])")
+        build_snapshots = lambda path, directory, window: write_temporal_edge_list(path, directory, window, directed, weighted)
+        return read_temporal_adjacency(graph_path, window, build_snapshots, cache_dir, variant, steps_per_window)
+    if partitions > 0:
+        if graph_path.endswith(edge_list_extensions) and weighted:
+            raise ValueError("Weighted edge lists cannot be partitioned out of core yet")
+        if graph_path.endswith(edge_list_extensions):
+            build_partitions = lambda path, directory, n_partitions: partition_edge_list(path, directory, n_partitions, directed)
+        else:
+            def build_partitions(path, directory, n_partitions):
+                A, meta, _ = build_adjacency(path)
+                save_partitioned_adjacency(A, directory, n_partitions, meta)
+        return read_partitioned_adjacency(graph_path, partitions, build_partitions, cache_dir, variant)
+    if use_cache:
+        A, meta, _ = read_cached_adjacency(graph_path, build_adjacency, cache_dir, variant)
+    else:
+        A, meta, _ = build_adjacency(graph_path)
+    return A, meta
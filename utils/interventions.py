@@ -0,0 +1,327 @@
+import abc
+import numpy as np
+from scipy.sparse import csr_matrix
+from .Compartments import Compartment
+from .frontier import gather_rows
+from .rng import INTERVENTION_STREAM
+
+class PrevalenceTrigger:
+    """
+    True while the fraction of nodes in state is at least above and below below, e.g. {'state': 'infected', 'above': 0.01}.
+    """
+    def __init__(self, state, above = None, below = None, attribute = 'compartment'):
+        self.state = state
+        self.above = above
+        self.below = below
+        self.attribute = attribute
+
+    def __call__(self, time, c: Compartment, X: dict):
+        states = X[self.attribute]
+        prevalence = np.count_nonzero(states == c.encode(self.attribute, self.state)) / states.shape[0]
+        return (self.above is None or prevalence >= self.above) and (self.below is None or prevalence < self.below)
+
+class Intervention(abc.ABC):
+    """
+    Control policy acting once per step of simulate_epidemic on the state arrays and on the contacts of the nodes,
+    through vectorized masks: the graph itself is never modified.
+
+    Parameters:
+        - name: name of the intervention, used as rule name in the transition log
+        - start: first time the intervention acts
+        - stop: time from which it stops acting. None for no end
+        - every: time steps between two actions
+        - trigger: condition checked before each action: a dictionary of PrevalenceTrigger settings or a function (time, c, X) -> bool
+        - budget: maximum number of nodes acted on over the run, e.g. doses or quarantine places. None for no limit
+        - attribute: attribute of the states the intervention reads and writes
+    """
+    def __init__(self, name, start = 0, stop = None, every = 1, trigger = None, budget = None, attribute = 'compartment'):
+        if every < 1:
+            raise ValueError(f"Interventions should act every positive number of steps. Got {every}")
+        self.name = name
+        self.start = start
+        self.stop = stop
+        self.every = every
+        self.trigger = PrevalenceTrigger(attribute = attribute, **trigger) if isinstance(trigger, dict) else trigger
+        self.budget = budget
+        self.attribute = attribute
+        self.spent = 0
+
+    def states(self):
+        """
+        Names of the states the intervention refers to, checked against the compartments before the run.
+        """
+        return [] if not isinstance(self.trigger, PrevalenceTrigger) else [self.trigger.state]
+
+    # Whether act can move nodes between states, e.g. vaccination, rather than only isolating them
+    changes_states = False
+
+    def remaining(self):
+        return np.inf if self.budget is None else self.budget - self.spent
+
+    def can_act(self, time, horizon, c: Compartment, X: dict):
+        """
+        True if the intervention may act at a time from time to horizon - 1 on the state X, which no rule changes any more:
+        at a due time before its stop time, with budget left and with its trigger true.
+        """
+        if self.remaining() <= 0:
+            return False
+        first = max(time, self.start)
+        first += -(first - self.start) % self.every
+        last = horizon if self.stop is None else min(horizon, self.stop)
+        if first >= last:
+            return False
+        if self.trigger is None or isinstance(self.trigger, PrevalenceTrigger):
+            # A prevalence trigger only reads X
+            return self.trigger is None or self.trigger(first, c, X)
+        return any(self.trigger(due, c, X) for due in range(first, last, self.every))
+
+    def is_due(self, time, c: Compartment, X: dict):
+        if time < self.start or (self.stop is not None and time >= self.stop) or (time - self.start) % self.every != 0:
+            return False
+        return self.remaining() > 0 and (self.trigger is None or self.trigger(time, c, X))
+
+    @abc.abstractmethod
+    def act(self, time, c: Compartment, X: dict, A: csr_matrix, controls, stream):
+        """
+        Act on the state X at time. A is the adjacency of the contacts, controls the Interventions of the run
+        holding the isolation of the nodes and stream the uniform numbers of the intervention.
+
+        Returns:
+            nodes whose state changed, or None
+        """
+
+def choose_nodes(candidates: np.ndarray, k, stream, priority = None):
+    """
+    k of the candidate nodes: the ones with the highest priority, ties broken at random, or uniformly at random.
+    """
+    if k >= candidates.shape[0]:
+        return candidates
+    # Random keys in [0, 0.5) do not change the order of integer priorities
+    keys = stream.random(candidates.shape[0]) * 0.5
+    if priority is not None:
+        keys = keys - priority
+    return candidates[np.argpartition(keys, k - 1)[:k]]
+
+class Vaccination(Intervention):
+    """
+    Move count nodes (or a fraction of all the nodes) per action from state to final_state: the ones of highest
+    degree ('degree' target) or random ones ('random' target).
+    """
+    def __init__(self, name, state = 'susceptible', final_state = 'removed', count = None, fraction = None, target = 'random', **options):
+        super().__init__(name, **options)
+        if target not in ('random', 'degree'):
+            raise ValueError(f"Vaccination target {target} not implemented yet. Choose between random, degree")
+        if count is None and fraction is None:
+            raise ValueError(f"Vaccination {name} needs either the count or the fraction of nodes vaccinated per action")
+        self.state = state
+        self.final_state = final_state
+        self.count = count
+        self.fraction = fraction
+        self.target = target
+
+    changes_states = True
+
+    def states(self):
+        return super().states() + [self.state, self.final_state]
+
+    def can_act(self, time, horizon, c, X):
+        return (X[self.attribute] == c.encode(self.attribute, self.state)).any() and super().can_act(time, horizon, c, X)
+
+    def act(self, time, c, X, A, controls, stream):
+        states = X[self.attribute]
+        eligible = np.flatnonzero(states == c.encode(self.attribute, self.state))
+        count = self.count if self.count is not None else int(round(self.fraction * states.shape[0]))
+        k = int(min(count, eligible.shape[0], self.remaining()))
+        if k <= 0: return None
+        if self.target == 'degree' and not isinstance(A, csr_matrix):
+            raise ValueError("Vaccination by degree needs a graph held in memory")
+        priority = np.diff(A.indptr)[eligible] if self.target == 'degree' else None
+        chosen = choose_nodes(eligible, k, stream, priority)
+        states[chosen] = c.encode(self.attribute, self.final_state)
+        self.spent += chosen.shape[0]
+        return chosen
+
+class Quarantine(Intervention):
+    """
+    Isolate the nodes in state, each detected with probability per action, for duration steps:
+    their edges are masked in both directions while they are isolated.
+    """
+    def __init__(self, name, state = 'infected', duration = 14, probability = 1.0, **options):
+        super().__init__(name, **options)
+        self.state = state
+        self.duration = duration
+        self.probability = probability
+
+    def states(self):
+        return super().states() + [self.state]
+
+    def act(self, time, c, X, A, controls, stream):
+        candidates = np.flatnonzero((X[self.attribute] == c.encode(self.attribute, self.state)) & ~controls.is_isolated(time))
+        if self.probability < 1:
+            candidates = candidates[stream.random(candidates.shape[0]) < self.probability]
+        isolated = choose_nodes(candidates, int(min(candidates.shape[0], self.remaining())), stream)
+        controls.isolate(isolated, time + self.duration)
+        self.spent += isolated.shape[0]
+        return None
+
+class ContactTracing(Intervention):
+    """
+    Isolate for duration steps the contacts of the nodes in state, each traced with probability per action.
+    """
+    def __init__(self, name, state = 'infected', duration = 14, probability = 1.0, **options):
+        super().__init__(name, **options)
+        self.state = state
+        self.duration = duration
+        self.probability = probability
+
+    def states(self):
+        return super().states() + [self.state]
+
+    def act(self, time, c, X, A, controls, stream):
+        if not isinstance(A, csr_matrix):
+            raise ValueError("Contact tracing needs a graph held in memory")
+        sources = np.flatnonzero(X[self.attribute] == c.encode(self.attribute, self.state))
+        contacts = A.indices[gather_rows(A.indptr, sources)]
+        if self.probability < 1:
+            contacts = contacts[stream.random(contacts.shape[0]) < self.probability]
+        contacts = np.unique(contacts)
+        contacts = contacts[~controls.is_isolated(time)[contacts]]
+        traced = choose_nodes(contacts, int(min(contacts.shape[0], self.remaining())), stream)
+        controls.isolate(traced, time + self.duration)
+        self.spent += traced.shape[0]
+        return None
+
+available_interventions = {'vaccination': Vaccination, 'quarantine': Quarantine, 'contact_tracing': ContactTracing}
+
+class MaskedAdjacency:
+    """
+    Adjacency A with the entries of the rows and columns of the isolated nodes zeroed. The matrix shares the indices
+    and row pointers of A and owns a copy of its data, updated in place on the entries of the nodes whose isolation changed.
+    """
+    def __init__(self, A: csr_matrix):
+        self.A = A
+        self.isolated = np.zeros(A.shape[0], dtype = bool)
+        self.matrix = csr_matrix((A.data.copy(), A.indices, A.indptr), shape = A.shape, copy = False)
+        # Positions of the entries of each column, sorted by column, to find the entries pointing to a node
+        self.column_positions = np.argsort(A.indices, kind = 'stable')
+        self.column_indptr = np.concatenate([[0], np.cumsum(np.bincount(A.indices, minlength = A.shape[1]))])
+
+    def update(self, isolated: np.ndarray):
+        """
+        Mask the edges of the nodes isolated, and restore the edges of the other nodes.
+
+        Returns:
+            positions of the entries of the matrix that were updated
+        """
+        changed = np.flatnonzero(isolated != self.isolated)
+        positions = np.unique(np.concatenate([gather_rows(self.A.indptr, changed),
+                                              self.column_positions[gather_rows(self.column_indptr, changed)]]))
+        rows = np.searchsorted(self.A.indptr, positions, side = 'right') - 1
+        keep = ~(isolated[rows] | isolated[self.A.indices[positions]])
+        self.matrix.data[positions] = np.where(keep, self.A.data[positions], 0)
+        self.isolated = isolated.copy()
+        return positions
+
+class Interventions:
+    """
+    Interventions of a single run, applied in order by simulate_epidemic at time 0 and after each step,
+    and the isolation of the nodes they quarantined. Each intervention draws from its own substream.
+
+    Parameters:
+        - interventions: list of Intervention
+        - V: number of nodes
+    """
+    def __init__(self, interventions: list, V):
+        self.interventions = interventions
+        # Time at which the isolation of each node ends
+        self.isolated_until = np.zeros(V, dtype = np.int64)
+        self.masked = None
+        # Entries of the matrix returned by the last call of adjacency updated since the previous call, None if the matrix is new
+        self.changed_positions = None
+
+    @property
+    def names(self):
+        return [intervention.name for intervention in self.interventions]
+
+    def check(self, c: Compartment):
+        for intervention in self.interventions:
+            for state in intervention.states():
+                if state not in c.attributes[intervention.attribute]:
+                    raise ValueError(f"State {state} of the intervention {intervention.name} not found. Choose between {', '.join(c.state_names(intervention.attribute))}")
+
+    def can_change_states(self, time, horizon, c: Compartment, X: dict):
+        """
+        True while an intervention may still move nodes between states from time to horizon - 1: the state X of the
+        run is not absorbing even if no rule can fire.
+        """
+        return any(intervention.changes_states and intervention.can_act(time, horizon, c, X) for intervention in self.interventions)
+
+    def is_isolated(self, time):
+        return self.isolated_until > time
+
+    def isolate(self, nodes: np.ndarray, until):
+        self.isolated_until[nodes] = np.maximum(self.isolated_until[nodes], until)
+
+    def apply(self, time, c: Compartment, X: dict, A, rng, telemetry):
+        """
+        Let every intervention due at time act on X.
+
+        Returns:
+            updates: list of (intervention, boolean mask of the nodes whose state it changed), one per intervention
+        """
+        updates = []
+        for index, intervention in enumerate(self.interventions):
+            changed = np.zeros(X[intervention.attribute].shape, dtype = bool)
+            if intervention.is_due(time, c, X):
+                nodes = intervention.act(time, c, X, A, self, rng.stream(INTERVENTION_STREAM, index))
+                if nodes is not None:
+                    changed[nodes] = True
+                    telemetry.add('intervened_nodes', nodes.shape[0])
+            updates.append((intervention, changed))
+        return updates
+
+    def adjacency(self, A, time):
+        """
+        Adjacency of the step from time: the entries of the rows and columns of the isolated nodes are zeroed.
+        The masked matrix is built once per A, then only the entries of the nodes whose isolation changed are updated.
+        """
+        isolated = self.is_isolated(time)
+        self.changed_positions = None
+        if self.masked is None or self.masked.A is not A:
+            if not isolated.any():
+                return A
+            if not isinstance(A, csr_matrix):
+                raise ValueError("Isolating nodes needs a graph held in memory")
+            self.masked = MaskedAdjacency(A)
+            self.masked.update(isolated)
+            return self.masked.matrix
+        positions = self.masked.update(isolated)
+        if not isolated.any():
+            return A
+        self.changed_positions = positions
+        return self.masked.matrix
+
+    def get_checkpoint(self):
+        return {'isolated_until': self.isolated_until.copy(), 'spent': [intervention.spent for intervention in self.interventions]}
+
+    def restore_checkpoint(self, checkpoint: dict):
+        self.isolated_until = checkpoint['isolated_until'].copy()
+        for intervention, spent in zip(self.interventions, checkpoint['spent']):
+            intervention.spent = spent
+        self.masked = None
+
+def get_interventions(settings: dict, V):
+    """
+    Interventions built from the [interventions] section: intervention name -> dictionary with its 'type' and settings.
+    None if there is no intervention.
+    """
+    if not settings:
+        return None
+    interventions = []
+    for name, setting in settings.items():
+        setting = dict(setting)
+        kind = setting.pop('type', None)
+        if kind not in available_interventions:
+            raise ValueError(f"Intervention {kind} not implemented yet. Choose between {', '.join(available_interventions)}")
+        interventions.append(available_interventions[kind](name, **setting))
+    return Interventions(interventions, V)
@@ -0,0 +1,19 @@
+import sys
+import importlib.util
+
+def lazy_import(name):
+    """
+    Module name, imported on the first access to one of its attributes. Heavy dependencies such as pandas,
+    igraph or scipy.integrate are loaded only by the runs whose graph format, engine or measurement mode uses them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name = name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
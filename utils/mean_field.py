@@ -0,0 +1,212 @@
+import numpy as np
+import itertools
+from scipy.sparse import csr_matrix
+from .Compartments import Compartment
+from .initialize_data import initialize_compartments
+from .sweep import expand_prob_range
+from .weighted import check_static_unweighted
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+integrate = lazy_import('scipy.integrate')
+
+# Engine name -> (approximation, time) of the analytic engines selected by the 'engine' setting
+analytic_engines = {'mean_field': ('hmf', 'discrete'),
+                    'mean_field_continuous': ('hmf', 'continuous'),
+                    'pair_approximation': ('pair', 'continuous')}
+
+def get_degree_classes(A: csr_matrix):
+    """
+    Returns:
+        degrees: sorted array of the distinct degrees
+        fractions: fraction of the nodes with each degree
+        class_index: degree class of each node
+    """
+    node_degrees = np.asarray(A.sum(axis = 1)).ravel()
+    degrees, class_index, counts = np.unique(node_degrees, return_inverse = True, return_counts = True)
+    return degrees.astype(np.float64), counts / node_degrees.shape[0], class_index
+
+def get_attribute_rules(c: Compartment, attribute):
+    """
+    Rules of attribute as tuples (initial code, final code, hazard, triggering code or None).
+    Rules that do not change the state are dropped. Attributes evolve independently of each other,
+    since the rules of an attribute only read that attribute.
+    """
+    rules = []
+    for group in c.get_plan().groups.values():
+        if group.attribute != attribute: continue
+        for hazard, final_code, trigger in zip(group.hazards, group.final_codes, group.triggers):
+            if final_code == group.initial_code: continue
+            rules.append((group.initial_code, final_code, hazard, None if trigger is None else trigger[1]))
+    return rules
+
+def get_neighbor_fractions(x, degrees, fractions):
+    """
+    Probability that the neighbor at the end of a random edge is in each state: sum_k k P(k) x[s, k] / <k>.
+    """
+    mean_degree = np.dot(fractions, degrees)
+    if mean_degree == 0:
+        return np.zeros(x.shape[0])
+    return x.dot(fractions * degrees) / mean_degree
+
+def hmf_discrete_step(x, rules, degrees, fractions):
+    """
+    One time step of the discrete-time engine in the heterogeneous mean-field approximation.
+    The number of neighbors of a node of degree k in state s is Binomial(k, theta_s): a node fires with probability
+    1 - exp(-sum of the 'rate' hazards) * (1 - sum_s theta_s (1 - exp(-h_s)))^k, where h_s is the sum of the hazards of the
+    'neighbor' rules triggered by s, and follows each rule proportionally to its mean hazard.
+
+    Parameters:
+        - x: array of shape (number of states, number of degree classes) with the fraction of each class in each state
+    """
+    theta = get_neighbor_fractions(x, degrees, fractions)
+    x_next = x.copy()
+    for initial_code in {rule[0] for rule in rules}:
+        group = [rule for rule in rules if rule[0] == initial_code]
+        rate_hazard = sum(hazard for _, _, hazard, trigger in group if trigger is None)
+        neighbor_hazards = {}
+        for _, _, hazard, trigger in group:
+            if trigger is not None:
+                neighbor_hazards[trigger] = neighbor_hazards.get(trigger, 0) + hazard
+        escape = 1 - sum(theta[trigger] * -np.expm1(-hazard) for trigger, hazard in neighbor_hazards.items())
+        fire_prob = 1 - np.exp(-rate_hazard) * np.power(escape, degrees)
+        mean_hazards = [np.full(degrees.shape, hazard) if trigger is None else hazard * degrees * theta[trigger] for _, _, hazard, trigger in group]
+        total_hazard = np.sum(mean_hazards, axis = 0)
+        share = np.divide(fire_prob, total_hazard, out = np.zeros(degrees.shape), where = total_hazard > 0)
+        for (_, final_code, _, _), mean_hazard in zip(group, mean_hazards):
+            flow = x[initial_code] * mean_hazard * share
+            x_next[initial_code] -= flow
+            x_next[final_code] += flow
+    return x_next
+
+def hmf_rhs(x, rules, degrees, fractions):
+    """
+    Continuous-time heterogeneous mean-field equations: a node of degree k leaves its state through a 'rate' rule
+    with rate r and through a 'neighbor' rule with rate r k theta_trigger, with r = -log(1 - p) as in the Gillespie engine.
+    """
+    theta = get_neighbor_fractions(x, degrees, fractions)
+    dx = np.zeros(x.shape)
+    for initial_code, final_code, hazard, trigger in rules:
+        flow = hazard * x[initial_code] * (1 if trigger is None else degrees * theta[trigger])
+        dx[initial_code] -= flow
+        dx[final_code] += flow
+    return dx
+
+def pair_rhs(nodes, pairs, rules, closure):
+    """
+    Continuous-time pair approximation. nodes[a] is the number of nodes in state a and pairs[a, b] the number of
+    ordered edges from a node in state a to a node in state b. Triples are closed as
+    [c a b] = closure [c a][a b] / [a], with closure = (<k^2> - <k>) / <k>^2, i.e. (n - 1) / n on n-regular graphs.
+    """
+    d_nodes = np.zeros(nodes.shape)
+    d_pairs = np.zeros(pairs.shape)
+    for initial_code, final_code, hazard, trigger in rules:
+        if trigger is None:
+            node_flow = hazard * nodes[initial_code]
+            # Flow of the pairs (initial, b) for every b, due to the first node changing state
+            pair_flow = hazard * pairs[initial_code]
+        else:
+            node_flow = hazard * pairs[initial_code, trigger]
+            # The trigger can be the second node of the pair or one of the other neighbors of the first node
+            other_neighbors = closure * pairs[trigger, initial_code] / nodes[initial_code] if nodes[initial_code] > 0 else 0.
+            pair_flow = hazard * pairs[initial_code] * ((np.arange(pairs.shape[0]) == trigger) + other_neighbors)
+        d_nodes[initial_code] -= node_flow
+        d_nodes[final_code] += node_flow
+        # Undirected edges: the same flow applies to the pairs (b, initial) through the second node
+        d_pairs[initial_code] -= pair_flow
+        d_pairs[final_code] += pair_flow
+        d_pairs[:, initial_code] -= pair_flow
+        d_pairs[:, final_code] += pair_flow
+    return d_nodes, d_pairs
+
+def simulate_mean_field(c: Compartment, A: csr_matrix, time_steps, initial_conditions = None, X = None, method = 'hmf', time = 'discrete',
+                        attribute = 'compartment'):
+    """
+    Expected number of nodes in each state at times 0, ..., time_steps from mean-field equations built from the rules of c
+    and the degree distribution of A, in the format of the 'aggregate' measurement.
+
+    Parameters:
+        - initial_conditions: Dictionary containing initial probabilities for attributes, used when X is not given
+        - X: initial state of the nodes. It gives the initial fraction of each degree class in each state and, for the
+          pair approximation, the initial number of edges between each pair of states
+        - method: 'hmf' for the heterogeneous mean-field or 'pair' for the pair approximation (undirected graphs)
+        - time: 'discrete' to follow the time steps of the discrete-time engine or 'continuous' for the rates of the
+          Gillespie engine. The pair approximation is continuous only
+    Returns:
+        DataFrame with columns attribute, value, time
+    """
+    if method not in ('hmf', 'pair'):
+        raise ValueError(f"Mean-field method {method} not implemented yet. Choose between hmf, pair")
+    if method == 'pair' and time != 'continuous':
+        raise ValueError("The pair approximation is only available in continuous time")
+    if time not in ('discrete', 'continuous'):
+        raise ValueError(f"Time {time} not implemented yet. Choose between discrete, continuous")
+    check_static_unweighted(A, 'mean-field')
+    rules = get_attribute_rules(c, attribute)
+    n_states = len(c.attributes[attribute])
+    V = A.shape[0]
+    degrees, fractions, class_index = get_degree_classes(A)
+    if X is not None:
+        onehot = np.zeros((V, n_states))
+        onehot[np.arange(V), X[attribute]] = 1
+        class_sizes = np.bincount(class_index, minlength = degrees.shape[0])
+        x0 = np.stack([np.bincount(class_index, weights = onehot[:, s], minlength = degrees.shape[0]) for s in range(n_states)]) / class_sizes
+    else:
+        probs = np.zeros(n_states)
+        for name, prob in initial_conditions[attribute].items():
+            probs[c.encode(attribute, name)] = prob
+        x0 = np.repeat(probs[:, np.newaxis], degrees.shape[0], axis = 1)
+    times = np.arange(time_steps + 1)
+
+    if method == 'hmf' and time == 'discrete':
+        counts = np.empty((time_steps + 1, n_states))
+        x = x0
+        for t in times:
+            counts[t] = V * x.dot(fractions)
+            if t < time_steps: x = hmf_discrete_step(x, rules, degrees, fractions)
+    elif method == 'hmf':
+        shape = x0.shape
+        solution = integrate.solve_ivp(lambda t, y: hmf_rhs(y.reshape(shape), rules, degrees, fractions).ravel(),
+                             (0, time_steps), x0.ravel(), t_eval = times, rtol = 1e-8, atol = 1e-10)
+        counts = V * np.einsum('skt,k->ts', solution.y.reshape(shape + (len(times),)), fractions)
+    else:
+        nodes0 = V * x0.dot(fractions)
+        if X is not None:
+            # Exact initial pairs of the undirected graph
+            A_undirected = ((A + A.T) > 0).astype(np.float64)
+            pairs0 = onehot.T @ (A_undirected @ onehot)
+        else:
+            pairs0 = V * np.dot(fractions, degrees) * np.outer(x0[:, 0], x0[:, 0])
+        mean_degree = np.dot(fractions, degrees)
+        closure = np.dot(fractions, degrees * (degrees - 1)) / mean_degree ** 2 if mean_degree > 0 else 0.
+        def rhs(t, y):
+            d_nodes, d_pairs = pair_rhs(y[:n_states], y[n_states:].reshape(n_states, n_states), rules, closure)
+            return np.concatenate([d_nodes, d_pairs.ravel()])
+        solution = integrate.solve_ivp(rhs, (0, time_steps), np.concatenate([nodes0, pairs0.ravel()]), t_eval = times, rtol = 1e-8, atol = 1e-8)
+        counts = solution.y[:n_states].T
+
+    time_index, state_index = np.indices(counts.shape)
+    return pd.DataFrame({attribute: np.asarray(c.state_names(attribute), dtype = object)[state_index.ravel()],
+                         'value': counts.ravel(), 'time': time_index.ravel()})
+
+def screen_mean_field(A: csr_matrix, attributes, dynamics, initial_conditions, prob_ranges: dict, time_steps, engine = 'mean_field'):
+    """
+    Mean-field curves over the grid of transition probabilities, to pick the points worth simulating.
+
+    Parameters:
+        - prob_ranges: Dictionary transition rule name -> probability range, as in the sweep configuration
+        - engine: name of the analytic engine
+    Returns:
+        DataFrame with one prob_<rule name> column per swept rule followed by the columns of simulate_mean_field
+    """
+    method, time = analytic_engines[engine]
+    rule_names = list(prob_ranges.keys())
+    curves = []
+    for probs in itertools.product(*(expand_prob_range(prob_ranges[name]) for name in rule_names)):
+        probs = dict(zip(rule_names, probs))
+        point_dynamics = {key: dict(rule, prob = probs.get(rule['name'], rule['prob'])) for key, rule in dynamics.items()}
+        c = initialize_compartments(attributes, point_dynamics, initial_conditions)
+        curve_df = simulate_mean_field(c, A, time_steps, initial_conditions, method = method, time = time)
+        curves.append(curve_df.assign(**{f'prob_{name}': float(p) for name, p in probs.items()}))
+    screen_df = pd.concat(curves, ignore_index = True)
+    return screen_df[[f'prob_{name}' for name in rule_names] + [column for column in screen_df.columns if not column.startswith('prob_')]]
@@ -1,48 +1,249 @@
 import numpy as np
-import pandas as pd
-import igraph as ig
-from collections import Counter
+import os
+import json
+import struct
+from .transition_log import TransitionLog
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Extensions of the experiment output path for which detailed measurements are written to disk step by step
+streaming_extensions = ('.parquet', '.npy')
+# Streamed files that can be truncated back to a checkpoint
+checkpoint_streaming_extensions = ('.npy',)
 
 class Measure:
     def __init__(self, meas_mode_str):
-        available_modes = ['aggregate', 'detailed']
+        available_modes = ['aggregate', 'detailed', 'transitions']
         if meas_mode_str not in available_modes:
             raise ValueError(f"Measure function not implemented yet. Choose between {', '.join(available_modes)}")
+        self.meas_mode = meas_mode_str
+        self.sink = None
+        # Time and reason of an early stop of the run, if any
+        self.stop_time = None
+        self.stop_reason = None
+        # Engines report the state changes of each step only to measurements that record them
+        self.records_transitions = False
+        # Names logged for the state changes made by interventions, after the rule names
+        self.intervention_names = []
         if meas_mode_str == 'aggregate':
             self.experiment_data = []
-            self.meas_func = measure_aggregate_on_G
+            self.meas_func = measure_aggregate_on_state
             self.append_experiment = self._simple_append
             self.concatenate_experiment = self._simple_concat
         elif meas_mode_str == 'detailed':
             self.experiment_data = []
-            self.meas_func = measure_detailed_on_G
+            self.meas_func = measure_detailed_on_state
             self.append_experiment = self._simple_append
             self.concatenate_experiment = self._simple_concat
-            
-    def _simple_append(self, G, attribute_string, t):
-        results = self.meas_func(G, attribute_string, t)
+        elif meas_mode_str == 'transitions':
+            self.experiment_data = TransitionLog()
+            self.records_transitions = True
+            self.append_experiment = self._log_append
+            self.concatenate_experiment = self._log_concat
+
+    def _simple_append(self, X, c, attribute_string, t):
+        results = self.meas_func(X[attribute_string], c.state_names(attribute_string), attribute_string, t)
         self.experiment_data.append(results)
     def _simple_concat(self):
-        return pd.concat([data for data in self.experiment_data])
+        experiment_df = pd.concat([data for data in self.experiment_data])
+        if self.stop_time is not None:
+            experiment_df.attrs.update(stop_time = self.stop_time, stop_reason = self.stop_reason)
+        return experiment_df
+
+    def _log_append(self, X, c, attribute_string, t):
+        # Only the first snapshot is stored, the rest comes from append_transitions
+        if self.experiment_data.initial_state is None:
+            rule_names = [transition.name for transition in c.transition_rules] + self.intervention_names
+            self.experiment_data.set_initial(X[attribute_string], c.state_names(attribute_string), rule_names, attribute_string)
+        self.experiment_data.times.append(t)
+    def _log_concat(self):
+        return self.experiment_data
+
+    def set_stop(self, time, reason):
+        """
+        Flag that the run stopped early at time: kept in the attrs of the DataFrame, in the sidecar of
+        streamed measurements and in the transition log.
+        """
+        self.stop_time = time
+        self.stop_reason = reason
+        for target in (self.sink, self.experiment_data if self.meas_mode == 'transitions' else None):
+            if target is not None:
+                target.stop_time, target.stop_reason = time, reason
+
+    def append_transitions(self, t, nodes, from_codes, to_codes, rule_indices):
+        """
+        Record the state changes at time t of the measured attribute.
+        rule_indices are positions in the Compartment transition_rules list.
+        """
+        self.experiment_data.append(t, nodes, from_codes, to_codes, rule_indices)
+
+    def stream_to(self, output_path):
+        """
+        Write each detailed measurement straight to output_path instead of keeping it in memory.
+        The file is finalized by save_simulation_df.
+        """
+        if self.meas_mode != 'detailed':
+            raise ValueError(f"Only detailed measurements can be streamed. Measurement mode is {self.meas_mode}")
+        if output_path.endswith('.parquet'):
+            self.sink = ParquetSink(output_path)
+        elif output_path.endswith('.npy'):
+            self.sink = NpySink(output_path)
+        else: raise ValueError(f"Streaming not implemented for {output_path}. Choose between {', '.join(streaming_extensions)}")
+        self.append_experiment = self._stream_append
+        self.concatenate_experiment = self._stream_concat
+
+    def _stream_append(self, X, c, attribute_string, t):
+        self.sink.append(X[attribute_string], c.state_names(attribute_string), attribute_string, t)
+    def _stream_concat(self):
+        return self.sink
+
+    def get_checkpoint(self):
+        """
+        Picklable copy of the measurements recorded so far. Streamed measurements are flushed to disk
+        and only their position in the file is kept.
+        """
+        if self.sink is not None:
+            return {'sink': self.sink.get_checkpoint()}
+        return {'experiment_data': self.experiment_data}
+
+    def restore_checkpoint(self, checkpoint: dict):
+        if self.sink is not None:
+            self.sink.restore_checkpoint(checkpoint['sink'])
+        else:
+            self.experiment_data = checkpoint['experiment_data']
+
+class MeasurementSink:
+    """
+    Detailed measurements written to disk one time step at a time, with states stored as int8 codes.
+    Peak memory is bounded by a single step.
+    """
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.state_names = None
+        self.attribute_name = None
+        self.times = []
+        self.stop_time = None
+        self.stop_reason = None
+
+    def append(self, states: np.ndarray, state_names: list, attribute_name, t: int):
+        if self.state_names is None:
+            self.state_names = list(state_names)
+            self.attribute_name = attribute_name
+            self._open(states.shape[0])
+        self._write(states.astype(np.int8, copy = False), t)
+        self.times.append(t)
+
+    def finalize(self):
+        self._close()
+        return self.output_path
+
+class NpySink(MeasurementSink):
+    """
+    A (T, V) int8 .npy file, one row per measurement, with a JSON sidecar holding the state names and times.
+    The header is written when the file is finalized, so that the number of rows does not need to be known in advance.
+    """
+    header_size = 128
+
+    def _open(self, V):
+        self.V = V
+        self.file = open(self.output_path, 'wb')
+        self.file.write(b' ' * self.header_size)
+
+    def _write(self, states, t):
+        self.file.write(states.tobytes())
+
+    def get_checkpoint(self):
+        if self.state_names is None:
+            return {'state_names': None}
+        self.file.flush()
+        return {'state_names': self.state_names, 'attribute_name': self.attribute_name, 'times': list(self.times), 'V': self.V}
+
+    def restore_checkpoint(self, checkpoint: dict):
+        if checkpoint['state_names'] is None: return
+        self.state_names = checkpoint['state_names']
+        self.attribute_name = checkpoint['attribute_name']
+        self.times = list(checkpoint['times'])
+        self.V = checkpoint['V']
+        # Drop the rows written after the checkpoint and continue from there
+        self.file = open(self.output_path, 'r+b')
+        self.file.truncate(self.header_size + len(self.times) * self.V)
+        self.file.seek(0, os.SEEK_END)
+
+    def _close(self):
+        # npy format 1.0: magic string, version, header length and a dictionary padded with spaces
+        header = repr({'descr': '|i1', 'fortran_order': False, 'shape': (len(self.times), self.V)}).encode('latin1')
+        header = header.ljust(self.header_size - 10 - 1) + b'\n'
+        self.file.seek(0)
+        self.file.write(b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) + header)
+        self.file.close()
+        with open(get_sidecar_path(self.output_path), 'w') as sidecar:
+            json.dump({'attribute': self.attribute_name, 'state_names': self.state_names, 'time': self.times,
+                       'stop_time': self.stop_time, 'stop_reason': self.stop_reason}, sidecar)
+
+class ParquetSink(MeasurementSink):
+    """
+    A Parquet file with one row group per measurement and the states stored as a dictionary-encoded column.
+    Requires pyarrow.
+    """
+    def _open(self, V):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("pyarrow is required to stream the measurements to a .parquet file")
+        self.pa = pa
+        self.node_index = pa.array(np.arange(V, dtype = np.int64))
+        self.dictionary = pa.array(self.state_names, type = pa.string())
+        self.schema = pa.schema([('node_index', pa.int64()),
+                                 (self.attribute_name, pa.dictionary(pa.int8(), pa.string())),
+                                 ('time', pa.int32())])
+        self.writer = pq.ParquetWriter(self.output_path, self.schema)
+
+    def _write(self, states, t):
+        pa = self.pa
+        codes = pa.DictionaryArray.from_arrays(pa.array(states, type = pa.int8()), self.dictionary)
+        time = pa.array(np.full(states.shape[0], t, dtype = np.int32))
+        self.writer.write_table(pa.Table.from_arrays([self.node_index, codes, time], schema = self.schema))
+
+    def _close(self):
+        self.writer.close()
+
+def get_sidecar_path(output_path):
+    return os.path.splitext(output_path)[0] + '.json'
+
+def read_state_matrix(output_path):
+    """
+    Memory-map the detailed measurements streamed to a .npy file.
+
+    Returns:
+        states: (T, V) int8 array, states[k, i] is the state code of node i at time times[k]
+        state_names: list of state names, indexed by code
+        times: list of the measurement times
+        attribute_name: name of the measured attribute
+    """
+    with open(get_sidecar_path(output_path), 'r') as sidecar:
+        meta = json.load(sidecar)
+    states = np.load(output_path, mmap_mode = 'r')
+    return states, meta['state_names'], meta['time'], meta['attribute']
     
 def get_measurement_function(meas_mode_str):
     if meas_mode_str == 'aggregate':
-        meas_func = measure_aggregate_on_G
+        meas_func = measure_aggregate_on_state
     elif meas_mode_str == 'detailed':
-        meas_func = measure_detailed_on_G
+        meas_func = measure_detailed_on_state
     else: raise ValueError("Measure function not implemented yet.")
     return meas_func
 
-def measure_detailed_on_G(G: ig.Graph, attribute_name, t:int):
-    rows = [(v.index, v[attribute_name], t) for v in G.vs()]
-    return pd.DataFrame(rows, columns = ['node_index', attribute_name, 'time'])
+def measure_detailed_on_state(states: np.ndarray, state_names: list, attribute_name, t:int):
+    names = np.asarray(state_names, dtype = object)
+    return pd.DataFrame({'node_index': np.arange(states.shape[0]), attribute_name: names[states], 'time': t})
+
+def measure_aggregate_on_state(states: np.ndarray, state_names: list, attribute_name, t:int):
+    # Count occurrences of each state code
+    element_counts = np.bincount(states, minlength = len(state_names))
 
-def measure_aggregate_on_G(G: ig.Graph, attribute_name, t:int):
-    nodes_attribute = [v[attribute_name] for v in G.vs()]
-    # Count occurrences of each element in the list
-    element_counts = Counter(nodes_attribute)
-    
     # Create a list of tuples with element, count, and t
-    rows = [(element, count, t) for element, count in element_counts.items()]
+    rows = [(element, count, t) for element, count in zip(state_names, element_counts) if count > 0]
 
     return pd.DataFrame(rows, columns = [attribute_name, 'value', 'time'])
\ No newline at end of file
@@ -1,16 +1,19 @@
 import numpy as np
-import igraph as ig
+from scipy.sparse import csr_matrix
 import os
 from collections import Counter
 from .Compartments import *
+from .measurements_graph import MeasurementSink
+from .transition_log import TransitionLog
 
 def save_simulation_df(experiment_df, output_path):
     """
     Save the simulation results DataFrame to a specified file.
 
     Parameters:
-        - experiment_df: pandas DataFrame
-            The DataFrame containing simulation results.
+        - experiment_df: pandas DataFrame, MeasurementSink or TransitionLog
+            The DataFrame containing simulation results, the sink the results were streamed to
+            or the log of the state changes.
         - output_path: str or None
             The path to save the output file. If None, a default path is used.
 
@@ -19,8 +22,20 @@ def save_simulation_df(experiment_df, output_path):
             True if the saving process was successful, False otherwise.
     """
     try:
+        # Streamed measurements are already on disk: just finalize the file
+        if isinstance(experiment_df, MeasurementSink):
+            output_path = experiment_df.finalize()
+        # Transition logs are saved as .npz archives
+        elif isinstance(experiment_df, TransitionLog):
+            if output_path is None:
+                output_path = './output_experiment.npz'
+            elif not output_path.endswith('.npz'):
+                name, extension = os.path.splitext(output_path)
+                print(f'Warning: Extension {extension[1:]} not implemented for transition logs. Changing it to .npz')
+                output_path = f'{name}.npz'
+            experiment_df.save(output_path)
         # Check if the output_path is None
-        if output_path is None:
+        elif output_path is None:
             # Use a default path if not specified
             output_path = './output_experiment.pickle'
             experiment_df.to_pickle('./output_experiment.pickle')
@@ -46,7 +61,23 @@ def save_simulation_df(experiment_df, output_path):
         return False
 
 
-def write_initial_conditions_report(G_init: ig.Graph, C: Compartment, output_path):
+def get_summary_path(output_path):
+    """
+    Path of the ensemble summary saved next to the experiment output.
+    """
+    if output_path is None:
+        output_path = './output_experiment.pickle'
+    name, extension = os.path.splitext(output_path)
+    return f'{name}_summary{extension}'
+
+def get_graph_summary(A: csr_matrix, graph_meta: dict):
+    """
+    One-line summary of the graph, in the spirit of igraph's Graph.summary.
+    """
+    direction = 'D' if graph_meta.get('directed', False) else 'U'
+    return f"GRAPH {direction} {A.shape[0]} {graph_meta.get('ecount', A.nnz)} -- {graph_meta.get('name', '')}"
+
+def write_initial_conditions_report(A: csr_matrix, graph_meta: dict, X_init: dict, C: Compartment, output_path):
     if output_path is None:
         output_path = './report.dat'
     try:
@@ -54,16 +85,17 @@ def write_initial_conditions_report(G_init: ig.Graph, C: Compartment, output_pat
         with open(output_path, 'w') as output_file:
             # Write graph summary to the file
             output_file.write("Graph Summary:\n")
-            output_file.write(f"Graph name: {G_init['name']}")
-            output_file.write(G_init.summary() + "\n")
-            output_file.write("Mean: " + f'{np.mean(G_init.degree()): .2f}')
+            output_file.write(f"Graph name: {graph_meta.get('name', '')}\n")
+            output_file.write(get_graph_summary(A, graph_meta) + "\n")
+            output_file.write("Mean: " + f'{A.sum() / A.shape[0]: .2f}')
             output_file.write("\n\n")
 
             # Write initial graph conditions
             output_file.write("Compartment initial conditions:\n")
 
             for attribute in C.attributes:
-                output_file.write(str(Counter(G_init.vs[attribute])))
+                state_counts = np.bincount(X_init[attribute], minlength = len(C.attributes[attribute]))
+                output_file.write(str(Counter({name: int(count) for name, count in zip(C.state_names(attribute), state_counts) if count > 0})))
                 output_file.write('\n\n')
             
             # Write compartment information to the file
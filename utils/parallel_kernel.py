@@ -0,0 +1,106 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from concurrent.futures import ThreadPoolExecutor
+
+class ParallelKernel:
+    """
+    Multi-threaded kernels of the discrete-time engine for single runs on large graphs.
+    The rows of A are split in blocks with about the same number of non-zeros, and each thread computes
+    the neighbor counts of its block: SciPy's sparse products and NumPy's loops release the GIL, so the blocks
+    run in parallel. Nodes are sampled in blocks too, each with the draws of its segment of the rule stream,
+    so a run gives the same trajectory with any number of threads and with the serial engine.
+    The worker threads exit when the kernel is garbage collected.
+
+    Parameters:
+        - A: sparse adjacency matrix
+        - threads: number of worker threads
+        - blocks_per_thread: number of blocks of rows per thread, to balance the load
+    """
+    def __init__(self, A: csr_matrix, threads, blocks_per_thread = 4):
+        if threads < 1:
+            raise ValueError(f"The number of threads should be a positive integer. Got {threads}")
+        self.A = A
+        self.threads = threads
+        self.executor = ThreadPoolExecutor(max_workers = threads)
+        self.n_blocks = threads * blocks_per_thread
+        # Row boundaries of the blocks, balanced on the number of non-zeros
+        targets = np.linspace(0, A.nnz, self.n_blocks + 1)
+        bounds = np.searchsorted(A.indptr, targets, side = 'left')
+        bounds[0], bounds[-1] = 0, A.shape[0]
+        self.row_bounds = np.maximum.accumulate(bounds)
+        self.set_matrix(A)
+
+    def set_matrix(self, A: csr_matrix):
+        """
+        Compute the next products with A, which has the row pointers of the matrix the blocks were balanced on,
+        e.g. the adjacency with the edges of isolated nodes masked.
+        """
+        self.A = A
+        # Entries and row pointers of each block
+        self.block_entries = [(A.indptr[first], A.indptr[last], A.indptr[first:last + 1] - A.indptr[first])
+                              for first, last in zip(self.row_bounds[:-1], self.row_bounds[1:])]
+        self.blocks = self.get_blocks(A)
+
+    def get_blocks(self, M: csr_matrix):
+        """
+        Row blocks of M, a matrix with the indices and row pointers of A. The blocks hold views on the indices and data
+        arrays of M, which SciPy copies when they are small: they see the entries of M updated in place, e.g. by the
+        masks of the interventions, and only the row pointers are copied.
+        """
+        blocks = []
+        for start, end, indptr in self.block_entries:
+            block = csr_matrix((M.data[start:end], M.indices[start:end], indptr), shape = (indptr.shape[0] - 1, M.shape[1]), copy = False)
+            block.data, block.indices = M.data[start:end], M.indices[start:end].astype(block.indices.dtype, copy = False)
+            blocks.append(block)
+        return blocks
+
+    def map(self, function, n):
+        return list(self.executor.map(function, range(n)))
+
+    def neighbor_counts(self, mask: np.ndarray, edge_hazards: csr_matrix = None):
+        """
+        A.dot(mask) computed block by block. mask is a boolean array of shape (V,) or (V, R).
+        With the matrix of the edge hazards of a rule on a weighted graph (see EdgeHazards), the weighted hazards of the rule.
+        """
+        blocks = self.blocks if edge_hazards is None else self.get_blocks(edge_hazards)
+        x = np.empty(mask.shape)
+        counts = np.empty((self.A.shape[0],) + mask.shape[1:])
+        def convert(k):
+            first, last = self.row_bounds[k], self.row_bounds[k + 1]
+            np.copyto(x[first:last], mask[first:last])
+        def multiply(k):
+            counts[self.row_bounds[k]:self.row_bounds[k + 1]] = blocks[k].dot(x)
+        self.map(convert, self.n_blocks)
+        self.map(multiply, self.n_blocks)
+        return counts
+
+    def flatnonzero_equal(self, states: np.ndarray, code):
+        """
+        np.flatnonzero(states == code) for a state array of shape (V,), computed block by block.
+        """
+        def query(k):
+            first, last = self.row_bounds[k], self.row_bounds[k + 1]
+            return np.flatnonzero(states[first:last] == code) + first
+        return np.concatenate(self.map(query, self.n_blocks))
+
+    def random(self, stream, n):
+        """
+        n uniform numbers of stream, the same as stream.random(n), generated in parallel.
+        """
+        return stream.random_blocks(n, self.executor, self.n_blocks)
+
+    def map_chunks(self, function, n):
+        """
+        Call function(first, last) on n_blocks chunks of range(n) in parallel.
+        """
+        bounds = np.linspace(0, n, self.n_blocks + 1).astype(np.int64)
+        self.map(lambda k: function(bounds[k], bounds[k + 1]), self.n_blocks)
+
+def get_parallel_kernel(A: csr_matrix, threads):
+    """
+    Kernel of a single run with threads worker threads, None to run serially. A is the adjacency of the first
+    step: a temporal graph gives the kernel each of its snapshots with set_matrix.
+    """
+    if threads > 1 and not isinstance(A, csr_matrix):
+        raise ValueError("Threads are only available for graphs held in memory or temporal graphs. Run partitioned graphs with threads = 1")
+    return ParallelKernel(A, threads) if threads > 1 else None
@@ -0,0 +1,154 @@
+import numpy as np
+import os
+import json
+import shutil
+from scipy.sparse import csr_matrix
+from .graph_cache import save_adjacency, load_adjacency, get_cached_file_hash, get_default_cache_dir, cache_version
+
+# Extension of the directories written by save_partitioned_adjacency, given directly as graph files
+partitioned_store_extension = '.parts'
+
+class Partition:
+    """
+    Rows first, ..., last - 1 of the adjacency matrix. Columns are local: the owned nodes first,
+    then the halo, i.e. the nodes of other partitions that are neighbors of an owned node.
+    """
+    def __init__(self, first, last, A: csr_matrix, halo: np.ndarray):
+        self.first = first
+        self.last = last
+        self.A = A
+        self.halo = halo
+
+    def gather(self, states: np.ndarray):
+        """
+        States of the owned nodes followed by the ones of the halo: the boundary exchange between partitions.
+        states can be of shape (V,) or (V, R).
+        """
+        return np.concatenate([states[self.first:self.last], states[self.halo]])
+
+    def neighbor_counts(self, local_mask: np.ndarray):
+        """
+        Number of neighbors of each owned node in the mask, given on the owned nodes and the halo.
+        The boolean mask is multiplied as it is: no float64 vector of the graph size is allocated.
+        """
+        return self.A.dot(local_mask)
+
+class PartitionedAdjacency:
+    """
+    Adjacency matrix stored on disk as row blocks, memory-mapped one at a time: only the node states
+    and the arrays of the current partition are resident. Partitions are visited in row order, so the
+    engine draws the same random numbers as with the whole matrix.
+
+    Parameters:
+        - directory: store written by save_partitioned_adjacency or partition_edge_list
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'partitions.json'), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+        self.directory = directory
+        self.shape = tuple(self.meta['shape'])
+        self.nnz = self.meta['nnz']
+        self.row_bounds = self.meta['row_bounds']
+
+    @property
+    def partitions(self):
+        """
+        Iterator over the partitions. The arrays are memory-mapped when the partition is reached.
+        """
+        for k, (first, last) in enumerate(zip(self.row_bounds[:-1], self.row_bounds[1:])):
+            part_directory = get_partition_directory(self.directory, k)
+            A, _, _ = load_adjacency(part_directory)
+            yield Partition(first, last, A, np.load(os.path.join(part_directory, 'halo.npy'), mmap_mode = 'r'))
+
+    def __len__(self):
+        return len(self.row_bounds) - 1
+
+    def get_graph_meta(self):
+        """
+        Graph metadata, as returned by read_input_adjacency.
+        """
+        return {key: value for key, value in self.meta.items() if key not in ('shape', 'nnz', 'row_bounds')}
+
+    def sum(self):
+        return sum(int(part.A.data.sum()) for part in self.partitions)
+
+def get_partition_directory(directory, k):
+    return os.path.join(directory, f'part_{k}')
+
+def get_row_bounds(row_counts: np.ndarray, n_partitions):
+    """
+    Row boundaries of n_partitions blocks with about the same number of non-zeros.
+    """
+    cumulative = np.concatenate([[0], np.cumsum(row_counts)])
+    bounds = np.searchsorted(cumulative, np.linspace(0, cumulative[-1], n_partitions + 1), side = 'left')
+    bounds[0], bounds[-1] = 0, row_counts.shape[0]
+    return np.maximum.accumulate(bounds).tolist()
+
+def localize_partition(first, last, rows: np.ndarray, cols: np.ndarray, data: np.ndarray = None):
+    """
+    Local CSR matrix and halo of the partition holding rows first, ..., last - 1, from its entries
+    with global row and column indices.
+    """
+    owned = (cols >= first) & (cols < last)
+    halo = np.unique(cols[~owned])
+    local_cols = np.empty(cols.shape[0], dtype = np.int64)
+    local_cols[owned] = cols[owned] - first
+    local_cols[~owned] = (last - first) + np.searchsorted(halo, cols[~owned])
+    index_dtype = np.int32 if (last - first) + halo.shape[0] < np.iinfo(np.int32).max else np.int64
+    data = np.ones(rows.shape[0], dtype = np.int32) if data is None else data
+    A = csr_matrix((data, ((rows - first).astype(index_dtype), local_cols.astype(index_dtype))),
+                   shape = (last - first, (last - first) + halo.shape[0]))
+    return A, halo.astype(index_dtype)
+
+def write_partitioned_store(directory, shape, row_bounds, meta: dict, build_partition):
+    """
+    Write the partitions given by build_partition(k, first, last) -> (local matrix, halo) and partitions.json.
+    The store is written under a temporary name and renamed at the end, as the entries of the graph cache.
+    """
+    tmp_directory = f'{directory}.tmp{os.getpid()}'
+    os.makedirs(tmp_directory, exist_ok = True)
+    nnz = 0
+    for k, (first, last) in enumerate(zip(row_bounds[:-1], row_bounds[1:])):
+        A_local, halo = build_partition(k, first, last)
+        nnz += A_local.nnz
+        part_directory = get_partition_directory(tmp_directory, k)
+        save_adjacency(A_local, part_directory, {'first': int(first), 'last': int(last)})
+        np.save(os.path.join(part_directory, 'halo.npy'), halo)
+    with open(os.path.join(tmp_directory, 'partitions.json'), 'w') as meta_file:
+        json.dump(dict(meta, shape = list(shape), nnz = int(nnz), row_bounds = [int(bound) for bound in row_bounds]), meta_file)
+    try:
+        os.rename(tmp_directory, directory)
+    except OSError:
+        # Another process stored the same partitions in the meantime
+        shutil.rmtree(tmp_directory)
+    return directory
+
+def save_partitioned_adjacency(A: csr_matrix, directory, n_partitions, meta: dict):
+    """
+    Store an adjacency matrix held in memory as n_partitions row blocks.
+    """
+    row_bounds = get_row_bounds(np.diff(A.indptr), n_partitions)
+    def build_partition(k, first, last):
+        block = A[first:last].tocoo()
+        return localize_partition(first, last, block.row.astype(np.int64) + first, block.col.astype(np.int64), block.data)
+    return write_partitioned_store(directory, A.shape, row_bounds, meta, build_partition)
+
+def read_partitioned_adjacency(graph_path, n_partitions, build_partitions, cache_dir = None, variant = '', verbosity = True):
+    """
+    Partitioned adjacency matrix of the graph in graph_path, from the graph cache. When the store does not exist
+    it is written by build_partitions(graph_path, directory, n_partitions).
+
+    Returns:
+        A: PartitionedAdjacency
+        meta: Dictionary with the graph metadata
+    """
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir(graph_path)
+    file_hash = get_cached_file_hash(graph_path, cache_dir)
+    directory = os.path.join(cache_dir, f'{os.path.basename(graph_path)}_{file_hash[:16]}_{variant}_p{n_partitions}_v{cache_version}{partitioned_store_extension}')
+    if not os.path.exists(os.path.join(directory, 'partitions.json')):
+        if verbosity: print(f"Graph {graph_path} not partitioned. Storing {n_partitions} partitions of its adjacency in {directory}")
+        os.makedirs(cache_dir, exist_ok = True)
+        build_partitions(graph_path, directory, n_partitions)
+    A = PartitionedAdjacency(directory)
+    return A, A.get_graph_meta()
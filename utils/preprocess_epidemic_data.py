@@ -1,11 +1,11 @@
 import numpy as np
-import pandas as pd
+from .analysis import analyze_states
 
-def aggregate_epidemic_data(df):
-    # Group by 'time' and 'compartment' and count occurrences
-    result_df = df.groupby(['time', 'compartment']).size().reset_index(name='count')
+def aggregate_epidemic_data(df, attribute = 'compartment'):
+    # Count the nodes in each state at each time by bincount on the state codes, then pivot the small table of counts
+    curves_df, _ = analyze_states(df, attribute = attribute, susceptible = None)
 
-    # If you want to fill missing compartments with 0 count, you can use pivot
-    result_df = result_df.pivot(index='time', columns='compartment', values='count').fillna(0).reset_index().iloc[:-1,:]
+    # Fill missing compartments with 0 count. Every time is kept, up to the final state
+    result_df = curves_df.pivot(index='time', columns=attribute, values='value').fillna(0).reset_index()
 
-    return result_df
\ No newline at end of file
+    return result_df
@@ -0,0 +1,143 @@
+import numpy as np
+
+# Purpose of each substream of a realization, last entry of its spawn key
+INITIAL_STATE_STREAM = 0
+RULE_STREAM = 1
+EVENT_STREAM = 2
+SEEDING_STREAM = 3
+INTERVENTION_STREAM = 4
+
+class UniformStream:
+    """
+    Independent stream of uniform numbers in [0, 1), generated in blocks of block_size draws
+    so that the many small requests of a simulation step do not pay the overhead of a Generator call each.
+    Doubles are drawn one 64-bit output at a time, so the values do not depend on the block size.
+    """
+    def __init__(self, seed_sequence: np.random.SeedSequence, block_size = 1 << 16):
+        self.generator = np.random.Generator(np.random.PCG64(seed_sequence))
+        self.block_size = block_size
+        self.block = np.empty(0)
+        self.position = 0
+
+    def random(self, n):
+        """
+        Array of n uniform numbers in [0, 1).
+        """
+        available = self.block.shape[0] - self.position
+        if n > available:
+            # The old block is never written again, so arrays already returned stay valid
+            self.block = np.concatenate([self.block[self.position:], self.generator.random(max(self.block_size, n - available))])
+            self.position = 0
+        sample = self.block[self.position:self.position + n]
+        self.position += n
+        return sample
+
+    def random_blocks(self, n, executor, n_blocks):
+        """
+        Same n uniform numbers as random(n), generated by n_blocks threads of executor. Each block jumps
+        ahead a copy of the generator to its first draw, so the values do not depend on the number of blocks.
+        Requests that fit in a block are drawn serially.
+        """
+        available = self.block.shape[0] - self.position
+        if n <= available + self.block_size or n_blocks < 2:
+            return self.random(n)
+        sample = np.empty(n)
+        sample[:available] = self.block[self.position:]
+        self.block = np.empty(0)
+        self.position = 0
+        remaining = n - available
+        bounds = np.linspace(0, remaining, n_blocks + 1).astype(np.int64)
+        state = self.generator.bit_generator.state
+        def fill(k):
+            bit_generator = np.random.PCG64()
+            bit_generator.state = state
+            bit_generator.advance(int(bounds[k]))
+            np.random.Generator(bit_generator).random(out = sample[available + bounds[k]:available + bounds[k + 1]])
+        list(executor.map(fill, range(n_blocks)))
+        self.generator.bit_generator.advance(remaining)
+        return sample
+
+    def exponential(self, scale):
+        return -np.log1p(-self.random(1)[0]) * scale
+
+class RealizationStreams:
+    """
+    Random streams of one realization. Each (purpose, index) pair, e.g. one rule group or one attribute,
+    has its own substream: adding a rule or changing the batch layout does not shift the draws of the others.
+    """
+    def __init__(self, entropy, realization, block_size = 1 << 16):
+        self.entropy = entropy
+        self.realization = realization
+        self.block_size = block_size
+        self.streams = {}
+
+    def stream(self, purpose, index = 0):
+        key = (purpose, index)
+        if key not in self.streams:
+            seed_sequence = np.random.SeedSequence(self.entropy, spawn_key = (self.realization, purpose, index))
+            self.streams[key] = UniformStream(seed_sequence, self.block_size)
+        return self.streams[key]
+
+    def generator(self, purpose, index = 0):
+        """
+        NumPy Generator on the substream (purpose, index), for the draws that are not uniform numbers:
+        multinomial counts, permutations and choices without replacement.
+        """
+        seed_sequence = np.random.SeedSequence(self.entropy, spawn_key = (self.realization, purpose, index))
+        return np.random.Generator(np.random.PCG64(seed_sequence))
+
+class RandomStreams:
+    """
+    Root of the random streams of an experiment, derived from a single seed.
+    Realization r always gets the same streams, whatever the batch, the worker or the engine run it:
+    any realization of an ensemble can be replayed alone with RandomStreams(seed).realization(r).
+
+    Parameters:
+        - seed: integer seed. Default: fresh entropy from the OS, available in the seed attribute to replay the run
+        - block_size: number of uniform numbers generated at once by each stream
+    """
+    def __init__(self, seed = None, block_size = 1 << 16):
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.block_size = block_size
+
+    def realization(self, r):
+        return RealizationStreams(self.seed, r, self.block_size)
+
+    def realizations(self, first, last):
+        return [self.realization(r) for r in range(first, last)]
+
+def get_realization_streams(rng = None):
+    """
+    Streams of a single run from rng: a RealizationStreams, a RandomStreams (realization 0), a seed or None.
+    """
+    if isinstance(rng, RealizationStreams):
+        return rng
+    if not isinstance(rng, RandomStreams):
+        rng = RandomStreams(rng)
+    return rng.realization(0)
+
+def draw_per_realization(streams: list, purpose, index, realizations: np.ndarray):
+    """
+    Uniform numbers for a list of draws sorted by realization, each taken from the stream of its realization.
+
+    Parameters:
+        - streams: list of RealizationStreams, one per column of the state matrix
+        - realizations: sorted array with the column of each draw
+    """
+    if len(streams) == 1:
+        return streams[0].stream(purpose, index).random(realizations.shape[0])
+    counts = np.bincount(realizations, minlength = len(streams))
+    return np.concatenate([streams[r].stream(purpose, index).random(n) for r, n in enumerate(counts)])
+
+def get_column_streams(rng, shape):
+    """
+    List of RealizationStreams, one per column of a state array of the given shape: (V,) or (V, R).
+    rng is either such a list, a RealizationStreams for a single column, a RandomStreams, a seed or None.
+    """
+    if isinstance(rng, list):
+        return rng
+    if len(shape) == 1:
+        return [get_realization_streams(rng)]
+    if not isinstance(rng, RandomStreams):
+        rng = RandomStreams(rng)
+    return rng.realizations(0, shape[1])
@@ -0,0 +1,188 @@
+import abc
+import numpy as np
+from scipy.sparse import csr_matrix
+from .Compartments import Compartment
+from .frontier import gather_rows
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+class Seeding(abc.ABC):
+    """
+    Structured choice of the nodes starting in a given state, set on top of the states drawn from the initial
+    probabilities. The graph-wide precomputation is done once when the seeding is built and shared by every
+    realization, which only draws its own nodes: the graph is never copied.
+
+    Parameters:
+        - A: sparse adjacency matrix
+        - attribute: attribute of the seeded state
+        - state: name of the seeded state
+        - count: number of seeded nodes
+        - fraction: fraction of the nodes seeded, used when count is not given
+    """
+    def __init__(self, A: csr_matrix, attribute = 'compartment', state = None, count = None, fraction = None):
+        self.V = A.shape[0]
+        self.attribute = attribute
+        if state is None:
+            raise ValueError("The seeding needs the state of the seeded nodes")
+        self.state = state
+        if count is None:
+            if fraction is None:
+                raise ValueError("The seeding needs either the count or the fraction of seeded nodes")
+            count = int(round(fraction * self.V))
+        if not 0 <= count <= self.V:
+            raise ValueError(f"The number of seeded nodes should be between 0 and {self.V}. Got {count}")
+        self.count = count
+
+    @abc.abstractmethod
+    def nodes(self, generator: np.random.Generator):
+        """
+        Indices of the seeded nodes of one realization.
+        """
+
+    def apply(self, X: dict, c: Compartment, generator: np.random.Generator):
+        """
+        Set the seeded nodes of one realization. X maps each attribute to the (V,) state array of the realization.
+        """
+        X[self.attribute][self.nodes(generator)] = c.encode(self.attribute, self.state)
+
+class TopDegreeSeeding(Seeding):
+    """
+    The count nodes of highest degree. Nodes tied at the lowest degree seeded are drawn at random in each realization.
+    """
+    def __init__(self, A: csr_matrix, **options):
+        super().__init__(A, **options)
+        degrees = np.diff(A.indptr)
+        threshold = np.partition(degrees, self.V - self.count)[self.V - self.count] if self.count > 0 else np.inf
+        self.above = np.flatnonzero(degrees > threshold)
+        self.ties = np.flatnonzero(degrees == threshold)
+
+    def nodes(self, generator):
+        return np.concatenate([self.above, generator.choice(self.ties, self.count - self.above.shape[0], replace = False)])
+
+class RandomNeighborSeeding(Seeding):
+    """
+    Random neighbors of random nodes, until count distinct nodes are seeded: high-degree nodes are favored
+    without knowing the degrees, as in acquaintance immunization.
+    """
+    def __init__(self, A: csr_matrix, **options):
+        super().__init__(A, **options)
+        self.indptr = A.indptr
+        self.indices = A.indices
+        self.degrees = np.diff(A.indptr)
+        self.sources = np.flatnonzero(self.degrees > 0)
+        n_neighbors = np.count_nonzero(np.bincount(A.indices, minlength = self.V))
+        if n_neighbors < self.count:
+            raise ValueError(f"Only {n_neighbors} nodes are neighbors of another node. Cannot seed {self.count} of them")
+
+    def nodes(self, generator):
+        chosen = np.empty(0, dtype = np.int64)
+        while chosen.shape[0] < self.count:
+            missing = self.count - chosen.shape[0]
+            sources = self.sources[generator.integers(0, self.sources.shape[0], missing)]
+            positions = self.indptr[sources] + (generator.random(missing) * self.degrees[sources]).astype(np.int64)
+            chosen = np.union1d(chosen, self.indices[positions])
+        return chosen
+
+class BallSeeding(Seeding):
+    """
+    A single cluster: the count nodes closest to a random center, found by breadth-first search. The last layer
+    is drawn at random, and the search continues from another random node once the component is exhausted.
+    Restart nodes are read from a single random permutation, so a realization costs O(V + E) however many
+    components it visits.
+    """
+    def __init__(self, A: csr_matrix, **options):
+        super().__init__(A, **options)
+        self.indptr = A.indptr
+        self.indices = A.indices
+
+    def nodes(self, generator):
+        visited = np.zeros(self.V, dtype = bool)
+        ball = []
+        n = 0
+        layer = np.empty(0, dtype = np.int64)
+        order = None
+        while n < self.count:
+            if layer.shape[0] == 0:
+                if order is None:
+                    order, position = generator.permutation(self.V), 0
+                position = next_unvisited(order, position, visited)
+                layer = order[position:position + 1]
+                visited[layer] = True
+            if layer.shape[0] > self.count - n:
+                layer = generator.choice(layer, self.count - n, replace = False)
+            ball.append(layer)
+            n += layer.shape[0]
+            neighbors = np.unique(self.indices[gather_rows(self.indptr, layer)])
+            layer = neighbors[~visited[neighbors]]
+            visited[layer] = True
+        return np.concatenate(ball) if len(ball) > 0 else np.empty(0, dtype = np.int64)
+
+def next_unvisited(order: np.ndarray, position, visited: np.ndarray, chunk_size = 1024):
+    """
+    First position from position on whose node of order is not visited, scanning order in chunks.
+    """
+    while True:
+        unvisited = np.flatnonzero(~visited[order[position:position + chunk_size]])
+        if unvisited.shape[0] > 0:
+            return position + unvisited[0]
+        position += chunk_size
+
+class FileSeeding(Seeding):
+    """
+    Initial states read from a file: a .npy array with the state name or code of every node, a text file with
+    the state name or code of every node on its own line, or a text file of (node_index, state) rows setting only
+    the nodes listed. Comma-separated for .csv files, whitespace-separated otherwise.
+
+    Parameters:
+        - A: sparse adjacency matrix, or any graph with a shape
+        - path: path of the file
+        - attribute: attribute of the states
+    """
+    def __init__(self, A, path = None, attribute = 'compartment'):
+        if path is None:
+            raise ValueError("The file seeding needs the path of the file")
+        self.V = A.shape[0]
+        self.attribute = attribute
+        if path.endswith('.npy'):
+            states = np.load(path, allow_pickle = False)
+            table = None
+        else:
+            table = pd.read_csv(path, sep = ',' if path.endswith('.csv') else r'\s+', comment = '#', header = None, dtype = str)
+            states = table[table.columns[-1]].to_numpy()
+        if table is None or table.shape[1] == 1:
+            # A state for every node
+            if states.shape[0] != self.V:
+                raise ValueError(f"The file {path} has {states.shape[0]} states for a graph of {self.V} nodes")
+            self.node_indices = np.arange(self.V)
+        else:
+            self.node_indices = table[0].astype(np.int64).to_numpy()
+            if self.node_indices.shape[0] > 0 and (self.node_indices.min() < 0 or self.node_indices.max() >= self.V):
+                raise ValueError(f"The file {path} has node indices outside the graph of {self.V} nodes")
+        self.count = self.node_indices.shape[0]
+        # Distinct states, encoded once the compartments are known
+        self.states, self.inverse = np.unique(states, return_inverse = True)
+
+    def nodes(self, generator = None):
+        return self.node_indices
+
+    def apply(self, X: dict, c: Compartment, generator = None):
+        codes = np.array([c.encode(self.attribute, state) for state in self.states.tolist()], dtype = X[self.attribute].dtype)
+        X[self.attribute][self.node_indices] = codes[self.inverse]
+
+seeding_strategies = {'top_degree': TopDegreeSeeding, 'random_neighbor': RandomNeighborSeeding, 'ball': BallSeeding, 'file': FileSeeding}
+
+def get_seeding(options: dict, A):
+    """
+    Seeding described by the 'seeding' setting of the [initial_conditions] section, prepared on the graph A.
+    None when options is None.
+    """
+    if options is None:
+        return None
+    options = dict(options)
+    strategy = options.pop('strategy', None)
+    if strategy not in seeding_strategies:
+        raise ValueError(f"Seeding strategy {strategy} not implemented yet. Choose between {', '.join(seeding_strategies)}")
+    if strategy != 'file' and not isinstance(A, csr_matrix):
+        raise ValueError(f"The {strategy} seeding needs a static graph held in memory")
+    return seeding_strategies[strategy](A, **options)
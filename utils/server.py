@@ -0,0 +1,105 @@
+import os
+import time
+import traceback
+from collections import OrderedDict
+from multiprocessing.connection import Listener, Client
+
+def serve(address, run_job, verbosity = True):
+    """
+    Run the jobs sent to the Unix socket at address one at a time, in the order they arrive, until a client
+    asks the server to stop. The process stays alive between jobs, so imports and graphs loaded by run_job
+    are reused by the next ones. Clients wait on their connection for the end of their job.
+
+    Parameters:
+        - address: path of the Unix socket. Only the user running the server can connect to it
+        - run_job: function (config_path, resume) running a job. An exception fails the job, not the server
+    """
+    if os.path.exists(address):
+        raise FileExistsError(f"Socket {address} already exists. Stop the server using it or remove the file")
+    with Listener(address, family = 'AF_UNIX') as listener:
+        os.chmod(address, 0o600)
+        if verbosity: print(f"Serving jobs on {address}")
+        while True:
+            with listener.accept() as connection:
+                try:
+                    request = connection.recv()
+                except EOFError:
+                    continue
+                if request.get('command') == 'stop':
+                    connection.send({'status': 'stopped'})
+                    break
+                reply = run_request(request, run_job, verbosity)
+                try:
+                    connection.send(reply)
+                except OSError:
+                    # The client gave up waiting: the job is done anyway
+                    pass
+
+class GraphStore:
+    """
+    Graphs loaded by the jobs of a server, kept for the next ones. Entries are keyed by the path and modification
+    time of the graph file and by the options it is loaded with: a modified file is loaded again and its stale
+    entries are dropped. At most max_graphs graphs are kept, the least recently used one is evicted first.
+    """
+    def __init__(self, max_graphs = 4):
+        if max_graphs < 1:
+            raise ValueError(f"The server should keep a positive number of graphs. Got {max_graphs}")
+        self.max_graphs = max_graphs
+        self.entries = OrderedDict()
+
+    def get(self, path, options: dict, load):
+        """
+        Graph of path loaded with options, calling load() when it is not kept.
+        """
+        path = os.path.abspath(path)
+        mtime = os.path.getmtime(path)
+        key = (path, mtime, tuple(sorted(options.items())))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        for stale in [entry for entry in self.entries if entry[0] == path and entry[1] != mtime]:
+            del self.entries[stale]
+        # Evict before loading, so that memory holds at most max_graphs graphs
+        while len(self.entries) >= self.max_graphs:
+            self.entries.popitem(last = False)
+        self.entries[key] = load()
+        return self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+def run_request(request: dict, run_job, verbosity = True):
+    """
+    Run the job of a request in the working directory of the client, which relative paths refer to.
+    """
+    start = time.perf_counter()
+    server_cwd = os.getcwd()
+    if verbosity: print(f"Job {request['config']} started")
+    try:
+        os.chdir(request.get('cwd', server_cwd))
+        run_job(request['config'], request.get('resume', False))
+        reply = {'status': 'done'}
+    except Exception as e:
+        traceback.print_exc()
+        reply = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+    finally:
+        os.chdir(server_cwd)
+    reply['seconds'] = time.perf_counter() - start
+    if verbosity: print(f"Job {request['config']} {reply['status']} in {reply['seconds']:.2f} s")
+    return reply
+
+def submit(address, config_path, resume = False):
+    """
+    Send a job to the server at address and wait for its end.
+
+    Returns:
+        Dictionary with the status of the job ('done' or 'failed'), its error if any and its duration in seconds
+    """
+    with Client(address, family = 'AF_UNIX') as connection:
+        connection.send({'config': os.path.abspath(config_path), 'resume': resume, 'cwd': os.getcwd()})
+        return connection.recv()
+
+def stop_server(address):
+    with Client(address, family = 'AF_UNIX') as connection:
+        connection.send({'command': 'stop'})
+        return connection.recv()
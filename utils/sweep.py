@@ -0,0 +1,196 @@
+import numpy as np
+import os
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from scipy.sparse import csr_matrix
+from .initialize_data import initialize_compartments, initialize_state
+from .engines import get_simulation_engine
+from .measurements_graph import Measure
+from .rng import RandomStreams
+from .termination import get_termination
+from .seeding import get_seeding
+from .interventions import get_interventions
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+# Adjacency matrices and settings seen by each worker process
+_worker_adjacency = {}
+_worker_shared_blocks = []
+_worker_settings = {}
+
+def expand_prob_range(prob_range):
+    """
+    A probability range is either an explicit list of values or a (start, stop, num) tuple.
+    """
+    if isinstance(prob_range, tuple):
+        start, stop, num = prob_range
+        return list(np.linspace(start, stop, int(num)))
+    return list(prob_range)
+
+def build_sweep_grid(prob_ranges: dict, graph_paths: list, seeds: list, n_initial_conditions = 1):
+    """
+    Cartesian product of the transition probabilities, graphs, initial conditions and seeds.
+
+    Parameters:
+        - prob_ranges: Dictionary transition rule name -> probability range
+        - graph_paths: list of graph files
+        - seeds: list of random seeds
+        - n_initial_conditions: number of initial conditions to combine with the rest of the grid
+    Returns:
+        runs: list of dictionaries, one per run
+    """
+    rule_names = list(prob_ranges.keys())
+    prob_values = [expand_prob_range(prob_ranges[name]) for name in rule_names]
+    runs = []
+    for graph_path, probs, initial_condition, seed in itertools.product(graph_paths, itertools.product(*prob_values),
+                                                                          range(n_initial_conditions), seeds):
+        runs.append({'graph_path': graph_path,
+                     'probs': {name: float(p) for name, p in zip(rule_names, probs)},
+                     'initial_condition': initial_condition,
+                     'seed': int(seed)})
+    return runs
+
+# Settings of the [experiment] section that change the result of a run
+run_experiment_options = ('stop_when_absorbed', 'steady_state_tolerance', 'steady_state_window', 'horizon', 'seeding', 'interventions')
+
+def get_run_dynamics(dynamics: dict, run: dict):
+    """
+    Dynamics of the run: the swept probabilities replace the ones of the rules.
+    """
+    return {key: dict(rule, prob = run['probs'].get(rule['name'], rule['prob'])) for key, rule in dynamics.items()}
+
+def get_run_id(run: dict, settings: dict):
+    """
+    Hash of the run and of every setting its result depends on: model, rules with the swept probabilities,
+    initial condition, time steps, engine and early stop and seeding options. Run files saved with another
+    configuration are not reused.
+    """
+    options = settings['experiment_options'] or {}
+    config = {'run': run, 'attributes': settings['attributes'], 'dynamics': get_run_dynamics(settings['dynamics'], run),
+              'initial_conditions': settings['initial_conditions'][run['initial_condition']], 'time_steps': settings['time_steps'],
+              'engine': settings['engine'], 'experiment_options': {key: options.get(key) for key in run_experiment_options}}
+    return hashlib.sha1(json.dumps(config, sort_keys = True, default = str).encode()).hexdigest()[:16]
+
+def share_adjacency(A: csr_matrix):
+    """
+    Copy the CSR arrays of A in shared memory blocks.
+
+    Returns:
+        blocks: list of SharedMemory objects. The caller is responsible to unlink them
+        descriptor: (shape, [(block name, dtype, length) for data, indices and indptr]) used by the workers to attach
+    """
+    blocks = []
+    arrays = []
+    for array in (A.data, A.indices, A.indptr):
+        block = shared_memory.SharedMemory(create = True, size = max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype = array.dtype, buffer = block.buf)[:] = array
+        blocks.append(block)
+        arrays.append((block.name, array.dtype.str, array.shape[0]))
+    return blocks, (A.shape, arrays)
+
+def attach_adjacency(descriptor):
+    """
+    Build a csr_matrix on top of the shared memory blocks described by descriptor, without copying them.
+
+    Returns:
+        A: csr_matrix
+        blocks: SharedMemory objects that must stay referenced as long as A is used
+    """
+    shape, arrays = descriptor
+    blocks = []
+    views = []
+    for name, dtype, length in arrays:
+        block = shared_memory.SharedMemory(name = name)
+        blocks.append(block)
+        views.append(np.ndarray((length,), dtype = np.dtype(dtype), buffer = block.buf))
+    data, indices, indptr = views
+    A = csr_matrix((data, indices, indptr), shape = shape, copy = False)
+    return A, blocks
+
+def _init_worker(descriptors, settings):
+    for graph_path, descriptor in descriptors.items():
+        A, blocks = attach_adjacency(descriptor)
+        _worker_adjacency[graph_path] = A
+        _worker_shared_blocks.extend(blocks)
+    _worker_settings.update(settings)
+
+def _run_single(run, run_path):
+    settings = _worker_settings
+    A = _worker_adjacency[run['graph_path']]
+    # The streams depend only on the seed of the run, not on the worker that executes it
+    rng = RandomStreams(run['seed'])
+    dynamics = get_run_dynamics(settings['dynamics'], run)
+    initial_conditions = settings['initial_conditions'][run['initial_condition']]
+    c = initialize_compartments(settings['attributes'], dynamics, initial_conditions)
+    seeding = None if settings['experiment_options'] is None else get_seeding(settings['experiment_options'].get('seeding'), A)
+    X_t = initialize_state(A.shape[0], c, initial_conditions, rng = rng, seeding = seeding)
+    simulate_epidemic = get_simulation_engine(settings['engine'])
+    termination = None if settings['experiment_options'] is None else get_termination(settings['experiment_options'])
+    interventions = None if settings['experiment_options'] is None else get_interventions(settings['experiment_options'].get('interventions'), A.shape[0])
+    # Only the discrete engine takes interventions
+    engine_options = {} if interventions is None else {'interventions': interventions}
+    run_df = simulate_epidemic(c, A, X_t, settings['time_steps'], Measure('aggregate'), verbosity = False, rng = rng, termination = termination,
+                               **engine_options)
+
+    # Key the aggregate curves by the parameters of the run
+    keys = {'graph': os.path.basename(run['graph_path']), 'seed': run['seed'], 'initial_condition': run['initial_condition']}
+    keys.update({f'prob_{name}': p for name, p in run['probs'].items()})
+    run_df = run_df.assign(**keys)[list(keys) + list(run_df.columns)]
+    # Write and rename, so that a run interrupted while saving is not mistaken for a finished one
+    run_df.to_pickle(run_path + '.tmp')
+    os.replace(run_path + '.tmp', run_path)
+    return run_path
+
+def run_sweep(runs: list, load_adjacency, attributes, dynamics, initial_conditions: list, time_steps, runs_dir, max_workers = None,
+              engine = 'discrete', verbosity = True, experiment_options = None):
+    """
+    Run every configuration in runs on a pool of processes.
+    The CSR adjacency of each graph is shared with the workers through shared memory.
+    Each run is saved in runs_dir as soon as it finishes, named by the hash of its configuration: runs whose
+    file already exists are skipped, so that an interrupted sweep can be resumed by running it again.
+
+    Parameters:
+        - runs: list of runs, as returned by build_sweep_grid
+        - load_adjacency: function graph path -> sparse adjacency matrix. Called only for graphs with pending runs
+        - attributes, dynamics: model definition, as read from the epidemics configuration
+        - initial_conditions: list of initial conditions dictionaries
+        - time_steps: number of time steps of each run
+        - runs_dir: directory holding the result of each run
+        - max_workers: number of processes. Default: all the cores
+        - engine: name of the simulation engine
+        - experiment_options: settings of the [experiment] section, for the early stops, the seeding and the interventions of the runs
+    Returns:
+        sweep_df: DataFrame with the aggregate curves of all the runs
+    """
+    if experiment_options is not None and experiment_options.get('interventions') and engine != 'discrete':
+        raise ValueError(f"Interventions are only available with the discrete engine. Got {engine}")
+    os.makedirs(runs_dir, exist_ok = True)
+    settings = {'attributes': attributes, 'dynamics': dynamics,
+                'initial_conditions': initial_conditions, 'time_steps': time_steps, 'engine': engine,
+                'experiment_options': experiment_options}
+    run_paths = [os.path.join(runs_dir, f'{get_run_id(run, settings)}.pickle') for run in runs]
+    pending = [(run, path) for run, path in zip(runs, run_paths) if not os.path.exists(path)]
+    if verbosity: print(f"Sweep: {len(runs) - len(pending)} / {len(runs)} runs already done")
+
+    if len(pending) > 0:
+        shared_blocks = []
+        descriptors = {}
+        try:
+            for graph_path in {run['graph_path'] for run, _ in pending}:
+                blocks, descriptors[graph_path] = share_adjacency(load_adjacency(graph_path))
+                shared_blocks.extend(blocks)
+            with ProcessPoolExecutor(max_workers = max_workers, initializer = _init_worker, initargs = (descriptors, settings)) as executor:
+                futures = [executor.submit(_run_single, run, path) for run, path in pending]
+                for done, future in enumerate(as_completed(futures)):
+                    future.result()
+                    if verbosity: print(f"Sweep: run {done+1} / {len(pending)} completed")
+        finally:
+            for block in shared_blocks:
+                block.close()
+                block.unlink()
+
+    return pd.concat([pd.read_pickle(path) for path in run_paths], ignore_index = True)
@@ -0,0 +1,148 @@
+import numpy as np
+import sys
+import json
+import time
+import resource
+from .Compartments import Compartment
+
+# Phases timed by the engines:
+#   - query: nodes in the initial state of the rules and candidates of the step
+#   - neighbor_counts: sparse products and incremental updates of the number of neighbors in each triggering state
+#   - sample: random numbers and choice of the rule fired on each node
+#   - update: writing the new states
+#   - measure: measurements of the state and of the transitions, including the writes of streamed measurements
+#   - termination: tests of the early stops
+#   - intervention: control policies acting on the states and isolating nodes
+#   - io: checkpoints
+telemetry_phases = ['query', 'neighbor_counts', 'sample', 'update', 'measure', 'termination', 'intervention', 'io']
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == 'darwin' else peak / (1 << 10)
+
+class PhaseTimer:
+    def __init__(self, phases: dict, name):
+        self.phases = phases
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exception):
+        self.phases[self.name] += time.perf_counter() - self.start
+
+class NullTimer:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exception):
+        pass
+
+class Telemetry:
+    """
+    Instrumentation of a run: wall time spent in each phase of the engine, number of nodes in each state,
+    nodes sampled and changed, and the memory high-water mark. One record is emitted every `every` steps and
+    covers the steps since the previous record.
+
+    Parameters:
+        - path: JSON-lines file the records are appended to. None to skip the file
+        - callback: function called with each record (a dictionary). None to skip it
+        - every: number of time steps between two records
+        - attribute: attribute whose states are counted
+    """
+    enabled = True
+
+    def __init__(self, path = None, callback = None, every = 1, attribute = 'compartment'):
+        if every < 1:
+            raise ValueError(f"Telemetry should be recorded every positive number of steps. Got {every}")
+        self.path = path
+        self.callback = callback
+        self.every = every
+        self.attribute = attribute
+        self.output_file = None if path is None else open(path, 'a')
+        self._reset()
+
+    def _reset(self):
+        self.phases = dict.fromkeys(telemetry_phases, 0.)
+        self.timers = {name: PhaseTimer(self.phases, name) for name in telemetry_phases}
+        self.counters = {}
+        self.steps = 0
+        self.start = time.perf_counter()
+
+    def phase(self, name):
+        """
+        Context manager adding the time spent in its block to the phase name.
+        """
+        return self.timers[name]
+
+    def add(self, name, value):
+        """
+        Add value to the counter name, e.g. the number of nodes sampled in the step.
+        """
+        self.counters[name] = self.counters.get(name, 0) + int(value)
+
+    def end_step(self, time, c: Compartment, X: dict):
+        """
+        Called after each time step with the time and the state reached. Emits a record every `every` steps.
+        """
+        self.steps += 1
+        if self.steps >= self.every:
+            self.flush(time, c, X)
+
+    def flush(self, time, c: Compartment, X: dict):
+        """
+        Emit the record of the steps and phases timed since the previous record, if any.
+        Called by the engines at the end of the run.
+        """
+        if self.steps == 0 and not any(self.phases.values()): return
+        states = X[self.attribute]
+        counts = np.bincount(states.ravel(), minlength = len(c.attributes[self.attribute]))
+        record = {'time': time, 'steps': self.steps, 'wall_seconds': time_since(self.start),
+                  'phases': self.phases, 'counts': dict(zip(c.state_names(self.attribute), counts.tolist()))}
+        record.update(self.counters)
+        record['peak_rss_mb'] = get_peak_rss_mb()
+        self.emit(record)
+        self._reset()
+
+    def emit(self, record: dict):
+        if self.output_file is not None:
+            self.output_file.write(json.dumps(record) + '\n')
+            self.output_file.flush()
+        if self.callback is not None:
+            self.callback(record)
+
+    def close(self):
+        if self.output_file is not None:
+            self.output_file.close()
+            self.output_file = None
+
+class NullTelemetry:
+    """
+    Telemetry of the runs without instrumentation: every call is a no-op.
+    """
+    enabled = False
+    timer = NullTimer()
+
+    def phase(self, name):
+        return self.timer
+
+    def add(self, name, value):
+        pass
+
+    def end_step(self, time, c, X):
+        pass
+
+    def flush(self, time, c, X):
+        pass
+
+    def close(self):
+        pass
+
+no_telemetry = NullTelemetry()
+
+def time_since(start):
+    return time.perf_counter() - start
+
+def get_telemetry(telemetry):
+    return no_telemetry if telemetry is None else telemetry
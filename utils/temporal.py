@@ -0,0 +1,146 @@
+import numpy as np
+import os
+import json
+import shutil
+from scipy.sparse import csr_matrix
+from .graph_cache import get_cached_file_hash, get_default_cache_dir, cache_version
+
+# Extension of the directories written by TemporalWriter, given directly as graph files
+temporal_store_extension = '.temporal'
+
+class TemporalAdjacency:
+    """
+    Sequence of adjacency snapshots, one per time window of a contact trace. The snapshots share three
+    flat arrays on disk, memory-mapped: the row pointers of every window, the column indices and the weights.
+    Only the snapshot of the current window is built, as views on these arrays.
+
+    Time step t of the simulation uses window (t // steps_per_window) % number of windows: the trace repeats
+    once it is over.
+
+    Parameters:
+        - directory: store written by TemporalWriter
+        - steps_per_window: number of time steps of the simulation spent in each window
+    """
+    def __init__(self, directory, steps_per_window = 1):
+        if steps_per_window < 1:
+            raise ValueError(f"Each window should last a positive number of time steps. Got {steps_per_window}")
+        with open(os.path.join(directory, 'temporal.json'), 'r') as meta_file:
+            self.meta = json.load(meta_file)
+        self.directory = directory
+        self.steps_per_window = steps_per_window
+        self.shape = tuple(self.meta['shape'])
+        self.n_windows = self.meta['n_windows']
+        self.nnz = self.meta['nnz']
+        V = self.shape[0]
+        self.indptr = np.memmap(os.path.join(directory, 'indptr.bin'), dtype = np.int64, mode = 'r', shape = (self.n_windows, V + 1))
+        self.indices = np.memmap(os.path.join(directory, 'indices.bin'), dtype = self.meta['index_dtype'], mode = 'r', shape = (self.nnz,)) \
+            if self.nnz > 0 else np.empty(0, dtype = self.meta['index_dtype'])
+        self.data = np.memmap(os.path.join(directory, 'data.bin'), dtype = self.meta['data_dtype'], mode = 'r', shape = (self.nnz,)) \
+            if self.nnz > 0 else np.empty(0, dtype = self.meta['data_dtype'])
+        self.dtype = self.data.dtype
+        self.current_window = None
+        self.current_snapshot = None
+
+    def get_window(self, time):
+        return (time // self.steps_per_window) % self.n_windows
+
+    def snapshot(self, window):
+        """
+        Adjacency matrix of the window.
+        """
+        if window != self.current_window:
+            indptr = np.asarray(self.indptr[window])
+            start, end = indptr[0], indptr[-1]
+            self.current_snapshot = csr_matrix((self.data[start:end], self.indices[start:end], indptr - start), shape = self.shape, copy = False)
+            self.current_window = window
+        return self.current_snapshot
+
+    def at(self, time):
+        """
+        Adjacency matrix used by the time step from time to time + 1.
+        """
+        return self.snapshot(self.get_window(time))
+
+    def sum(self):
+        """
+        Total weight of a window, averaged over the windows.
+        """
+        return float(np.sum(self.data, dtype = np.float64)) / self.n_windows
+
+    def get_graph_meta(self):
+        return {key: value for key, value in self.meta.items() if key not in ('shape', 'nnz', 'n_windows', 'index_dtype', 'data_dtype')}
+
+class TemporalWriter:
+    """
+    Write the snapshots of a temporal graph window by window, appending them to the flat arrays of the store.
+    The store is written under a temporary name and renamed by close, as the entries of the graph cache.
+    """
+    def __init__(self, directory, V, weighted):
+        self.directory = directory
+        self.tmp_directory = f'{directory}.tmp{os.getpid()}'
+        os.makedirs(self.tmp_directory, exist_ok = True)
+        self.V = V
+        self.index_dtype = np.int32 if V < np.iinfo(np.int32).max else np.int64
+        self.data_dtype = np.float64 if weighted else np.int32
+        self.files = {name: open(os.path.join(self.tmp_directory, f'{name}.bin'), 'wb') for name in ('indptr', 'indices', 'data')}
+        self.nnz = 0
+        self.n_windows = 0
+
+    def append(self, A: csr_matrix):
+        """
+        Append the snapshot of the next window.
+        """
+        (A.indptr.astype(np.int64) + self.nnz).tofile(self.files['indptr'])
+        A.indices.astype(self.index_dtype).tofile(self.files['indices'])
+        A.data.astype(self.data_dtype).tofile(self.files['data'])
+        self.nnz += A.nnz
+        self.n_windows += 1
+
+    def close(self, meta: dict):
+        for output_file in self.files.values():
+            output_file.close()
+        meta = dict(meta, shape = [self.V, self.V], nnz = int(self.nnz), n_windows = self.n_windows,
+                    index_dtype = np.dtype(self.index_dtype).name, data_dtype = np.dtype(self.data_dtype).name)
+        with open(os.path.join(self.tmp_directory, 'temporal.json'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        try:
+            os.rename(self.tmp_directory, self.directory)
+        except OSError:
+            # Another process stored the same snapshots in the meantime
+            shutil.rmtree(self.tmp_directory)
+        return self.directory
+
+def save_temporal_adjacency(snapshots: list, directory, meta: dict):
+    """
+    Store a list of adjacency matrices of the same shape, one per window.
+    """
+    writer = TemporalWriter(directory, snapshots[0].shape[0], any(A.dtype.kind == 'f' for A in snapshots))
+    for A in snapshots:
+        writer.append(A)
+    return writer.close(meta)
+
+def read_temporal_adjacency(graph_path, window, build_snapshots, cache_dir = None, variant = '', steps_per_window = 1, verbosity = True):
+    """
+    Temporal adjacency of the contact trace in graph_path, from the graph cache. When the store does not exist
+    it is written by build_snapshots(graph_path, directory, window).
+
+    Returns:
+        A: TemporalAdjacency
+        meta: Dictionary with the graph metadata
+    """
+    if cache_dir is None:
+        cache_dir = get_default_cache_dir(graph_path)
+    file_hash = get_cached_file_hash(graph_path, cache_dir)
+    directory = os.path.join(cache_dir, f'{os.path.basename(graph_path)}_{file_hash[:16]}_{variant}_w{window:g}_v{cache_version}{temporal_store_extension}')
+    if not os.path.exists(os.path.join(directory, 'temporal.json')):
+        if verbosity: print(f"Contacts {graph_path} not cached. Storing their snapshots in {directory}")
+        os.makedirs(cache_dir, exist_ok = True)
+        build_snapshots(graph_path, directory, window)
+    A = TemporalAdjacency(directory, steps_per_window)
+    return A, A.get_graph_meta()
+
+def get_adjacency_at(A, time):
+    """
+    Adjacency matrix used by the time step from time to time + 1: the snapshot of a TemporalAdjacency, or A itself.
+    """
+    return A.at(time) if isinstance(A, TemporalAdjacency) else A
@@ -0,0 +1,81 @@
+import numpy as np
+from .Compartments import Compartment
+
+available_horizons = ['pad', 'truncate']
+
+def is_absorbing(c: Compartment, X: dict):
+    """
+    True when no rule can fire: for every rule, either its initial state or its triggering state is empty,
+    or its probability is null. The state arrays in X can be either of shape (V,) or (V, R): a batch is
+    absorbing when every realization is.
+    """
+    plan = c.get_plan()
+    populated = {}
+    def is_populated(attribute, code):
+        if (attribute, code) not in populated:
+            populated[(attribute, code)] = (X[attribute] == code).any(axis = 0)
+        return populated[(attribute, code)]
+    for group in plan.groups.values():
+        for hazard, trigger in zip(group.hazards, group.triggers):
+            if hazard == 0: continue
+            can_fire = is_populated(group.attribute, group.initial_code)
+            if trigger is not None:
+                can_fire = can_fire & is_populated(*trigger)
+            if np.any(can_fire): return False
+    return True
+
+class Termination:
+    """
+    When to stop a run before time_steps.
+        - absorbing: stop as soon as no rule can fire. The state does not change anymore
+        - steady_state_tolerance: stop once the fraction of nodes in every state of attribute moved by at most
+          the tolerance over the last steady_state_window measurements. Disabled if None
+    After the stop, the 'pad' horizon measures the final state at every remaining time, so that the output
+    covers 0, ..., time_steps as a full run; the 'truncate' horizon ends the output at the stop time.
+    Either way the stop time and its reason are recorded in the measurements.
+    """
+    def __init__(self, absorbing = True, steady_state_tolerance = None, steady_state_window = 20, horizon = 'pad', attribute = 'compartment'):
+        if horizon not in available_horizons:
+            raise ValueError(f"Horizon {horizon} not implemented yet. Choose between {', '.join(available_horizons)}")
+        self.absorbing = absorbing
+        self.steady_state_tolerance = steady_state_tolerance
+        self.steady_state_window = steady_state_window
+        self.horizon = horizon
+        self.attribute = attribute
+        self.history = []
+
+    def should_stop(self, time, c: Compartment, X: dict, absorbing: bool):
+        """
+        Called after the measurement of time with the engine's own test of an absorbing state.
+
+        Returns:
+            reason of the stop, or None to continue
+        """
+        if self.absorbing and absorbing:
+            return 'absorbing'
+        if self.steady_state_tolerance is not None:
+            states = X[self.attribute]
+            self.history.append(np.bincount(states, minlength = len(c.attributes[self.attribute])) / states.shape[0])
+            self.history = self.history[-self.steady_state_window:]
+            if len(self.history) == self.steady_state_window:
+                spread = np.max(self.history, axis = 0) - np.min(self.history, axis = 0)
+                if spread.max() <= self.steady_state_tolerance:
+                    return 'steady_state'
+        return None
+
+    def finish(self, measure, c: Compartment, X: dict, time, time_steps, reason):
+        """
+        Record the stop at time in measure and pad the measurements up to time_steps if required.
+        """
+        measure.set_stop(time, reason)
+        if self.horizon == 'pad':
+            for padded_time in range(time + 1, time_steps + 1):
+                measure.append_experiment(X, c, 'compartment', padded_time)
+
+def get_termination(options: dict):
+    """
+    Termination built from the settings of the [experiment] section, None if early stops are disabled.
+    """
+    if not options['stop_when_absorbed'] and options['steady_state_tolerance'] is None:
+        return None
+    return Termination(options['stop_when_absorbed'], options['steady_state_tolerance'], options['steady_state_window'], options['horizon'])
@@ -0,0 +1,97 @@
+import numpy as np
+from .lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+class TransitionLog:
+    """
+    Delta-encoded measurements: the initial state of every node plus one event
+    (time, node_index, from, to, rule) per state change.
+    The state of every node and the aggregate curves can be rebuilt at any time.
+    """
+    def __init__(self):
+        self.initial_state = None
+        self.state_names = None
+        self.rule_names = None
+        self.attribute_name = None
+        self.times = []
+        self._chunks = []
+        # Time and reason of an early stop of the run, if any
+        self.stop_time = None
+        self.stop_reason = None
+
+    def set_initial(self, states: np.ndarray, state_names: list, rule_names: list, attribute_name):
+        self.initial_state = states.astype(np.int8)
+        self.state_names = list(state_names)
+        self.rule_names = list(rule_names)
+        self.attribute_name = attribute_name
+
+    def append(self, t, nodes: np.ndarray, from_codes: np.ndarray, to_codes: np.ndarray, rule_indices: np.ndarray):
+        if len(nodes) == 0: return
+        self._chunks.append((np.broadcast_to(np.asarray(t, dtype = np.float64), nodes.shape),
+                             nodes.astype(np.int64), from_codes.astype(np.int8), to_codes.astype(np.int8), rule_indices.astype(np.int16)))
+
+    def _events(self):
+        if len(self._chunks) > 1:
+            # Merge the chunks once, so that later calls are cheap
+            self._chunks = [tuple(np.concatenate(column) for column in zip(*self._chunks))]
+        if len(self._chunks) == 0:
+            return np.empty(0), np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int8), np.empty(0, dtype = np.int8), np.empty(0, dtype = np.int16)
+        return self._chunks[0]
+
+    def events_df(self):
+        time, nodes, from_codes, to_codes, rule_indices = self._events()
+        state_names = np.asarray(self.state_names, dtype = object)
+        return pd.DataFrame({'time': time, 'node_index': nodes,
+                             'from': state_names[from_codes], 'to': state_names[to_codes],
+                             'rule_name': np.asarray(self.rule_names, dtype = object)[rule_indices]})
+
+    def state_at(self, t):
+        """
+        State code of every node at time t, i.e. after all the events with time <= t.
+        """
+        time, nodes, _, to_codes, _ = self._events()
+        states = self.initial_state.copy()
+        selected = time <= t
+        nodes, to_codes = nodes[selected], to_codes[selected]
+        # Events are in chronological order: keep the last event of each node
+        last_nodes, last_position = np.unique(nodes[::-1], return_index = True)
+        states[last_nodes] = to_codes[::-1][last_position]
+        return states
+
+    def aggregate(self):
+        """
+        Aggregate curves at the measurement times, in the format of the 'aggregate' measurement mode.
+        """
+        time, _, from_codes, to_codes, _ = self._events()
+        n_states = len(self.state_names)
+        measurement_times = np.asarray(self.times, dtype = np.float64)
+        # Each event is seen from the first measurement at or after it
+        k = np.searchsorted(measurement_times, time, side = 'left')
+        delta = np.zeros((len(measurement_times) + 1, n_states), dtype = np.int64)
+        np.add.at(delta, (k, from_codes), -1)
+        np.add.at(delta, (k, to_codes), 1)
+        counts = np.bincount(self.initial_state, minlength = n_states) + np.cumsum(delta[:-1], axis = 0)
+        rows = [(name, count, t) for t, counts_t in zip(self.times, counts) for name, count in zip(self.state_names, counts_t) if count > 0]
+        return pd.DataFrame(rows, columns = [self.attribute_name, 'value', 'time'])
+
+    def save(self, output_path):
+        time, nodes, from_codes, to_codes, rule_indices = self._events()
+        with open(output_path, 'wb') as output_file:
+            np.savez(output_file, initial_state = self.initial_state, time = time, node_index = nodes,
+                     from_code = from_codes, to_code = to_codes, rule = rule_indices,
+                     measurement_times = np.asarray(self.times), state_names = np.asarray(self.state_names),
+                     rule_names = np.asarray(self.rule_names), attribute_name = np.asarray(self.attribute_name),
+                     stop_time = np.asarray(np.nan if self.stop_time is None else self.stop_time, dtype = np.float64),
+                     stop_reason = np.asarray('' if self.stop_reason is None else self.stop_reason))
+        return output_path
+
+def read_transition_log(path):
+    data = np.load(path)
+    log = TransitionLog()
+    log.set_initial(data['initial_state'], data['state_names'].tolist(), data['rule_names'].tolist(), str(data['attribute_name']))
+    log.times = data['measurement_times'].tolist()
+    log.append(data['time'], data['node_index'], data['from_code'], data['to_code'], data['rule'])
+    if 'stop_time' in data.files and not np.isnan(data['stop_time']):
+        log.stop_time, log.stop_reason = int(data['stop_time']), str(data['stop_reason'])
+    return log
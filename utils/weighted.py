@@ -0,0 +1,62 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+def is_weighted(A):
+    """
+    Weighted adjacency matrices store float weights, unweighted ones integer numbers of edges.
+    """
+    return A.dtype.kind == 'f'
+
+class EdgeHazards:
+    """
+    Matrices of the hazards -log(1 - p w) of the edges of A, one per hazard -log(1 - p) of a 'neighbor' rule, sharing
+    the indices and row pointers of A. Each is computed when its hazard is first used and kept by the owner of the
+    EdgeHazards, e.g. for all the steps on the same matrix. update recomputes the entries whose weights changed in place.
+    p w is capped just below 1, i.e. the contact transmits almost surely.
+
+    Parameters:
+        - A: weighted sparse adjacency matrix
+    """
+    def __init__(self, A: csr_matrix):
+        self.A = A
+        self.matrices = {}
+
+    def get_hazards(self, weights: np.ndarray, hazard):
+        p = -np.expm1(-hazard)
+        return -np.log1p(-np.minimum(p * weights, 1 - np.finfo(np.float64).eps))
+
+    def get(self, hazard):
+        if hazard not in self.matrices:
+            self.matrices[hazard] = csr_matrix((self.get_hazards(self.A.data, hazard), self.A.indices, self.A.indptr), shape = self.A.shape, copy = False)
+        return self.matrices[hazard]
+
+    def update(self, positions: np.ndarray):
+        """
+        Recompute the entries at positions of the data array of A, after their weights changed.
+        """
+        for hazard, matrix in self.matrices.items():
+            matrix.data[positions] = self.get_hazards(self.A.data[positions], hazard)
+
+def get_weighted_neighbor_hazards(edge_hazards: EdgeHazards, mask: np.ndarray, hazard):
+    """
+    Hazard of a 'neighbor' rule with hazard -log(1 - p) on a weighted graph: the sum of -log(1 - p w) over the
+    edges from the nodes in mask, so that the rule fires with probability 1 - prod(1 - p w).
+    Edges repeated between the same pair of nodes are merged when the matrix is built, summing their weights:
+    such a pair transmits with probability p (w1 + w2), not 1 - (1 - p w1)(1 - p w2).
+    """
+    return edge_hazards.get(hazard).dot(mask)
+
+def get_edge_hazards(edge_hazards, A):
+    """
+    EdgeHazards of A: edge_hazards if it was built on A, a new one otherwise. None if A is not weighted.
+    """
+    if not isinstance(A, csr_matrix) or not is_weighted(A):
+        return None
+    return edge_hazards if edge_hazards is not None and edge_hazards.A is A else EdgeHazards(A)
+
+def check_static_unweighted(A, engine):
+    """
+    Raise an error if A is not a static unweighted sparse matrix, the only graphs supported by engine.
+    """
+    if not isinstance(A, csr_matrix) or is_weighted(A):
+        raise ValueError(f"The {engine} engine runs on static unweighted graphs held in memory. Use the discrete engine")